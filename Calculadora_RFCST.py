@@ -4,6 +4,23 @@ from datetime import datetime
 import numpy as np
 from pathlib import Path
 import base64 # Importa a biblioteca para codificar imagens
+import io
+from motor_reforecast import MESES
+from importacao_rfcst import corrige_decimais_df, ler_entrada_planta
+from exportacao_rfcst import exportar_excel, resultado_para_tabela
+from store_rfcst import STORE_PLANTAS
+from memoria_rfcst import REGISTRO_MEMORIA, PlantasSessao
+from nucleo_rfcst import (
+    PLANTAS_CONFIG, calcular_planta, calcular_varredura_planta, fator_gas_planta, sensibilidade_planta, simular_planta,
+    tabela_alavancas, tabelas_cenario,
+)
+from estado_rfcst import dados_formatos_planta, gravar_formato, novo_estado_planta, quadros_formato
+from instrumentacao_rfcst import Cronometro, tempos_ativos_por_padrao
+from cache_rfcst import CACHE_FORMATOS, CACHE_RESULTADOS, chave_calculo_planta, hash_entradas
+from historico_rfcst import HISTORICO, ciclo_padrao, registro_ciclo
+from fechamento_rfcst import fechar_mes
+from validacao_rfcst import tabela_erros, validar_planta
+from mix_rfcst import otimizar_mix_planta
 
 # --- NOVA FUNÇÃO HELPER ---
 # Esta função lê um arquivo de imagem e o converte para texto (base64)
@@ -17,161 +34,292 @@ def get_image_as_base64(path: Path):
         st.error(f"Erro: Imagem não encontrada no caminho: {path}")
         return ""
 
-# --- Listas de KPIs para a ENTRADA de dados ---
-KPIS_CANS_INPUT = [
-    'Gas (m³/000) / (kg/000)', 'Ink Usage (kg/000)', 'Inside Spray Usage(kg/000)', 'Metal Can (kg/000)','Scrap (kg/000)', 'Spoilage(%)',
-    'Variable Light (kwh/000)- Fora Ponta',
-    'Variable Light (kwh/000)- Ponta',
-    'Varnish Usage (kg/000)',
-    'Water & Sewer (m³/000)'
-]
-
-KPIS_ENDS_INPUT = [
-    'Metal End (kg/000)','Spoilage (%)','Tab Scrap (kg/000)','Compound Usage (kg/000)',
-    'Variable Light (kwh/000)- Fora Ponta',
-    'Variable Light (kwh/000)- Ponta',
-    'Water & Sewer (m³/000)',
-    'Metal Tab (kg/000)','End Scrap (kg/000)'
-]
-
-# -------------------------------
-# CONFIGURAÇÃO DE GÁS
-# -------------------------------
-GAS_FACTORS = {
-    'GLP': 12.78,
-    'GN': 10.76
-}
-PLANTAS_GAS_TIPO = {
-    'BRAC': 'GLP',
-    'BRFR': 'GLP',
-    'PYAS': 'GLP',
-}
-GAS_KPI_NAME = 'Gas (m³/000) / (kg/000)'
-GAS_KPI_NAME_OUTPUT = 'Thermal (kwh/000)' # <<< ALTERADO: Novo nome para exibição no resultado
-# -------------------------------
-
-
-# --- Listas de KPIs para a ORDEM da exibição final ---
-KPIS_CANS = [
-    GAS_KPI_NAME_OUTPUT, # <<< ALTERADO: Usa o novo nome de output
-    'Ink Usage (kg/000)', 'Inside Spray Usage(kg/000)', 'Metal Can (kg/000)','Scrap (kg/000)', 'Spoilage(%)',
-    'Variable Light (kwh/000)', 'Varnish Usage (kg/000)',
-    'Water & Sewer (m³/000)'
-]
-
-KPIS_ENDS = [
-    'Metal End (kg/000)','Spoilage (%)','Tab Scrap (kg/000)','Compound Usage (kg/000)',
-    'Variable Light (kwh/000)',
-    'Water & Sewer (m³/000)',
-    'Metal Tab (kg/000)','End Scrap (kg/000)'
-]
-
-PLANTAS_CONFIG = {}
-# Plantas de latas
-for planta in ['ARBA', 'BRBR', 'BR3R', 'BRJC', 'BRPA', 'BRET', 'BRPE', 'BRFR', 'BRAC', 'PYAS', 'CLSA']:
-    PLANTAS_CONFIG[planta] = {'tipo': 'Cans', 'kpis': KPIS_CANS_INPUT}
-# Plantas de tampas
-for planta in ['BRAM', 'PYAST', 'BRPET', 'BR3RT']:
-    PLANTAS_CONFIG[planta] = {'tipo': 'Ends', 'kpis': KPIS_ENDS_INPUT}
-
-# MESES abreviados
-MESES = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
-         'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
-
-
-def agregar_energia(df: pd.DataFrame, final_kpi_order: list) -> pd.DataFrame:
-    df = df.copy()
-    kpi_ponta = 'Variable Light (kwh/000)- Ponta'
-    kpi_fora_ponta = 'Variable Light (kwh/000)- Fora Ponta'
-    kpi_unificado = 'Variable Light (kwh/000)'
-
-    # Cria uma cópia da ordem final para poder remover itens
-    order_copy = final_kpi_order[:]
-    if kpi_unificado in order_copy:
-        order_copy.remove(kpi_unificado)
-
-    # Adiciona os KPIs de energia (se existirem) para reindexação temporária
-    temp_order = order_copy + [kpi for kpi in [kpi_ponta, kpi_fora_ponta, kpi_unificado] if kpi in df.index or kpi in df.columns]
-
-
-    if kpi_ponta in df.index and kpi_fora_ponta in df.index:
-        soma_energia = df.loc[kpi_ponta] + df.loc[kpi_fora_ponta]
-        df.loc[kpi_unificado] = soma_energia
-        df = df.drop(index=[kpi_ponta, kpi_fora_ponta])
-
-    elif kpi_ponta in df.columns and kpi_fora_ponta in df.columns:
-        soma_energia = df[kpi_ponta] + df[kpi_fora_ponta]
-        df[kpi_unificado] = soma_energia
-        df = df.drop(columns=[kpi_ponta, kpi_fora_ponta])
-
-
-    # Reordena usando a ordem final original
-    if set(df.index).issuperset(set(final_kpi_order)):
-         # Garante que apenas as colunas/índices que realmente existem no df sejam usados para reindexar
-        valid_order = [item for item in final_kpi_order if item in df.index]
-        return df.reindex(index=valid_order).dropna(how='all')
-    elif set(df.columns).issuperset(set(final_kpi_order)):
-        valid_order = [item for item in final_kpi_order if item in df.columns]
-        return df.reindex(columns=valid_order).dropna(how='all')
-
-
-    return df
-
-
-def validar_dados(vol_df, aop_df):
-    erros = []
-    if (vol_df < 0).any().any():
-        erros.append("Volume de produção não pode ser negativo")
-    if pd.isna(aop_df['FY']).any():
-        erros.append("Há FY não informado (NaN). Preencha com 0 quando não houver meta.")
-    return erros
+def validar_entradas(planta: str, plant_state: dict, mes_reforecast: str) -> list:
+    """
+    Valida de uma vez as entradas de todos os formatos como foram digitadas (com vazios e textos
+    inválidos, guardados por entrada_formato); formatos sem aba renderizada usam os blocos salvos.
+    """
+    digitadas = sessao_plantas().anexos.get(planta, {}).get('entrada', {})
+    nomes_formatos = plant_state['nomes_formatos']
+    dados_formatos, celulas_invalidas = {}, []
+    for i, nome in enumerate(nomes_formatos):
+        digitada = digitadas.get(i)
+        dados_formatos[nome] = digitada['dados'] if digitada else quadros_formato(plant_state, i)
+        celulas_invalidas += [(nome,) + celula for celula in (digitada['invalidas'] if digitada else [])]
+    return validar_planta(planta, nomes_formatos, dados_formatos, mes_reforecast, celulas_invalidas)
+
+def sessao_plantas() -> PlantasSessao:
+    """plant_store desta sessão, registrado no REGISTRO_MEMORIA (limites de plantas e de bytes)."""
+    store = st.session_state.get('plant_store')
+    if not isinstance(store, PlantasSessao):
+        store = REGISTRO_MEMORIA.nova_sessao(store)
+        st.session_state['plant_store'] = store
+    return store
 
 def get_plant_store(planta: str):
-    store = st.session_state.setdefault('plant_store', {})
-    if planta not in store:
-        store[planta] = {
-            'num_formatos': 2,
-            'nomes_formatos': [f'Formato_{i+1}' for i in range(2)],
-            'dados': {}
-        }
-    return store[planta]
+    sessao = sessao_plantas()
+    plant_state = REGISTRO_MEMORIA.obter(sessao, planta)
+    if plant_state is not None:
+        return plant_state
+    # Carrega do disco só a planta selecionada (também a que foi descartada por limite de memória)
+    if STORE_PLANTAS is not None:
+        plant_state = STORE_PLANTAS.carregar(planta, PLANTAS_CONFIG[planta]['kpis'])
+    if plant_state is None:
+        plant_state = novo_estado_planta(PLANTAS_CONFIG[planta]['kpis'])
+    REGISTRO_MEMORIA.guardar(sessao, planta, plant_state)
+    return plant_state
 
 def set_plant_store(planta: str, plant_state: dict):
-    st.session_state.setdefault('plant_store', {})
-    st.session_state['plant_store'][planta] = plant_state
-
-def _to_float_br(x):
-    if isinstance(x, str):
-        s = x.strip().replace(" ", "")
-        if ',' in s:
-            s = s.replace('.', '').replace(',', '.')
-        try:
-            return float(s)
-        except Exception:
-            return x
-    return x
-
-def corrige_decimais_df(df: pd.DataFrame) -> pd.DataFrame:
-    return df.applymap(_to_float_br)
-
-def renomear_gas_para_output(df: pd.DataFrame) -> pd.DataFrame:
-    """Renomeia o KPI de Gás do nome de cálculo para o nome de exibição."""
-    df = df.copy()
-    rename_map = {GAS_KPI_NAME: GAS_KPI_NAME_OUTPUT}
-    if GAS_KPI_NAME in df.index:
-        df = df.rename(index=rename_map)
-    if GAS_KPI_NAME in df.columns:
-        df = df.rename(columns=rename_map)
-    return df
+    if STORE_PLANTAS is not None:
+        STORE_PLANTAS.salvar(planta, plant_state)
+    REGISTRO_MEMORIA.guardar(sessao_plantas(), planta, plant_state)
+
+def anexo_planta(planta: str, nome: str):
+    """Resultado derivado guardado junto da planta (varredura, simulação...), ou None."""
+    return sessao_plantas().anexos.get(planta, {}).get(nome)
+
+def anexar_planta(planta: str, nome: str, valor):
+    REGISTRO_MEMORIA.anexar(sessao_plantas(), planta, nome, valor)
+
+def aplicar_importacao(planta: str, nomes_formatos: list, dados_formatos: dict, max_formatos: int = 10):
+    """Substitui os formatos da planta pelos dados importados e descarta o estado dos widgets antigos."""
+    if len(nomes_formatos) > max_formatos:
+        raise ValueError(f"O arquivo tem {len(nomes_formatos)} formatos; o máximo é {max_formatos}.")
+    plant_state = get_plant_store(planta)
+    # Blocos novos: formatos além dos importados não devem reaparecer com dados antigos
+    importado = novo_estado_planta(PLANTAS_CONFIG[planta]['kpis'], len(nomes_formatos))
+    importado['nomes_formatos'] = list(nomes_formatos)
+    for i, nome in enumerate(nomes_formatos):
+        gravar_formato(importado, i, dados_formatos[nome])
+    plant_state.update(importado)
+    set_plant_store(planta, plant_state)
+    # Sem isso, os editores e campos de texto manteriam os valores digitados antes da importação
+    chaves = [f"{planta}_num_formatos"] + [
+        f"{planta}_{sufixo}_{i}" for i in range(max_formatos)
+        for sufixo in ('formato_nome', 'volume', 'aop', 'aop_show')
+    ]
+    for chave in chaves:
+        st.session_state.pop(chave, None)
+
+def corrige_decimais_editor(df: pd.DataFrame, planta: str, chave_editor: str):
+    """corrige_decimais_df com memória por editor: se o conteúdo não mudou desde o último rerun, reaproveita a conversão."""
+    memo = sessao_plantas().anexos.setdefault(planta, {}).setdefault('decimais', {})
+    assinatura = hash_entradas(df)
+    anterior = memo.get(chave_editor)
+    if anterior is not None and anterior[0] == assinatura:
+        return anterior[1], anterior[2]
+    df_float, celulas_invalidas = corrige_decimais_df(df)
+    memo[chave_editor] = (assinatura, df_float, celulas_invalidas)
+    return df_float, celulas_invalidas
+
+def avisar_celulas_invalidas(tabela: str, celulas_invalidas: list, max_exibidas: int = 10,
+                             efeito: str = "impedem o cálculo do Reforecast até serem corrigidas"):
+    """Lista as células não numéricas da tabela; efeito diz o que acontece com elas (bloqueiam o cálculo, viram 0...)."""
+    if not celulas_invalidas:
+        return
+    lista = ", ".join(f"{col} / {linha}: '{valor}'" for linha, col, valor in celulas_invalidas[:max_exibidas])
+    if len(celulas_invalidas) > max_exibidas:
+        lista += ", ..."
+    st.warning(f"⚠️ {len(celulas_invalidas)} célula(s) não numérica(s) em **{tabela}** {efeito}: {lista}")
+
+def exibir_tabela(df: pd.DataFrame, formato: str = "%.3f"):
+    """
+    Exibe a tabela numérica com o formato aplicado por coluna no próprio front-end,
+    sem o Styler (que gera texto/HTML para cada célula).
+    """
+    st.dataframe(df, column_config={col: st.column_config.NumberColumn(format=formato) for col in df.columns})
 
-def main():
-    st.set_page_config(
-        page_title="Calculadora de Reforecast",
-        page_icon="📈",
-        layout="wide",
-        initial_sidebar_state="expanded"
+def chips_meses(ytd_cols, fut_cols, titulo="Meses (YTD | Futuro)"):
+    chips = "".join([f"<span class='chip chip-ytd'>{m}</span>" for m in ytd_cols] +
+                    [f"<span class='chip chip-fut'>{m}</span>" for m in fut_cols])
+    st.markdown(f"**{titulo}** \n<div class='chips'>{chips}</div>", unsafe_allow_html=True)
+
+@st.fragment
+def entrada_formato(planta_selecionada: str, i: int, kpis_da_planta: list, colunas_ytd: list, colunas_futuro: list):
+    """
+    Aba de entrada de um formato. Como fragmento, editar uma célula reexecuta só esta aba
+    (e atualiza só a fatia dela no plant_store), sem rodar o script inteiro.
+    """
+    plant_state = get_plant_store(planta_selecionada)
+    formato_atual = plant_state['nomes_formatos'][i]
+    st.subheader(f"{formato_atual}")
+    chips_meses(colunas_ytd, colunas_futuro)
+    st.write("")
+    dados_salvos = quadros_formato(plant_state, i)
+
+    st.markdown("##### 📈 Volume de Produção")
+    df_volume_editado = st.data_editor(dados_salvos['volume'], key=f"{planta_selecionada}_volume_{i}", use_container_width=True, num_rows="fixed")
+    df_volume_editado, invalidas_volume = corrige_decimais_editor(df_volume_editado, planta_selecionada, f"{planta_selecionada}_volume_{i}")
+    avisar_celulas_invalidas("Volume de Produção", invalidas_volume)
+
+    # --- LÓGICA CORRIGIDA ---
+    st.markdown("##### 🎯 Coeficientes YTD + Ciclo Anterior")
+    # 1. O editor de 'aop' mostra só os meses; o FY do aop é sempre o da tabela 'AOP ou Ciclo Anterior'.
+    df_aop_editado = st.data_editor(dados_salvos['aop'][MESES], key=f"{planta_selecionada}_aop_{i}", use_container_width=True, num_rows="fixed", height=420)
+    df_aop_editado, invalidas_aop = corrige_decimais_editor(df_aop_editado, planta_selecionada, f"{planta_selecionada}_aop_{i}")
+    avisar_celulas_invalidas("Coeficientes YTD + Ciclo Anterior", invalidas_aop)
+
+    st.markdown("##### 🧷 AOP ou Ciclo Anterior (Opcional)")
+    # 2. Segundo editor, com a coluna FY.
+    df_aop_show_editado = st.data_editor(dados_salvos['aop_show'], key=f"{planta_selecionada}_aop_show_{i}", use_container_width=True, num_rows="fixed", height=420)
+    df_aop_show_editado, invalidas_aop_show = corrige_decimais_editor(df_aop_show_editado, planta_selecionada, f"{planta_selecionada}_aop_show_{i}")
+    avisar_celulas_invalidas("AOP ou Ciclo Anterior", invalidas_aop_show)
+
+    # 3. Montagem final: aop editado + FY vindo da segunda tabela (editada).
+    df_aop_final_para_salvar = df_aop_editado.copy()
+    df_aop_final_para_salvar['FY'] = df_aop_show_editado['FY']
+
+    # 4. Copia as tabelas editadas para os blocos numéricos do plant_store (vazios viram 0).
+    gravar_formato(plant_state, i, {
+        'volume': df_volume_editado,
+        'aop': df_aop_final_para_salvar,
+        'aop_show': df_aop_show_editado,
+    })
+    set_plant_store(planta_selecionada, plant_state)
+    # 5. Como digitado (vazios e textos inválidos preservados), para validar_entradas antes do cálculo.
+    sessao_plantas().anexos.setdefault(planta_selecionada, {}).setdefault('entrada', {})[i] = {
+        'dados': {'volume': df_volume_editado, 'aop': df_aop_final_para_salvar, 'aop_show': df_aop_show_editado},
+        'invalidas': [
+            (tabela, linha, coluna, valor)
+            for tabela, celulas in (('volume', invalidas_volume), ('aop', invalidas_aop), ('aop_show', invalidas_aop_show))
+            for linha, coluna, valor in celulas
+        ],
+    }
+    # 6. A tabela de erros e o botão Calcular são do script inteiro: se a validação mudou desde a última
+    # execução completa (ex.: a última célula inválida foi corrigida), reexecuta o app para atualizá-los.
+    exibida = sessao_plantas().anexos[planta_selecionada].get('validacao_exibida')
+    if exibida is not None:
+        mes_reforecast, assinatura = exibida
+        if hash_entradas(repr(validar_entradas(planta_selecionada, plant_state, mes_reforecast))) != assinatura:
+            st.rerun(scope="app")
+    # --- FIM DA LÓGICA CORRIGIDA ---
+
+def fechamento_mes(planta: str, plant_state: dict, kpis_da_planta: list, mes_reforecast: str, max_formatos: int = 10):
+    """Grava o realizado do mês seguinte ao corte, avança o mês do Reforecast e mostra a trilha de auditoria."""
+    idx_mes = MESES.index(mes_reforecast)
+    if idx_mes + 1 < len(MESES):
+        mes_fechar = MESES[idx_mes + 1]
+        st.caption(f"Informe o realizado de **{mes_fechar}** (volume e coeficientes de cada formato). Ao fechar, "
+                   f"{mes_fechar} passa a ser YTD e as metas futuras são recalculadas a partir das somas YTD mantidas.")
+        nomes_formatos = plant_state['nomes_formatos']
+        n = len(nomes_formatos)
+        atual = pd.DataFrame(
+            np.vstack([plant_state['volume'][:n, idx_mes + 1], plant_state['aop'][:n, :, idx_mes + 1].T]),
+            index=["Volume Total"] + list(kpis_da_planta), columns=nomes_formatos,
+        )
+        chave_editor = f"{planta}_fechamento_{mes_fechar}"
+        editado = st.data_editor(atual, key=chave_editor, use_container_width=True, num_rows="fixed")
+        editado, invalidas = corrige_decimais_editor(editado, planta, chave_editor)
+        avisar_celulas_invalidas(f"Realizado de {mes_fechar}", invalidas, efeito="impedem o fechamento do mês")
+        # Célula vazia ou inválida não pode virar NaN no realizado nem nas somas YTD
+        incompleto = bool(invalidas) or not np.isfinite(editado.to_numpy(dtype=float)).all()
+        if incompleto:
+            st.error(f"❌ Preencha todas as células do realizado de {mes_fechar} com números para fechar o mês.")
+        if st.button(f"Fechar {mes_fechar}", disabled=incompleto, key=f"{planta}_fechar_mes"):
+            realizados = {
+                formato: {'volume': editado.loc["Volume Total", formato],
+                          'coeficientes': editado.loc[kpis_da_planta, formato].to_dict()}
+                for formato in nomes_formatos
+            }
+            resumo = fechar_mes(plant_state, planta, realizados)
+            set_plant_store(planta, plant_state)
+            if STORE_PLANTAS is not None:
+                STORE_PLANTAS.registrar_fechamento(planta, resumo['mes_fechado'], resumo['gravado_em'], resumo['auditoria'])
+            anexar_planta(planta, 'fechamento', resumo)
+            # Mês e editores voltam a ler o plant_store já avançado
+            for chave in [f"{planta}_mes_reforecast"] + [
+                f"{planta}_{tabela}_{i}" for i in range(max_formatos) for tabela in ('volume', 'aop', 'aop_show')
+            ]:
+                st.session_state.pop(chave, None)
+            st.rerun()
+    else:
+        st.caption("O Reforecast já está em Dez: não há mês seguinte para fechar.")
+
+    resumo = anexo_planta(planta, 'fechamento')
+    if resumo is not None:
+        st.success(f"✅ {resumo['mes_fechado']} fechado em {resumo['gravado_em']}: "
+                   f"{len(resumo['auditoria'])} alteração(ões).")
+    trilha = STORE_PLANTAS.fechamentos(planta) if STORE_PLANTAS is not None else (
+        [{'mes_fechado': resumo['mes_fechado'], 'gravado_em': resumo['gravado_em'], **linha} for linha in resumo['auditoria']]
+        if resumo is not None else []
     )
+    if trilha:
+        st.markdown("**🧾 Trilha de auditoria dos fechamentos**")
+        st.dataframe(pd.DataFrame(trilha), hide_index=True)
 
+@st.fragment
+def mix_formatos(planta: str, mes_reforecast: str):
+    """
+    Divisão do volume futuro entre os formatos que mantém o Geral dentro do FY. Só resolve com
+    "Otimizar mix" ligado (e então a cada edição); lê o plant_store atual, não o da última execução completa.
+    """
+    plant_state = get_plant_store(planta)
+    nomes_formatos = plant_state['nomes_formatos']
+    colunas_futuro = MESES[MESES.index(mes_reforecast) + 1:]
+    if len(nomes_formatos) < 2 or not colunas_futuro:
+        st.caption("São necessários ao menos dois formatos e um mês futuro para otimizar o mix.")
+        return
+    st.caption("Com os coeficientes de 'AOP ou Ciclo Anterior' de cada formato e o volume total de cada mês futuro, "
+               "busca o mix mais próximo do atual que mantém o Geral de cada KPI dentro do FY.")
+    n = len(nomes_formatos)
+    totais = pd.DataFrame([plant_state['volume'][:n, MESES.index(mes_reforecast) + 1:].sum(axis=0)],
+                          index=["Volume Total"], columns=colunas_futuro)
+    totais = st.data_editor(totais, key=f"{planta}_mix_totais", use_container_width=True, num_rows="fixed")
+    totais, invalidas_totais = corrige_decimais_editor(totais, planta, f"{planta}_mix_totais")
+    totais = totais.fillna(0.0)
+    avisar_celulas_invalidas("Volume total do mês", invalidas_totais, efeito="foram consideradas 0")
+    limites = pd.DataFrame({"Mín. (%)": 0.0, "Máx. (%)": 100.0}, index=nomes_formatos)
+    limites = st.data_editor(limites, key=f"{planta}_mix_limites", use_container_width=True, num_rows="fixed")
+    limites, invalidas_limites = corrige_decimais_editor(limites, planta, f"{planta}_mix_limites")
+    limites = limites.fillna(0.0)
+    avisar_celulas_invalidas("Limites de participação", invalidas_limites, efeito="foram consideradas 0")
+    if not st.toggle("Otimizar mix", key=f"{planta}_mix_otimizar"):
+        return
+    try:
+        mix = otimizar_mix_planta(
+            planta, nomes_formatos, dados_formatos_planta(plant_state), mes_reforecast,
+            volume_total=totais.loc["Volume Total"].to_dict(),
+            limites={f: (limites.loc[f, "Mín. (%)"] / 100, limites.loc[f, "Máx. (%)"] / 100) for f in nomes_formatos},
+        )
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    if mix['viavel']:
+        st.success("✅ Com este mix, o Geral de todos os KPIs com meta fica dentro do FY.")
+    else:
+        st.warning("⚠️ Nenhum mix dentro dos limites mantém todos os KPIs no FY; exibindo o de menor excesso.")
+    st.markdown("**📊 Geral do ano: FY x projetado**")
+    st.dataframe(mix['kpis'], column_config={
+        col: st.column_config.NumberColumn(format="%.3f") for col in mix['kpis'].columns if col != "Situação"
+    })
+    st.markdown("**🧮 Mix otimizado (% do volume do mês)**")
+    exibir_tabela(mix['mix'], formato="%.1f")
+    st.markdown("**📈 Volumes otimizados**")
+    exibir_tabela(mix['volumes'], formato="%.0f")
+
+BASE_DIR = Path(__file__).parent
+STATIC_DIR = BASE_DIR / "static"
+
+@st.cache_resource(show_spinner=False)
+def _logo_base64(caminho: str, mtime_ns: int) -> str:
+    # mtime_ns só entra na chave do cache: se o arquivo mudar, a imagem é recodificada
+    return get_image_as_base64(Path(caminho))
+
+def logo_src(nome_arquivo: str) -> str:
+    """
+    Endereço do logo para o <img>: servido como arquivo estático quando o servidor permite
+    (o navegador guarda em cache e os reruns não reenviam a imagem); caso contrário,
+    data URI codificado uma única vez por processo.
+    """
+    caminho = STATIC_DIR / nome_arquivo
+    mtime_ns = caminho.stat().st_mtime_ns if caminho.exists() else 0
+    if mtime_ns and st.get_option("server.enableStaticServing"):
+        return f"app/static/{nome_arquivo}?v={mtime_ns}"
+    return f"data:image/png;base64,{_logo_base64(str(caminho), mtime_ns)}"
+
+@st.cache_resource(show_spinner=False)
+def montar_tema_html(logo_src: str, logo_branco_src: str):
+    """Monta (uma vez por processo) o bloco de CSS do tema e o HTML dos logos claro/escuro."""
     COR_PRIMARIA = "#1140FE"
     COR_SECUNDARIA = "#0029B3"
     COR_FUNDO = "#FFFFFF"
@@ -188,23 +336,16 @@ def main():
     COR_TAB_BORDA = "#D6DAE3"
     COR_TAB_HOVER_BG = "#E8EDFF"
 
-    BASE_DIR = Path(__file__).parent
-    LOGO_URL = BASE_DIR / "logo.png"
-    LOGO_BRANCO_URL = BASE_DIR / "logo_branco.png"
-
-    logo_b64 = get_image_as_base64(LOGO_URL)
-    logo_branco_b64 = get_image_as_base64(LOGO_BRANCO_URL)
-
     logos_html = f"""
         <div class="logo-light">
-            <img src="data:image/png;base64,{logo_b64}" width="150">
+            <img src="{logo_src}" width="150">
         </div>
         <div class="logo-dark">
-            <img src="data:image/png;base64,{logo_branco_b64}" width="150">
+            <img src="{logo_branco_src}" width="150">
         </div>
     """
 
-    st.markdown(f"""
+    css_html = f"""
     <style>
         :root {{
             --cor-primaria: {COR_PRIMARIA};
@@ -266,7 +407,21 @@ def main():
             [data-testid="stAlert"] svg {{ fill: #EAEAEA !important; }}
         }}
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+    return css_html, logos_html
+
+def main():
+    st.set_page_config(
+        page_title="Calculadora de Reforecast",
+        page_icon="📈",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    cronometro = Cronometro(tempos_ativos_por_padrao() or st.query_params.get('debug') == '1')
+
+    css_html, logos_html = montar_tema_html(logo_src("logo.png"), logo_src("logo_branco.png"))
+    st.markdown(css_html, unsafe_allow_html=True)
 
     col_logo, col_title = st.columns([1, 4])
     with col_logo:
@@ -277,6 +432,7 @@ def main():
         st.subheader("Readequação ao AOP")
 
     st.markdown("---")
+    cronometro.marcar('tema')
 
     st.header("1️⃣ Seleção da Planta")
     with st.container(border=True):
@@ -295,15 +451,13 @@ def main():
             tipo_planta = PLANTAS_CONFIG[planta_selecionada]['tipo']
             st.metric("Tipo de Planta", tipo_planta)
         with col3:
-            fator_gas = 1.0
-            tem_kpi_gas = any(GAS_KPI_NAME in kpi for kpi in PLANTAS_CONFIG[planta_selecionada]['kpis'])
-            if tem_kpi_gas:
-                tipo_gas = PLANTAS_GAS_TIPO.get(planta_selecionada, 'GN')
-                fator_gas = GAS_FACTORS[tipo_gas]
+            tipo_gas, fator_gas = fator_gas_planta(planta_selecionada)
+            if tipo_gas is not None:
                 st.metric("Tipo de Gás", tipo_gas, help=f"Fator de conversão: {fator_gas}")
 
     kpis_da_planta = PLANTAS_CONFIG[planta_selecionada]['kpis']
     plant_state = get_plant_store(planta_selecionada)
+    cronometro.marcar('selecao_planta')
 
     st.header("2️⃣ Configurações do Cálculo")
     with st.container(border=True):
@@ -324,14 +478,27 @@ def main():
             st.metric("Meses YTD", len(colunas_ytd))
         with col3:
             st.metric("Meses Futuros", len(colunas_futuro))
-
-    def chips_meses(ytd_cols, fut_cols, titulo="Meses (YTD | Futuro)"):
-        chips = "".join([f"<span class='chip chip-ytd'>{m}</span>" for m in ytd_cols] +
-                        [f"<span class='chip chip-fut'>{m}</span>" for m in fut_cols])
-        st.markdown(f"**{titulo}** \n<div class='chips'>{chips}</div>", unsafe_allow_html=True)
+        with st.expander("📆 Fechamento do mês"):
+            fechamento_mes(planta_selecionada, plant_state, kpis_da_planta, mes_reforecast)
+    cronometro.marcar('configuracao_calculo')
 
     st.header("3️⃣ Configuração de Formatos")
     with st.container(border=True):
+        with st.expander("📥 Importar formatos de arquivo (Excel/CSV)"):
+            st.caption("Um ou mais arquivos .xlsx/.csv com as colunas formato, tabela (volume, aop, aop_show), kpi, Jan..Dez e FY. "
+                       "Os formatos atuais da planta são substituídos.")
+            arquivos_importacao = st.file_uploader(
+                "Arquivos da planta", type=['csv', 'xlsx'], accept_multiple_files=True,
+                key=f"{planta_selecionada}_arquivos_importacao"
+            )
+            if st.button("Importar", disabled=not arquivos_importacao, key=f"{planta_selecionada}_importar"):
+                try:
+                    nomes_importados, dados_importados = ler_entrada_planta(arquivos_importacao, kpis_da_planta)
+                    aplicar_importacao(planta_selecionada, nomes_importados, dados_importados)
+                except (ValueError, ImportError) as e:
+                    st.error("❌ Importação não realizada:\n\n" + str(e).replace("\n", "  \n"))
+                else:
+                    st.rerun()
         num_formatos = st.number_input(
             "Número de formatos", min_value=1, max_value=10,
             value=int(plant_state['num_formatos']),
@@ -348,307 +515,316 @@ def main():
             novos_nomes.append(nome_i)
         plant_state['nomes_formatos'] = novos_nomes
         set_plant_store(planta_selecionada, plant_state)
+    cronometro.marcar('configuracao_formatos')
 
     st.markdown("---")
 
     st.header("4️⃣ Dados de Entrada por Formato")
-    dados_formatos = {}
     tabs_formatos = st.tabs(plant_state['nomes_formatos'])
 
+    # Na execução completa as abas não comparam a validação: ela é refeita logo abaixo
+    sessao_plantas().anexos.setdefault(planta_selecionada, {}).pop('validacao_exibida', None)
     for i, tab in enumerate(tabs_formatos):
         with tab:
-            formato_atual = plant_state['nomes_formatos'][i]
-            st.subheader(f"{formato_atual}")
-            chips_meses(colunas_ytd, colunas_futuro)
-            st.write("")
-            dados_salvos = plant_state['dados'].get(i, {})
-            
-            st.markdown("##### 📈 Volume de Produção")
-            df_volume_default = dados_salvos.get('volume', pd.DataFrame(0.0, index=["Volume Total"], columns=MESES))
-            df_volume_editado = st.data_editor(df_volume_default, key=f"{planta_selecionada}_volume_{i}", use_container_width=True, num_rows="fixed")
-            df_volume_editado = corrige_decimais_df(df_volume_editado).astype(float)
-            
-            # --- LÓGICA CORRIGIDA ---
-            st.markdown("##### 🎯 Coeficientes YTD + Ciclo Anterior")
-            # 1. Carrega os dados 'aop' salvos no estado. Eles PODEM ter a coluna FY de um ciclo anterior.
-            dados_salvos_aop = dados_salvos.get('aop', pd.DataFrame(index=kpis_da_planta, columns=MESES).fillna(0.0))
-            # 2. Cria uma cópia para o editor SEMPRE garantindo que não tenha a coluna FY para a exibição.
-            df_aop_para_editar = dados_salvos_aop.copy()
-            if 'FY' in df_aop_para_editar.columns:
-                df_aop_para_editar = df_aop_para_editar.drop(columns=['FY'])
-            # 3. O editor agora renderiza a tabela GARANTIDAMENTE sem a coluna FY.
-            df_aop_editado = st.data_editor(df_aop_para_editar, key=f"{planta_selecionada}_aop_{i}", use_container_width=True, num_rows="fixed", height=420)
-            df_aop_editado = corrige_decimais_df(df_aop_editado).astype(float)
-
-            st.markdown("##### 🧷 AOP ou Ciclo Anterior (Opcional)")
-            # 4. Garante que os dados para a segunda tabela tenham a coluna FY, buscando dos dados salvos se necessário.
-            df_aop_show_default = dados_salvos.get('aop_show', pd.DataFrame(index=kpis_da_planta, columns=MESES + ['FY']).fillna(0.0))
-            if 'FY' not in df_aop_show_default.columns:
-                fy_values = dados_salvos_aop.get('FY', 0.0)
-                df_aop_show_default['FY'] = fy_values
-            # 5. Renderiza o segundo editor, que tem a coluna FY.
-            df_aop_show_editado = st.data_editor(df_aop_show_default, key=f"{planta_selecionada}_aop_show_{i}", use_container_width=True, num_rows="fixed", height=420)
-            df_aop_show_editado = corrige_decimais_df(df_aop_show_editado).astype(float)
-
-            # 6. Montagem final dos dados para salvar no estado.
-            # Pega os dados da primeira tabela (editada, sem FY)
-            df_aop_final_para_salvar = df_aop_editado.copy()
-            # Adiciona a coluna FY vinda da segunda tabela (editada)
-            df_aop_final_para_salvar['FY'] = df_aop_show_editado['FY']
-
-            # 7. Salva os dataframes corretos e completos no estado da sessão.
-            plant_state['dados'][i] = {
-                'volume': df_volume_editado.fillna(0.0),
-                'aop': df_aop_final_para_salvar.fillna(0.0), # Salva a versão completa com FY
-                'aop_show': df_aop_show_editado.fillna(0.0)  # Salva a segunda tabela como está
-            }
-            set_plant_store(planta_selecionada, plant_state)
-            dados_formatos[formato_atual] = plant_state['dados'][i]
-            # --- FIM DA LÓGICA CORRIGIDA ---
+            entrada_formato(planta_selecionada, i, kpis_da_planta, colunas_ytd, colunas_futuro)
+    cronometro.marcar('abas_entrada')
+    # O cálculo sempre lê o estado mais recente gravado pelas abas
+    dados_formatos = dados_formatos_planta(plant_state)
 
     st.markdown("---")
 
-    def is_spoilage(kpi_name: str) -> bool:
-        return 'spoilage' in kpi_name.lower()
-
-    def calc_kpi_por_formato(formato: str, df_vol: pd.DataFrame, df_aop: pd.DataFrame):
-        vol_mensal = df_vol.loc['Volume Total'].astype(float).reindex(MESES).fillna(0.0)
-        resultados_coef_anual = {}
-        metas_futuras = pd.DataFrame(0.0, index=df_aop.index, columns=MESES)
-        bloqueados = set()
-        for kpi in df_aop.index:
-            serie = df_aop.loc[kpi].astype(float)
-            serie_mes = serie.reindex(MESES).fillna(0.0)
-            fy = float(serie.get('FY', 0.0))
-            if is_spoilage(kpi):
-                realizado_ytd = ((serie_mes[colunas_ytd] / 100.0) * vol_mensal[colunas_ytd]).sum()
-                total_fy = (fy / 100.0) * vol_mensal.sum()
-            else:
-                realizado_ytd = (serie_mes[colunas_ytd] * vol_mensal[colunas_ytd]).sum()
-                total_fy = fy * vol_mensal.sum()
-            EPS = 1e-9
-            if not np.isfinite(realizado_ytd): realizado_ytd = 0.0
-            if not np.isfinite(total_fy): total_fy = 0.0
-            cond_excedeu = (total_fy > 0) and ((realizado_ytd > total_fy) or np.isclose(realizado_ytd, total_fy, rtol=0.0, atol=EPS))
-            if cond_excedeu:
-                bloqueados.add(kpi)
-                resultados_coef_anual[kpi] = 0.0
-                metas_futuras.loc[kpi, :] = 0.0
-                st.warning(f"🔔 O KPI **{kpi}** do formato **{formato}** ultrapassou seu limite de saldo líquido.")
-                continue
-            saldo_restante = max(total_fy - realizado_ytd, 0.0)
-            vol_fut = vol_mensal[colunas_futuro].sum()
-            if vol_fut <= 0.0 or saldo_restante <= 0.0:
-                resultados_coef_anual[kpi] = 0.0
-                metas_futuras.loc[kpi, colunas_futuro] = 0.0
-                continue
-            if is_spoilage(kpi):
-                estimado_mes = (serie_mes[colunas_futuro] / 100.0) * vol_mensal[colunas_futuro]
-            else:
-                estimado_mes = (serie_mes[colunas_futuro]) * vol_mensal[colunas_futuro]
-            total_estimado = float(estimado_mes.sum())
-            if total_estimado <= 0.0:
-                base_prop = vol_mensal[colunas_futuro]
-                total_base = base_prop.sum()
-                if total_base <= 0.0:
-                    metas_coef = pd.Series(0.0, index=colunas_futuro)
-                else:
-                    proporcao = base_prop / total_base
-                    metas_valor = proporcao * saldo_restante
-                    if is_spoilage(kpi):
-                        metas_coef = (metas_valor / vol_mensal[colunas_futuro]).replace([np.inf, -np.inf], 0.0).fillna(0.0) * 100.0
-                    else:
-                        metas_coef = (metas_valor / vol_mensal[colunas_futuro]).replace([np.inf, -np.inf], 0.0).fillna(0.0)
-                metas_futuras.loc[kpi, colunas_futuro] = metas_coef.values
-            else:
-                proporcao = (estimado_mes / total_estimado).fillna(0.0)
-                metas_valor = proporcao * saldo_restante
-                if is_spoilage(kpi):
-                    metas_coef = (metas_valor / vol_mensal[colunas_futuro]).replace([np.inf, -np.inf], 0.0).fillna(0.0) * 100.0
-                else:
-                    metas_coef = (metas_valor / vol_mensal[colunas_futuro]).replace([np.inf, -np.inf], 0.0).fillna(0.0)
-                metas_futuras.loc[kpi, colunas_futuro] = metas_coef.values
-            if is_spoilage(kpi):
-                resultados_coef_anual[kpi] = (saldo_restante / vol_fut) * 100.0 if vol_fut > 0 else 0.0
-            else:
-                resultados_coef_anual[kpi] = saldo_restante / vol_fut if vol_fut > 0 else 0.0
-        return {'bloqueado_por_kpi': bloqueados, 'coef_anual_necessario': pd.Series(resultados_coef_anual), 'metas_futuras': metas_futuras}
-
-    def mult_gas_df(df: pd.DataFrame, fator: float) -> pd.DataFrame:
-        if GAS_KPI_NAME in df.index and fator != 1.0:
-            df = df.copy()
-            df.loc[GAS_KPI_NAME] = df.loc[GAS_KPI_NAME] * fator
-        return df
-
-    def mult_gas_series_as_row(series: pd.Series, fator: float) -> pd.DataFrame:
-        df = pd.DataFrame(series).T
-        if GAS_KPI_NAME in df.columns and fator != 1.0:
-            df = df.copy()
-            df[GAS_KPI_NAME] = df[GAS_KPI_NAME] * fator
-        return df
-
     st.header("5️⃣ Cálculo e Resultados")
-    if st.button("🚀 Calcular Reforecast", type="primary", use_container_width=True, key=f"{planta_selecionada}_calc"):
+    if HISTORICO is not None:
+        ciclo_historico = st.text_input(
+            "Ciclo (histórico)", value=ciclo_padrao(mes_reforecast), key=f"{planta_selecionada}_ciclo_{mes_reforecast}",
+            help="Cada cálculo é gravado no histórico com este rótulo; calcular de novo o mesmo ciclo substitui o anterior.",
+        )
+    erros_entrada = validar_entradas(planta_selecionada, plant_state, mes_reforecast)
+    sessao_plantas().anexos.setdefault(planta_selecionada, {})['validacao_exibida'] = (
+        mes_reforecast, hash_entradas(repr(erros_entrada)))
+    cronometro.marcar('validacao')
+    if erros_entrada:
+        st.error(f"❌ {len(erros_entrada)} problema(s) nas entradas. Corrija-os para calcular o Reforecast.")
+        st.dataframe(tabela_erros(erros_entrada).drop(columns=['planta', 'regra']), hide_index=True)
+    calcular = st.button("🚀 Calcular Reforecast", type="primary", use_container_width=True,
+                         disabled=bool(erros_entrada), key=f"{planta_selecionada}_calc")
+    if calcular and not erros_entrada:
         with st.spinner("Consolidando dados e executando cálculos..."):
-            if PLANTAS_CONFIG[planta_selecionada]['tipo'] == 'Cans':
-                final_kpi_order = KPIS_CANS
-            else:
-                final_kpi_order = KPIS_ENDS
             nomes_formatos = plant_state['nomes_formatos']
-            volumes = {f: dados_formatos[f]['volume'] for f in nomes_formatos}
-            aops = {f: dados_formatos[f]['aop'] for f in nomes_formatos}
-            aops_show = {f: dados_formatos[f]['aop_show'] for f in nomes_formatos}
-            resultados_por_formato = {}
-            bloqueios_por_kpi = {k: set() for k in kpis_da_planta}
-            for formato in nomes_formatos:
-                res = calc_kpi_por_formato(formato, volumes[formato], aops[formato])
-                resultados_por_formato[formato] = res
-                for kpi in res['bloqueado_por_kpi']:
-                    bloqueios_por_kpi[kpi].add(formato)
-            kpis_bloqueados_no_geral = {k for k, fset in bloqueios_por_kpi.items() if len(fset) > 0}
-            if len(kpis_bloqueados_no_geral) > 0:
+            chave_cache = chave_calculo_planta(tipo_planta, mes_reforecast, fator_gas, nomes_formatos, dados_formatos)
+            resultado = CACHE_RESULTADOS.get(chave_cache)
+            if resultado is None:
+                resultado = calcular_planta(planta_selecionada, nomes_formatos, dados_formatos, mes_reforecast)
+                CACHE_RESULTADOS.set(chave_cache, resultado)
+            cronometro.marcar('calculo')
+            if HISTORICO is not None and ciclo_historico.strip():
+                try:
+                    HISTORICO.registrar(
+                        planta_selecionada, ciclo_historico.strip(), mes_reforecast, nomes_formatos, kpis_da_planta,
+                        registro_ciclo(nomes_formatos, dados_formatos, resultado, kpis_da_planta),
+                    )
+                except (OSError, ValueError) as e:
+                    st.caption(f"⚠️ Ciclo não gravado no histórico: {e}")
+                cronometro.marcar('historico')
+            for aviso in resultado['avisos_bloqueio']:
+                st.warning(aviso)
+            if len(resultado['kpis_bloqueados_no_geral']) > 0:
                 st.info("ℹ️ Para os KPIs com estouro em algum formato, o consolidado **Geral** foi suprimido para esses KPIs.")
-            metas_finais_por_formato = {}
-            avisos_por_formato = {}
-            for formato in nomes_formatos:
-                res = resultados_por_formato[formato]
-                df_aop_formato = aops[formato]
-                df_aop_show_formato = aops_show[formato]
-                metas_a_exibir = res['metas_futuras'].copy()
-                avisos_performance = []
-                for kpi in kpis_da_planta:
-                    coef_calculado = res['coef_anual_necessario'].get(kpi, 0.0)
-                    coef_fy_meta = df_aop_formato.loc[kpi, 'FY']
-                    if coef_fy_meta > 0 and coef_calculado > coef_fy_meta:
-                        override_values = df_aop_show_formato.loc[kpi, colunas_futuro]
-                        if override_values.sum() > 0:
-                            avisos_performance.append(f"💡 KPI **{kpi}** teve performance melhor que o AOP. Exibindo valores de 'AOP ou Ciclo Anterior'.")
-                            metas_a_exibir.loc[kpi, colunas_futuro] = override_values
-                metas_finais_por_formato[formato] = metas_a_exibir
-                avisos_por_formato[formato] = avisos_performance
             tab_labels = ['Geral'] + nomes_formatos
             abas = st.tabs(tab_labels)
             with abas[0]: # ABA GERAL
                 st.subheader("Resultado Geral")
+                geral = resultado['geral']
                 if len(nomes_formatos) == 1:
-                    formato_unico = nomes_formatos[0]
-                    st.subheader(f"(Espelho de {formato_unico})")
+                    st.subheader(f"(Espelho de {nomes_formatos[0]})")
                     chips_meses(colunas_ytd, colunas_futuro)
-                    if avisos_por_formato[formato_unico]:
+                    if geral['avisos']:
                         st.write("")
-                        for aviso in avisos_por_formato[formato_unico]:
+                        for aviso in geral['avisos']:
                             st.info(aviso)
                         st.write("")
-                    res_unico = resultados_por_formato[formato_unico]
-                    df_anual_row_fmt = mult_gas_series_as_row(res_unico['coef_anual_necessario'], fator_gas)
-                    df_anual_row_fmt.index = ["Necessário (FY)"]
-                    
-                    df_anual_renamed = renomear_gas_para_output(df_anual_row_fmt)
-                    df_anual_agregado = agregar_energia(df_anual_renamed, final_kpi_order)
                     st.markdown(f"**📊 Valor Anual**")
-                    st.dataframe(df_anual_agregado.style.format(formatter="{:.3f}"))
-                    
-                    metas_finais = metas_finais_por_formato[formato_unico]
-                    metas_fmt_out = mult_gas_df(metas_finais, fator_gas)
-
-                    metas_renamed = renomear_gas_para_output(metas_fmt_out)
-                    metas_agregadas = agregar_energia(metas_renamed, final_kpi_order)
+                    exibir_tabela(geral['anual'])
                     st.markdown(f"**📅 Metas Mensais Futuras**")
-                    st.dataframe(metas_agregadas[colunas_futuro].style.format(formatter="{:.3f}"))
+                    exibir_tabela(geral['metas'])
                 else: # Múltiplos formatos
                     chips_meses(colunas_ytd, colunas_futuro)
-                    vol_total_df = pd.concat([volumes[f] for f in nomes_formatos]).groupby(level=0).sum()
-                    realizado_ytd_total = pd.Series(0.0, index=kpis_da_planta)
-                    total_fy_total = pd.Series(0.0, index=kpis_da_planta)
-                    for kpi in kpis_da_planta:
-                        for formato in nomes_formatos:
-                            if formato in bloqueios_por_kpi.get(kpi, set()): continue
-                            vol_formato = volumes[formato].loc['Volume Total']
-                            aop_formato = aops[formato].loc[kpi]
-                            if is_spoilage(kpi):
-                                realizado_ytd_total[kpi] += ((aop_formato[colunas_ytd] / 100.0) * vol_formato[colunas_ytd]).sum()
-                                total_fy_total[kpi] += (aop_formato['FY'] / 100.0) * vol_formato.sum()
-                            else:
-                                realizado_ytd_total[kpi] += (aop_formato[colunas_ytd] * vol_formato[colunas_ytd]).sum()
-                                total_fy_total[kpi] += aop_formato['FY'] * vol_formato.sum()
-                    saldo_restante = (total_fy_total - realizado_ytd_total).clip(lower=0)
-                    vol_fut_total = vol_total_df.loc['Volume Total', colunas_futuro].sum()
-                    geral_coef_anual = pd.Series(0.0, index=kpis_da_planta)
-                    if vol_fut_total > 0:
-                        for kpi in kpis_da_planta:
-                            if kpi in kpis_bloqueados_no_geral: geral_coef_anual[kpi] = 0.0; continue
-                            if is_spoilage(kpi):
-                                geral_coef_anual[kpi] = (saldo_restante[kpi] / vol_fut_total) * 100.0
-                            else:
-                                geral_coef_anual[kpi] = saldo_restante[kpi] / vol_fut_total
-                    df_anual_row_geral = mult_gas_series_as_row(geral_coef_anual, fator_gas)
-                    df_anual_row_geral.index = ["Necessário (FY)"]
-
-                    df_anual_geral_renamed = renomear_gas_para_output(df_anual_row_geral)
-                    df_anual_geral_agregado = agregar_energia(df_anual_geral_renamed, final_kpi_order)
                     st.markdown("**📊 Valor Anual (Consolidado)**")
-                    st.dataframe(df_anual_geral_agregado.style.format(formatter="{:.3f}"))
-                    
-                    volumes_producao_futuros_total_por_mes = pd.Series(0.0, index=colunas_futuro)
-                    for formato in nomes_formatos:
-                        volumes_producao_futuros_total_por_mes += volumes[formato].loc['Volume Total', colunas_futuro]
-                    geral_metas = pd.DataFrame(0.0, index=kpis_da_planta, columns=MESES)
-                    with np.errstate(divide='ignore', invalid='ignore'):
-                        for kpi in kpis_da_planta:
-                            if kpi in kpis_bloqueados_no_geral: geral_metas.loc[kpi, colunas_futuro] = 0.0; continue
-                            soma_liquido_kpi_por_mes = pd.Series(0.0, index=colunas_futuro)
-                            for formato in nomes_formatos:
-                                if formato in bloqueios_por_kpi.get(kpi, set()): continue
-                                metas_futuras_formato = resultados_por_formato[formato]['metas_futuras']
-                                volume_futuro_formato = volumes[formato].loc['Volume Total', colunas_futuro]
-                                coeficientes_futuros = metas_futuras_formato.loc[kpi, colunas_futuro]
-                                if is_spoilage(kpi):
-                                    valor_liquido_mensal = (coeficientes_futuros / 100.0) * volume_futuro_formato
-                                else:
-                                    valor_liquido_mensal = coeficientes_futuros * volume_futuro_formato
-                                soma_liquido_kpi_por_mes += valor_liquido_mensal
-                            coef_mensal = soma_liquido_kpi_por_mes / volumes_producao_futuros_total_por_mes
-                            if is_spoilage(kpi):
-                                geral_metas.loc[kpi, colunas_futuro] = coef_mensal.fillna(0.0) * 100.0
-                            else:
-                                geral_metas.loc[kpi, colunas_futuro] = coef_mensal.fillna(0.0)
-                    geral_metas_out = mult_gas_df(geral_metas, fator_gas)
-
-                    geral_metas_renamed = renomear_gas_para_output(geral_metas_out)
-                    geral_metas_agregadas = agregar_energia(geral_metas_renamed, final_kpi_order)
+                    exibir_tabela(geral['anual'])
                     st.markdown("**📅 Metas Mensais Futuras (Consolidado)**")
-                    st.dataframe(geral_metas_agregadas[colunas_futuro].style.format(formatter="{:.3f}"))
+                    exibir_tabela(geral['metas'])
+            cronometro.marcar('resultado: Geral')
             
             for pos, formato in enumerate(nomes_formatos, start=1):
                 with abas[pos]:
                     st.subheader(f"Formato: {formato}")
                     chips_meses(colunas_ytd, colunas_futuro)
-                    avisos = avisos_por_formato[formato]
+                    res_formato = resultado['formatos'][formato]
+                    avisos = res_formato['avisos']
                     if avisos:
                         st.write("")
                         for aviso in avisos:
                             st.info(aviso)
                         st.write("")
-                    res_formato = resultados_por_formato[formato]
-                    df_anual_row_fmt = mult_gas_series_as_row(res_formato['coef_anual_necessario'], fator_gas)
-                    df_anual_row_fmt.index = ["Necessário (FY)"]
-
-                    df_anual_formato_renamed = renomear_gas_para_output(df_anual_row_fmt)
-                    df_anual_formato_agregado = agregar_energia(df_anual_formato_renamed, final_kpi_order)
                     st.markdown(f"**📊 Valor Anual ({formato})**")
-                    st.dataframe(df_anual_formato_agregado.style.format(formatter="{:.3f}"))
-                    
-                    metas_finais = metas_finais_por_formato[formato]
-                    metas_fmt_out = mult_gas_df(metas_finais, fator_gas)
-                    
-                    metas_formato_renamed = renomear_gas_para_output(metas_fmt_out)
-                    metas_formato_agregadas = agregar_energia(metas_formato_renamed, final_kpi_order)
+                    exibir_tabela(res_formato['anual'])
                     st.markdown(f"**📅 Metas Mensais Futuras ({formato})**")
-                    st.dataframe(metas_formato_agregadas[colunas_futuro].style.format(formatter="{:.3f}"))
+                    exibir_tabela(res_formato['metas'])
+                cronometro.marcar(f"resultado: {formato}")
             st.success("✅ Cálculos concluídos com sucesso!")
+            try:
+                arquivo_excel = io.BytesIO()
+                exportar_excel({planta_selecionada: resultado_para_tabela(resultado)}, arquivo_excel)
+            except ImportError as e:
+                st.caption(f"Exportação indisponível: {e}")
+            else:
+                st.download_button(
+                    "📥 Exportar resultados (Excel)", data=arquivo_excel.getvalue(),
+                    file_name=f"Reforecast_{planta_selecionada}_{mes_reforecast}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key=f"{planta_selecionada}_exportar",
+                )
+            cronometro.marcar('exportacao')
+
+    with st.expander("🔭 Varredura de cenários (todos os meses de corte)"):
+        st.caption("Calcula de uma vez o reforecast para cada mês de corte (Jan..Dez) e para as escalas de volume futuro "
+                   "escolhidas; depois é possível navegar pelos cenários sem recalcular.")
+        escalas_volume = st.multiselect(
+            "Escalas do volume futuro", options=[0.8, 0.9, 1.0, 1.1, 1.2], default=[1.0],
+            format_func=lambda x: f"{x:.0%}", key=f"{planta_selecionada}_escalas_varredura"
+        )
+        nomes_formatos = plant_state['nomes_formatos']
+        chave_varredura = hash_entradas(
+            chave_calculo_planta(tipo_planta, 'varredura', fator_gas, nomes_formatos, dados_formatos),
+            sorted(escalas_volume),
+        )
+        if st.button("Calcular varredura", disabled=not escalas_volume, key=f"{planta_selecionada}_varredura"):
+            anexar_planta(planta_selecionada, 'varredura', {
+                'chave': chave_varredura,
+                'cubo': calcular_varredura_planta(planta_selecionada, nomes_formatos, dados_formatos, sorted(escalas_volume)),
+            })
+        varredura = anexo_planta(planta_selecionada, 'varredura')
+        if varredura is not None:
+            cubo = varredura['cubo']
+            if varredura['chave'] != chave_varredura:
+                st.caption("⚠️ Os dados de entrada mudaram desde a última varredura; clique em 'Calcular varredura' para atualizar.")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                mes_corte = st.select_slider("Mês de corte", options=MESES, value=mes_reforecast, key=f"{planta_selecionada}_corte_varredura")
+            with col2:
+                idx_escala = st.selectbox(
+                    "Escala do volume futuro", options=range(len(cubo['escalas_volume'])),
+                    format_func=lambda i: f"{cubo['escalas_volume'][i]:.0%}", key=f"{planta_selecionada}_escala_varredura"
+                )
+            with col3:
+                formato_varredura = st.selectbox("Formato", options=['Geral'] + cubo['nomes_formatos'], key=f"{planta_selecionada}_formato_varredura")
+            cenario = tabelas_cenario(planta_selecionada, cubo, dados_formatos, idx_escala, mes_corte, formato_varredura)
+            for aviso in cenario['avisos']:
+                st.info(aviso)
+            st.markdown(f"**📊 Valor Anual ({formato_varredura}, corte em {mes_corte})**")
+            exibir_tabela(cenario['anual'])
+            st.markdown(f"**📅 Metas Mensais Futuras ({formato_varredura}, corte em {mes_corte})**")
+            exibir_tabela(cenario['metas'])
+
+    cronometro.marcar('varredura')
+
+    with st.expander("🎲 Incerteza do volume futuro (Monte Carlo)"):
+        st.caption("Sorteia milhares de trajetórias do volume futuro de cada formato (ruído de ±X% por mês) e refaz o "
+                   "cálculo para todas de uma vez. Mostra as faixas P10/P50/P90 e a probabilidade de cada KPI "
+                   "ultrapassar o limite de saldo líquido.")
+        col1, col2 = st.columns(2)
+        with col1:
+            variacao_pct = st.slider("Variação do volume futuro (±%)", min_value=1, max_value=50, value=10,
+                                     key=f"{planta_selecionada}_variacao_mc")
+        with col2:
+            n_simulacoes = st.selectbox("Simulações", options=[1000, 2000, 5000, 10000], index=1,
+                                        key=f"{planta_selecionada}_n_mc")
+        nomes_formatos = plant_state['nomes_formatos']
+        if st.button("Simular", key=f"{planta_selecionada}_simular"):
+            with st.spinner("Simulando..."):
+                anexar_planta(planta_selecionada, 'simulacao', simular_planta(
+                    planta_selecionada, nomes_formatos, dados_formatos, mes_reforecast,
+                    variacao_pct / 100, n_simulacoes,
+                ))
+        simulacao = anexo_planta(planta_selecionada, 'simulacao')
+        if simulacao is not None:
+            st.caption(f"{simulacao['n_simulacoes']} simulações, volume futuro ±{simulacao['variacao']:.0%}. "
+                       "Metas sem a substituição por 'AOP ou Ciclo Anterior'.")
+            abas_mc = st.tabs(['Geral'] + list(simulacao['formatos']))
+            for pos, (aba, res_mc) in enumerate(zip(abas_mc, [simulacao['geral']] + list(simulacao['formatos'].values()))):
+                with aba:
+                    st.markdown("**📊 Necessário (FY) — faixas**")
+                    exibir_tabela(res_mc['anual'])
+                    prob = res_mc['prob_bloqueio']
+                    if (prob > 0).any():
+                        st.markdown("**🔔 Probabilidade de ultrapassar o limite de saldo líquido**")
+                        exibir_tabela(prob[prob > 0].to_frame().T * 100, formato="%.1f%%")
+                    percentil = st.radio("Metas mensais futuras", options=list(res_mc['metas']), index=1,
+                                         horizontal=True, key=f"{planta_selecionada}_percentil_mc_{pos}")
+                    exibir_tabela(res_mc['metas'][percentil])
+
+    cronometro.marcar('monte_carlo')
+
+    with st.expander("🧮 Mix de formatos (otimização)"):
+        mix_formatos(planta_selecionada, mes_reforecast)
+
+    cronometro.marcar('mix_formatos')
+
+    with st.expander("🎯 Sensibilidade (maiores alavancas)"):
+        st.caption("Derivadas exatas de cada saída em relação ao volume de cada mês e ao coeficiente realizado YTD de "
+                   "cada formato, calculadas de uma vez (sem recalcular). Impacto de +1% = quanto a saída muda se a "
+                   "entrada subir 1%. KPIs bloqueados e meses sem volume têm saída fixa em 0 e não aparecem; nas metas "
+                   "mensais de um formato, o mesmo vale para os KPIs que exibem 'AOP ou Ciclo Anterior' (valores fixos).")
+        nomes_formatos = plant_state['nomes_formatos']
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            formato_sens = st.selectbox("Formato", options=['Geral'] + nomes_formatos, key=f"{planta_selecionada}_formato_sens")
+        with col2:
+            saida_sens = st.selectbox("Saída", options=["Necessário (FY)"] + colunas_futuro, key=f"{planta_selecionada}_saida_sens")
+        with col3:
+            n_alavancas = st.slider("Alavancas por KPI", min_value=1, max_value=10, value=3, key=f"{planta_selecionada}_n_sens")
+        chave_sens = hash_entradas(
+            chave_calculo_planta(tipo_planta, 'sensibilidade', fator_gas, nomes_formatos, dados_formatos), mes_reforecast,
+        )
+        if st.button("Calcular sensibilidade", key=f"{planta_selecionada}_sensibilidade"):
+            anexar_planta(planta_selecionada, 'sensibilidade', {
+                'chave': chave_sens,
+                'sens': sensibilidade_planta(planta_selecionada, nomes_formatos, dados_formatos, mes_reforecast),
+            })
+        sensibilidade = anexo_planta(planta_selecionada, 'sensibilidade')
+        if sensibilidade is not None:
+            if sensibilidade['chave'] != chave_sens:
+                st.caption("⚠️ Os dados de entrada mudaram desde o último cálculo; clique em 'Calcular sensibilidade' para atualizar.")
+            alavancas = tabela_alavancas(planta_selecionada, sensibilidade['sens'], formato_sens, saida_sens, n_alavancas)
+            if alavancas.empty:
+                st.caption("Nenhuma entrada altera esta saída (KPIs bloqueados ou sem volume futuro).")
+            else:
+                st.dataframe(alavancas, hide_index=True, column_config={
+                    'Derivada': st.column_config.NumberColumn(format="%.6f"),
+                    'Impacto de +1%': st.column_config.NumberColumn(format="%.4f"),
+                })
+
+    cronometro.marcar('sensibilidade')
+
+    if HISTORICO is not None:
+        with st.expander("🕰️ Histórico de ciclos"):
+            ciclos_planta = HISTORICO.ciclos(planta_selecionada)
+            if len(ciclos_planta) < 2:
+                st.caption("São necessários ao menos dois ciclos calculados desta planta para comparar. "
+                           f"Gravados: {', '.join(ciclos_planta) or 'nenhum'}.")
+            else:
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    ciclo_a = st.selectbox("Ciclo A", options=ciclos_planta, index=len(ciclos_planta) - 2,
+                                           key=f"{planta_selecionada}_ciclo_a")
+                with col2:
+                    ciclo_b = st.selectbox("Ciclo B", options=ciclos_planta, index=len(ciclos_planta) - 1,
+                                           key=f"{planta_selecionada}_ciclo_b")
+                with col3:
+                    nivel = st.radio("Nível", options=['Geral', 'formatos'], horizontal=True,
+                                     key=f"{planta_selecionada}_nivel_historico")
+                todas = st.checkbox("Comparar todas as plantas", key=f"{planta_selecionada}_historico_todas")
+                diferencas = HISTORICO.diferencas(
+                    ciclo_a, ciclo_b, None if todas else [planta_selecionada], nivel, so_alteracoes=True
+                )
+                st.caption("FY = Necessário; meses = metas exibidas (KPIs de cálculo, antes da conversão do gás). "
+                           "Só as linhas que mudaram entre os ciclos.")
+                if diferencas.empty:
+                    st.caption("Nenhuma diferença entre os ciclos.")
+                else:
+                    st.dataframe(diferencas if todas else diferencas.drop(columns='planta'), hide_index=True)
+                    st.download_button(
+                        "📥 Exportar diferenças (CSV)",
+                        data=diferencas.to_csv(sep=';', decimal=',', index=False).encode('utf-8-sig'),
+                        file_name=f"Reforecast_diff_{ciclo_a}_{ciclo_b}.csv", mime="text/csv",
+                        key=f"{planta_selecionada}_diff_csv",
+                    )
+
+    cronometro.marcar('historico_ciclos')
+
+    with st.sidebar.expander("⚙️ Cache de resultados"):
+        stats_cache = CACHE_RESULTADOS.estatisticas()
+        st.caption(
+            f"Hits: {stats_cache['hits']} | Misses: {stats_cache['misses']} | "
+            f"Taxa de acerto: {stats_cache['taxa_acerto']:.0%}"
+        )
+        st.caption(f"Itens: {stats_cache['itens']}/{stats_cache['max_itens']} | Descartes (LRU): {stats_cache['descartes']}")
+        stats_formatos = CACHE_FORMATOS.estatisticas()
+        st.caption(
+            f"Por formato — Hits: {stats_formatos['hits']} | Misses: {stats_formatos['misses']} | "
+            f"Itens: {stats_formatos['itens']}/{stats_formatos['max_itens']} | Descartes: {stats_formatos['descartes']}"
+        )
+
+    with st.sidebar.expander("🧠 Memória do servidor"):
+        sessao = sessao_plantas()
+        memoria = REGISTRO_MEMORIA.metricas()
+        st.caption(f"Esta sessão: {len(sessao)}/{memoria['max_plantas_sessao']} planta(s) | "
+                   f"{sessao.bytes_total() / 1024:.0f} KiB | Descartes: {sessao.descartes}")
+        orcamento = f"{memoria['orcamento_bytes'] / 1024**2:.0f} MiB" if memoria['orcamento_bytes'] else "sem limite"
+        st.caption(f"Servidor: {memoria['sessoes']} sessão(ões) | {memoria['plantas_residentes']} planta(s) residentes | "
+                   f"{memoria['bytes_total'] / 1024**2:.1f} MiB de {orcamento}")
+        st.caption(f"Por sessão — média: {memoria['bytes_sessao_media'] / 1024:.0f} KiB | "
+                   f"máx.: {memoria['bytes_sessao_max'] / 1024:.0f} KiB")
+        st.caption(f"Descartes (LRU) — por sessão: {memoria['descartes_sessao']} | "
+                   f"por orçamento: {memoria['descartes_orcamento']}")
+        if not memoria['persistencia']:
+            st.caption("⚠️ Persistência desligada: a planta descartada por limite de memória volta com os valores padrão.")
 
     st.markdown("---")
-    st.markdown(f"<div style='text-align: center; color: gray;'>Calculadora Reforecast v12.7 | {datetime.now().year}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div style='text-align: center; color: gray;'>Calculadora Reforecast v12.8 | {datetime.now().year}</div>", unsafe_allow_html=True)
+
+    cronometro.marcar('cache_e_rodape')
+    registro = cronometro.registrar(
+        planta=planta_selecionada, tipo=tipo_planta, formatos=len(plant_state['nomes_formatos']),
+        kpis=len(kpis_da_planta), mes=mes_reforecast,
+    )
+    if cronometro.ativo:
+        with st.sidebar.expander("⏱️ Tempos deste rerun", expanded=True):
+            st.caption(f"Total: {registro['total_ms']:.1f} ms | {registro['formatos']} formato(s)")
+            st.dataframe(
+                pd.Series(registro['etapas_ms'], name="ms").to_frame(),
+                column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+            )
 
 if __name__ == "__main__":
     main()
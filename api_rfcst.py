@@ -0,0 +1,312 @@
+"""
+API HTTP local do Reforecast (somente biblioteca padrão), com as mesmas regras da calculadora.
+
+Uso:
+    python api_rfcst.py [--host 127.0.0.1] [--porta 8765] [--workers N]
+
+Endpoints:
+    GET  /saude                 -> {"status": "ok", "plantas": [...]}
+    POST /reforecast            -> uma planta (payload abaixo)
+    POST /reforecast/lote       -> {"plantas": [payload, ...]}, calculadas em paralelo (pool de processos)
+
+Payload de uma planta:
+    {
+      "planta": "BRJC",
+      "mes_reforecast": "Jun",
+      "formatos": [
+        {"nome": "Formato_1",
+         "volume": [12 valores, Jan..Dez],
+         "aop": {"<KPI>": [12 valores (+ FY opcional)], ...},
+         "aop_show": {"<KPI>": [12 valores + FY], ...}}
+      ]
+    }
+Valores podem ser números ou textos com decimal brasileiro; KPIs ausentes contam como 0 e, como na
+interface, o FY usado é o de aop_show (ou o de aop, se aop_show não vier).
+
+Antes do cálculo o payload passa pela validação (validacao_rfcst). Com erro, a resposta é 400 com
+"erros": [{"planta", "formato", "tabela", "kpi", "mes", "regra", "valor", "descricao"}, ...].
+Uma falha inesperada no cálculo responde 500, com "erro" e "interno": true (no lote, na planta que falhou).
+
+Resposta: avisos de bloqueio, KPIs suprimidos no Geral e, para o Geral e cada formato, o "Necessário (FY)"
+(anual), as metas futuras (metas) e os avisos de 'AOP ou Ciclo Anterior', já como exibidos na tela.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from nucleo_rfcst import PLANTAS_CONFIG, calcular_planta
+from importacao_rfcst import corrige_decimais_df
+from motor_reforecast import MESES
+from validacao_rfcst import preencher_vazios, tabela_erros, validar_planta
+
+MAX_CORPO_BYTES = 20 * 1024 * 1024
+
+
+class ErroPayload(ValueError):
+    """Payload inválido (responde 400)."""
+
+
+class ErroValidacao(ErroPayload):
+    """Payload reprovado na validação das entradas; 'erros' traz a tabela de erros."""
+
+    def __init__(self, erros: list):
+        super().__init__(f"{len(erros)} erro(s) de validação nas entradas.")
+        self.erros = erros
+
+
+class ErroAPI(ValueError):
+    """Resposta de erro recebida pelo ClienteRFCST: status HTTP e, se houver, a tabela de erros de validação."""
+
+    def __init__(self, mensagem: str, status: int, erros: list = None):
+        super().__init__(mensagem)
+        self.status = status
+        self.erros = erros or []
+
+
+def _lista_valores(valores, rotulo: str, tamanhos: tuple, descricao: str) -> list:
+    """Confere que 'valores' é uma lista JSON de números/textos com um dos tamanhos esperados."""
+    if not isinstance(valores, list):
+        raise ErroPayload(f"{rotulo}: esperada uma lista com {descricao}, recebido {type(valores).__name__}")
+    if len(valores) not in tamanhos:
+        raise ErroPayload(f"{rotulo}: esperados {descricao}, recebidos {len(valores)}")
+    aninhados = [i for i, v in enumerate(valores) if isinstance(v, (list, dict))]
+    if aninhados:
+        raise ErroPayload(f"{rotulo}: cada posição deve ser um número ou texto (lista/objeto na posição {aninhados[0] + 1})")
+    return list(valores)
+
+
+def _tabela_kpis(valores_por_kpi, kpis: list, formato: str, tabela: str, invalidas: list) -> pd.DataFrame:
+    if not isinstance(valores_por_kpi, dict):
+        raise ErroPayload(f"{formato}/{tabela}: esperado um objeto {{\"<KPI>\": [valores]}}, recebido {type(valores_por_kpi).__name__}")
+    desconhecidos = [k for k in valores_por_kpi if k not in kpis]
+    if desconhecidos:
+        raise ErroPayload(f"{formato}/{tabela}: KPI(s) que não pertencem à planta: {', '.join(desconhecidos)}")
+    linhas = {}
+    for kpi, valores in valores_por_kpi.items():
+        valores = _lista_valores(valores, f"{formato}/{tabela}/{kpi}", (len(MESES), len(MESES) + 1), "12 meses (+ FY opcional)")
+        linhas[kpi] = valores + [None] * (len(MESES) + 1 - len(valores))
+    df = pd.DataFrame.from_dict(linhas, orient='index', columns=MESES + ['FY'], dtype=object)
+    return _converter(df, formato, tabela, invalidas).reindex(index=kpis, fill_value=0.0)
+
+
+def _converter(df: pd.DataFrame, formato: str, tabela: str, invalidas: list) -> pd.DataFrame:
+    """Converte os valores; textos não numéricos vão para 'invalidas' (e ficam vazios) para a validação."""
+    numeros, celulas = corrige_decimais_df(df)
+    invalidas.extend((formato, tabela, linha, coluna, valor) for linha, coluna, valor in celulas)
+    return numeros
+
+
+def dados_de_payload(payload: dict):
+    """Converte o payload de uma planta em (planta, mes_reforecast, nomes_formatos, dados_formatos)."""
+    if not isinstance(payload, dict):
+        raise ErroPayload("O payload de cada planta deve ser um objeto JSON.")
+    planta = payload.get('planta')
+    if planta not in PLANTAS_CONFIG:
+        raise ErroPayload(f"Planta desconhecida: {planta!r}")
+    mes_reforecast = payload.get('mes_reforecast', 'Jun')
+    if mes_reforecast not in MESES:
+        raise ErroPayload(f"mes_reforecast inválido: {mes_reforecast!r} (use {', '.join(MESES)})")
+    formatos = payload.get('formatos')
+    if formatos is not None and not isinstance(formatos, list):
+        raise ErroPayload(f"'formatos' deve ser uma lista de objetos, recebido {type(formatos).__name__}")
+    if not formatos:
+        raise ErroPayload("Informe ao menos um formato.")
+
+    kpis = PLANTAS_CONFIG[planta]['kpis']
+    nomes_formatos, dados_formatos, invalidas = [], {}, []
+    for pos, formato in enumerate(formatos, start=1):
+        if not isinstance(formato, dict):
+            raise ErroPayload(f"formatos[{pos}]: esperado um objeto, recebido {type(formato).__name__}")
+        nome = str(formato.get('nome') or f"Formato_{pos}")
+        if nome in dados_formatos:
+            raise ErroPayload(f"Formato repetido: {nome}")
+        volume = formato.get('volume')
+        volume = [0.0] * len(MESES) if volume is None else _lista_valores(volume, f"{nome}/volume", (len(MESES),), "12 meses")
+        df_volume = _converter(pd.DataFrame([volume], index=["Volume Total"], columns=MESES, dtype=object), nome, 'volume', invalidas)
+        df_aop = _tabela_kpis(formato.get('aop') or {}, kpis, nome, 'aop', invalidas)
+        df_aop_show = _tabela_kpis(formato.get('aop_show') or {}, kpis, nome, 'aop_show', invalidas)
+        if formato.get('aop_show'):
+            df_aop['FY'] = df_aop_show['FY']
+        else:
+            df_aop_show['FY'] = df_aop['FY']
+        nomes_formatos.append(nome)
+        dados_formatos[nome] = {'volume': df_volume, 'aop': df_aop, 'aop_show': df_aop_show}
+    erros = validar_planta(planta, nomes_formatos, dados_formatos, mes_reforecast, invalidas)
+    if erros:
+        raise ErroValidacao(erros)
+    return planta, mes_reforecast, nomes_formatos, preencher_vazios(dados_formatos)
+
+
+def _tabelas_para_json(res: dict) -> dict:
+    return {
+        'anual': {kpi: float(v) for kpi, v in res['anual'].iloc[0].items()},
+        'metas': {kpi: {mes: float(v) for mes, v in linha.items()} for kpi, linha in res['metas'].iterrows()},
+        'avisos': [aviso.replace('**', '') for aviso in res['avisos']],
+    }
+
+
+def resultado_para_json(resultado: dict) -> dict:
+    return {
+        'avisos_bloqueio': [aviso.replace('**', '') for aviso in resultado['avisos_bloqueio']],
+        'kpis_bloqueados_no_geral': sorted(resultado['kpis_bloqueados_no_geral']),
+        'geral': _tabelas_para_json(resultado['geral']),
+        'formatos': {nome: _tabelas_para_json(res) for nome, res in resultado['formatos'].items()},
+    }
+
+
+def calcular_payload(payload: dict) -> dict:
+    """
+    Calcula uma planta a partir do payload. Qualquer erro (de conteúdo ou inesperado) volta em 'erro' da
+    própria planta, sem derrubar o lote; os inesperados vêm marcados com 'interno': True.
+    """
+    try:
+        planta, mes_reforecast, nomes_formatos, dados_formatos = dados_de_payload(payload)
+        resultado = calcular_planta(planta, nomes_formatos, dados_formatos, mes_reforecast)
+        return {'planta': planta, 'mes_reforecast': mes_reforecast, 'resultado': resultado_para_json(resultado)}
+    except ErroValidacao as e:
+        erros = tabela_erros(e.erros).astype(object).where(lambda t: t.notna(), None).to_dict(orient='records')
+        return {'planta': payload.get('planta'), 'erro': str(e), 'erros': erros}
+    except ErroPayload as e:
+        return {'planta': payload.get('planta') if isinstance(payload, dict) else None, 'erro': str(e)}
+    except Exception as e:
+        return {'planta': payload.get('planta') if isinstance(payload, dict) else None,
+                'erro': f"{type(e).__name__}: {e}", 'interno': True}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "RFCST-API/1.0"
+
+    def _responder(self, status: int, corpo: dict):
+        dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _ler_json(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if tamanho > MAX_CORPO_BYTES:
+            raise ErroPayload(f"Corpo maior que {MAX_CORPO_BYTES} bytes.")
+        try:
+            return json.loads(self.rfile.read(tamanho) or b'null')
+        except json.JSONDecodeError as e:
+            raise ErroPayload(f"JSON inválido: {e}") from e
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/saude':
+            self._responder(200, {'status': 'ok', 'plantas': sorted(PLANTAS_CONFIG)})
+        else:
+            self._responder(404, {'erro': f"Rota desconhecida: {self.path}"})
+
+    def do_POST(self):
+        rota = self.path.rstrip('/')
+        try:
+            corpo = self._ler_json()
+            if rota == '/reforecast':
+                resposta = calcular_payload(corpo)
+                self._responder(500 if resposta.get('interno') else 400 if 'erro' in resposta else 200, resposta)
+            elif rota == '/reforecast/lote':
+                plantas = corpo.get('plantas') if isinstance(corpo, dict) else None
+                if not isinstance(plantas, list):
+                    raise ErroPayload("Envie {\"plantas\": [payload, ...]}.")
+                self._responder(200, {'resultados': list(self.server.pool.map(calcular_payload, plantas))})
+            else:
+                self._responder(404, {'erro': f"Rota desconhecida: {self.path}"})
+        except ErroPayload as e:
+            self._responder(400, {'erro': str(e)})
+        except Exception as e:
+            self._responder(500, {'erro': f"{type(e).__name__}: {e}"})
+
+    def log_message(self, formato, *args):
+        if not self.server.silencioso:
+            super().log_message(formato, *args)
+
+
+class ServidorRFCST(ThreadingHTTPServer):
+    """Servidor HTTP com um pool de processos para o endpoint de lote."""
+
+    daemon_threads = True
+
+    def __init__(self, endereco, workers: int = None, silencioso: bool = False):
+        super().__init__(endereco, _Handler)
+        # 'spawn': não herda as threads do servidor (fork com threads ativas pode travar)
+        self.pool = ProcessPoolExecutor(
+            max_workers=max(1, workers or os.cpu_count() or 1), mp_context=multiprocessing.get_context('spawn')
+        )
+        self.silencioso = silencioso
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(cancel_futures=True)
+
+    @property
+    def url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar_em_thread(self) -> threading.Thread:
+        """Atende em segundo plano (útil em testes e scripts). Encerrar com shutdown() + server_close()."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class ClienteRFCST:
+    """Cliente da API (urllib), para scripts e testes offline."""
+
+    def __init__(self, url: str = "http://127.0.0.1:8765", timeout: float = 120.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _chamar(self, metodo: str, rota: str, corpo=None) -> dict:
+        dados = None if corpo is None else json.dumps(corpo).encode('utf-8')
+        requisicao = urllib.request.Request(
+            self.url + rota, data=dados, method=metodo, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+                return json.loads(resposta.read())
+        except urllib.error.HTTPError as e:
+            corpo_erro = json.loads(e.read() or b'{}')
+            raise ErroAPI(corpo_erro.get('erro', f"HTTP {e.code}"), e.code, corpo_erro.get('erros')) from e
+
+    def saude(self) -> dict:
+        return self._chamar('GET', '/saude')
+
+    def reforecast(self, payload: dict) -> dict:
+        return self._chamar('POST', '/reforecast', payload)
+
+    def reforecast_lote(self, payloads: list) -> list:
+        return self._chamar('POST', '/reforecast/lote', {'plantas': payloads})['resultados']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP local do Reforecast.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Processos do endpoint de lote")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorRFCST((args.host, args.porta), workers=args.workers)
+    print(f"API do Reforecast em {servidor.url} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
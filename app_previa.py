@@ -1,4 +1,3 @@
-import streamlit as st
 import pandas as pd
 from datetime import datetime
 import numpy as np
@@ -29,7 +28,87 @@ def validar_dados(vol_df, aop_df):
     return erros
 
 
+def calcular_spoilage(nomes_formatos, dados_formatos, colunas_ytd, colunas_futuro):
+    """
+    Cálculo da prévia (somente Spoilage), separado da interface para poder ser reutilizado e medido.
+    Se todos os formatos ultrapassaram o FY, retorna só as listas de formatos.
+    """
+    # ETAPA 1: Consolidar inputs dos formatos
+    lista_dfs_volume = []
+    lista_dfs_coef = []
+    for formato in nomes_formatos:
+        df_vol_formato = dados_formatos[formato]['volume'].T.rename(columns={"Volume Total": formato})
+        df_aop_formato = dados_formatos[formato]['aop'].T.rename(columns={"Spoilage": formato})
+        lista_dfs_volume.append(df_vol_formato)
+        lista_dfs_coef.append(df_aop_formato)
+
+    df_volume_all = pd.concat(lista_dfs_volume, axis=1)  # só formatos
+    df_coef_all = pd.concat(lista_dfs_coef, axis=1)      # só formatos
+
+    # ---------- VERIFICAÇÃO POR FORMATO ----------
+    # Se YTD líquido > FY líquido do formato, remover do cálculo e avisar
+    formatos_ultrapassados = []
+    for fmt in nomes_formatos:
+        # volume líquido YTD do formato
+        vol_liq_ytd_fmt = ((df_coef_all.loc[colunas_ytd, fmt] / 100) * df_volume_all.loc[colunas_ytd, fmt]).sum()
+        # volume líquido total FY (coef FY * volume FY do formato)
+        vol_liq_total_fy_fmt = (df_coef_all.loc['FY', fmt] / 100) * df_volume_all[fmt].sum()
+        if vol_liq_ytd_fmt > vol_liq_total_fy_fmt:
+            formatos_ultrapassados.append(fmt)
+
+    formatos_validos = [f for f in nomes_formatos if f not in formatos_ultrapassados]
+
+    if len(formatos_validos) == 0:
+        return {'formatos_ultrapassados': formatos_ultrapassados, 'formatos_validos': formatos_validos}
+
+    # Trabalhar a partir daqui apenas com os formatos válidos
+    df_volume = df_volume_all[formatos_validos].copy()
+    df_coef = df_coef_all[formatos_validos].copy()
+
+    # Só calcula o 'Geral' se NENHUM formato estiver ultrapassado
+    calcular_geral = (len(formatos_ultrapassados) == 0)
+    if calcular_geral:
+        df_volume['Geral'] = df_volume.sum(axis=1)
+
+    # ---------- ETAPA 2: Lógica de cálculo (inalterada para os válidos) ----------
+    df_vol_liq = (df_coef.loc[MESES] / 100) * df_volume
+    if calcular_geral:
+        df_vol_liq['Geral'] = df_vol_liq.sum(axis=1)
+        coef_geral_mensal = (df_vol_liq['Geral'] / df_volume['Geral']) * 100
+        df_coef['Geral'] = coef_geral_mensal
+
+    valor_liq_ytd = df_vol_liq.loc[colunas_ytd].sum()
+    volume_total_fy = df_volume.sum()
+    valor_liq_total_fy = (df_coef.loc['FY'] / 100) * volume_total_fy
+
+    if calcular_geral:
+        valor_liq_total_fy['Geral'] = valor_liq_total_fy.drop('Geral').sum()
+        df_coef.loc['FY', 'Geral'] = (valor_liq_total_fy['Geral'] / volume_total_fy['Geral']) * 100
+
+    saldo_restante = valor_liq_total_fy - valor_liq_ytd
+    valor_total_futuro = df_volume.loc[colunas_futuro].sum()
+    coeficientes_necessarios = (saldo_restante / valor_total_futuro) * 100
+
+    df_coef_futuro = df_coef.loc[colunas_futuro]
+    df_volume_futuro = df_volume.loc[colunas_futuro]
+    df_spoilage_estimado = (df_coef_futuro / 100) * df_volume_futuro
+    total_spoilage_estimado = df_spoilage_estimado.sum()
+    df_proporcao_spoilage = df_spoilage_estimado.div(total_spoilage_estimado, axis='columns').fillna(0)
+    df_orcamento_real_futuro = df_proporcao_spoilage.mul(saldo_restante, axis='columns')
+    df_coef_final_mensal = (df_orcamento_real_futuro / df_volume_futuro) * 100
+
+    return {
+        'formatos_ultrapassados': formatos_ultrapassados,
+        'formatos_validos': formatos_validos,
+        'coeficientes_necessarios': coeficientes_necessarios,
+        'df_coef_final_mensal': df_coef_final_mensal,
+    }
+
+
 def main():
+    # Só a interface precisa do Streamlit: calcular_spoilage pode ser importada sem ele
+    import streamlit as st
+
     st.set_page_config(
         page_title="Calculadora de Reforecast",
         page_icon="📈",
@@ -54,7 +133,7 @@ def main():
     COR_TAB_HOVER_BG = "#E8EDFF"
 
     BASE_DIR = Path(__file__).parent
-    LOGO_URL = BASE_DIR / "logo.png"  # ajuste o nome/extensão se necessário
+    LOGO_URL = BASE_DIR / "static" / "logo.png"  # ajuste o nome/extensão se necessário
 
     # --- CSS GLOBAL (apenas estilo; não altera cálculos) ---
     st.markdown(f"""
@@ -199,70 +278,14 @@ def main():
 
         with st.spinner("Consolidando dados e executando cálculos... Por favor, aguarde."):
 
-            # ETAPA 1: Consolidar inputs dos formatos
-            lista_dfs_volume = []
-            lista_dfs_coef = []
-            for formato in nomes_formatos:
-                df_vol_formato = dados_formatos[formato]['volume'].T.rename(columns={"Volume Total": formato})
-                df_aop_formato = dados_formatos[formato]['aop'].T.rename(columns={"Spoilage": formato})
-                lista_dfs_volume.append(df_vol_formato)
-                lista_dfs_coef.append(df_aop_formato)
-
-            df_volume_all = pd.concat(lista_dfs_volume, axis=1)  # só formatos
-            df_coef_all = pd.concat(lista_dfs_coef, axis=1)      # só formatos
-
-            # ---------- VERIFICAÇÃO POR FORMATO ----------
-            # Se YTD líquido > FY líquido do formato, remover do cálculo e avisar
-            formatos_ultrapassados = []
-            for fmt in nomes_formatos:
-                # volume líquido YTD do formato
-                vol_liq_ytd_fmt = ((df_coef_all.loc[colunas_ytd, fmt] / 100) * df_volume_all.loc[colunas_ytd, fmt]).sum()
-                # volume líquido total FY (coef FY * volume FY do formato)
-                vol_liq_total_fy_fmt = (df_coef_all.loc['FY', fmt] / 100) * df_volume_all[fmt].sum()
-                if vol_liq_ytd_fmt > vol_liq_total_fy_fmt:
-                    formatos_ultrapassados.append(fmt)
-
-            formatos_validos = [f for f in nomes_formatos if f not in formatos_ultrapassados]
-
+            resultado = calcular_spoilage(nomes_formatos, dados_formatos, colunas_ytd, colunas_futuro)
+            formatos_ultrapassados = resultado['formatos_ultrapassados']
+            formatos_validos = resultado['formatos_validos']
             if len(formatos_validos) == 0:
                 st.error("❌ FY de todos os formatos já foi ultrapassado pelo YTD. Cálculo não realizado.")
                 st.stop()
-
-            # Trabalhar a partir daqui apenas com os formatos válidos
-            df_volume = df_volume_all[formatos_validos].copy()
-            df_coef = df_coef_all[formatos_validos].copy()
-
-            # Só calcula o 'Geral' se NENHUM formato estiver ultrapassado
-            calcular_geral = (len(formatos_ultrapassados) == 0)
-            if calcular_geral:
-                df_volume['Geral'] = df_volume.sum(axis=1)
-
-            # ---------- ETAPA 2: Lógica de cálculo (inalterada para os válidos) ----------
-            df_vol_liq = (df_coef.loc[MESES] / 100) * df_volume
-            if calcular_geral:
-                df_vol_liq['Geral'] = df_vol_liq.sum(axis=1)
-                coef_geral_mensal = (df_vol_liq['Geral'] / df_volume['Geral']) * 100
-                df_coef['Geral'] = coef_geral_mensal
-
-            valor_liq_ytd = df_vol_liq.loc[colunas_ytd].sum()
-            volume_total_fy = df_volume.sum()
-            valor_liq_total_fy = (df_coef.loc['FY'] / 100) * volume_total_fy
-
-            if calcular_geral:
-                valor_liq_total_fy['Geral'] = valor_liq_total_fy.drop('Geral').sum()
-                df_coef.loc['FY', 'Geral'] = (valor_liq_total_fy['Geral'] / volume_total_fy['Geral']) * 100
-
-            saldo_restante = valor_liq_total_fy - valor_liq_ytd
-            valor_total_futuro = df_volume.loc[colunas_futuro].sum()
-            coeficientes_necessarios = (saldo_restante / valor_total_futuro) * 100
-
-            df_coef_futuro = df_coef.loc[colunas_futuro]
-            df_volume_futuro = df_volume.loc[colunas_futuro]
-            df_spoilage_estimado = (df_coef_futuro / 100) * df_volume_futuro
-            total_spoilage_estimado = df_spoilage_estimado.sum()
-            df_proporcao_spoilage = df_spoilage_estimado.div(total_spoilage_estimado, axis='columns').fillna(0)
-            df_orcamento_real_futuro = df_proporcao_spoilage.mul(saldo_restante, axis='columns')
-            df_coef_final_mensal = (df_orcamento_real_futuro / df_volume_futuro) * 100
+            coeficientes_necessarios = resultado['coeficientes_necessarios']
+            df_coef_final_mensal = resultado['df_coef_final_mensal']
 
         # --- Mensagens de aviso/resultado ---
         if formatos_ultrapassados:
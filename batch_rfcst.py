@@ -0,0 +1,149 @@
+"""
+Reforecast em lote (sem interface) para todas as plantas do PLANTAS_CONFIG.
+
+Uso:
+    python batch_rfcst.py <pasta_entrada> <pasta_saida> [--mes Jun] [--workers N] [--plantas BRJC BRAM ...]
+                          [--formato-saida csv|xlsx|parquet] [--ciclo 2026-Jun | --sem-historico] [--so-validar]
+
+Cada planta é lida de <pasta_entrada>/<PLANTA>.csv ou <PLANTA>.xlsx (formato descrito no README),
+calculada com as mesmas regras da calculadora e gravada em <pasta_saida>/<PLANTA>_resultado.csv ou, com
+--formato-saida xlsx/parquet, em um único resultados.xlsx / dataset resultados_parquet/ com todas as plantas
+(avisos de bloqueio e de 'AOP ou Ciclo Anterior' vão para <pasta_saida>/<PLANTA>_avisos.txt).
+Cada planta calculada também é gravada no histórico de ciclos (historico_rfcst), no ciclo --ciclo.
+Antes do cálculo, as entradas de cada planta passam pela validação (validacao_rfcst); plantas com erro não
+são calculadas e todos os erros do lote vão para <pasta_saida>/validacao_erros.csv.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from nucleo_rfcst import PLANTAS_CONFIG, calcular_planta
+from exportacao_rfcst import FORMATOS_EXPORTACAO, exportar_excel, exportar_parquet, resultado_para_tabela
+from historico_rfcst import HISTORICO, ciclo_padrao, registro_ciclo
+from importacao_rfcst import ler_entrada_planta
+from validacao_rfcst import preencher_vazios, tabela_erros, validar_planta
+from motor_reforecast import MESES
+
+def processar_planta(planta: str, caminho: Path, pasta_saida: Path, mes_reforecast: str, formato_saida: str = 'csv',
+                     so_validar: bool = False) -> dict:
+    """
+    Calcula uma planta. Em 'csv' o resultado é gravado pelo próprio processo; nos demais formatos a tabela
+    é devolvida para que todas as plantas sejam gravadas juntas, em um único arquivo/dataset. As colunas do
+    histórico também voltam para o processo principal, o único que grava no histórico.
+    """
+    inicio = time.perf_counter()
+    tabela = historico = erro = None
+    erros_validacao, avisos = [], []
+    try:
+        kpis = PLANTAS_CONFIG[planta]['kpis']
+        celulas_invalidas = []
+        nomes_formatos, dados_formatos = ler_entrada_planta(caminho, kpis, celulas_invalidas)
+        erros_validacao = validar_planta(planta, nomes_formatos, dados_formatos, mes_reforecast, celulas_invalidas)
+        if erros_validacao:
+            erro = f"{len(erros_validacao)} erro(s) de validação"
+        elif not so_validar:
+            dados_formatos = preencher_vazios(dados_formatos)
+            resultado = calcular_planta(planta, nomes_formatos, dados_formatos, mes_reforecast)
+            tabela = resultado_para_tabela(resultado)
+            historico = {'nomes_formatos': nomes_formatos, 'kpis': kpis,
+                         'colunas': registro_ciclo(nomes_formatos, dados_formatos, resultado, kpis)}
+            if formato_saida == 'csv':
+                tabela.to_csv(
+                    pasta_saida / f"{planta}_resultado.csv", sep=';', decimal=',', index=False, encoding='utf-8-sig'
+                )
+                tabela = None
+            avisos = [a.replace('**', '') for a in resultado['avisos_bloqueio']] + [
+                f"{formato}: {aviso.replace('**', '')}" for formato, res in resultado['formatos'].items() for aviso in res['avisos']
+            ]
+            if avisos:
+                (pasta_saida / f"{planta}_avisos.txt").write_text("\n".join(avisos) + "\n", encoding='utf-8')
+    except Exception as e:
+        nomes_formatos, avisos, erro = [], [], f"{type(e).__name__}: {e}"
+    return {
+        'planta': planta,
+        'formatos': len(nomes_formatos),
+        'avisos': len(avisos),
+        'erro': erro,
+        'tempo_s': time.perf_counter() - inicio,
+        'tabela': tabela,
+        'historico': historico,
+        'validacao': erros_validacao,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reforecast em lote para as plantas do PLANTAS_CONFIG.")
+    parser.add_argument('entrada', type=Path, help="Pasta com um <PLANTA>.csv (ou .xlsx) por planta")
+    parser.add_argument('saida', type=Path, help="Pasta onde os resultados serão gravados")
+    parser.add_argument('--mes', default='Jun', choices=MESES, help="Mês do Reforecast (último mês YTD)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Número de processos")
+    parser.add_argument('--plantas', nargs='*', help="Restringe o lote a estas plantas")
+    parser.add_argument('--formato-saida', default='csv', choices=FORMATOS_EXPORTACAO,
+                        help="csv: um arquivo por planta; xlsx: resultados.xlsx com uma aba por planta; "
+                             "parquet: dataset resultados_parquet/ particionado por planta")
+    parser.add_argument('--ciclo', help="Rótulo do ciclo no histórico (padrão: <ano>-<mês>, ex.: 2026-Jun)")
+    parser.add_argument('--sem-historico', action='store_true', help="Não grava o lote no histórico de ciclos")
+    parser.add_argument('--so-validar', action='store_true', help="Só valida as entradas (nada é calculado)")
+    args = parser.parse_args(argv)
+
+    plantas = args.plantas or sorted(PLANTAS_CONFIG)
+    desconhecidas = [p for p in plantas if p not in PLANTAS_CONFIG]
+    if desconhecidas:
+        parser.error(f"Planta(s) fora do PLANTAS_CONFIG: {', '.join(desconhecidas)}")
+    arquivos = {}
+    for p in plantas:
+        candidatos = [args.entrada / f"{p}{ext}" for ext in ('.csv', '.xlsx')]
+        arquivos[p] = next((c for c in candidatos if c.exists()), candidatos[0])
+    sem_arquivo = [p for p, caminho in arquivos.items() if not caminho.exists()]
+    for p in sem_arquivo:
+        print(f"⚠️  {p}: arquivo {p}.csv/.xlsx não encontrado, planta ignorada.")
+    args.saida.mkdir(parents=True, exist_ok=True)
+
+    inicio = time.perf_counter()
+    resultados = []
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futuros = [
+            pool.submit(processar_planta, p, caminho, args.saida, args.mes, args.formato_saida, args.so_validar)
+            for p, caminho in arquivos.items() if p not in sem_arquivo
+        ]
+        for futuro in as_completed(futuros):
+            resultados.append(futuro.result())
+
+    tabelas = {r['planta']: r['tabela'] for r in sorted(resultados, key=lambda r: r['planta']) if r['tabela'] is not None}
+    if args.formato_saida == 'xlsx' and tabelas:
+        exportar_excel(tabelas, args.saida / "resultados.xlsx")
+    elif args.formato_saida == 'parquet' and tabelas:
+        exportar_parquet(tabelas, args.saida / "resultados_parquet")
+    erros_validacao = [linha for r in sorted(resultados, key=lambda r: r['planta']) for linha in r['validacao']]
+    if erros_validacao:
+        tabela_erros(erros_validacao).to_csv(
+            args.saida / "validacao_erros.csv", sep=';', decimal=',', index=False, encoding='utf-8-sig'
+        )
+    ciclo = args.ciclo or ciclo_padrao(args.mes)
+    gravar_historico = HISTORICO is not None and not args.sem_historico and not args.so_validar
+    if gravar_historico:
+        for r in resultados:
+            if r['historico'] is not None:
+                HISTORICO.registrar(r['planta'], ciclo, args.mes, r['historico']['nomes_formatos'],
+                                    r['historico']['kpis'], r['historico']['colunas'])
+    total = time.perf_counter() - inicio
+
+    print(f"\n{'Planta':<8}{'Formatos':>10}{'Tempo (ms)':>12}  Status")
+    for r in sorted(resultados, key=lambda r: r['planta']):
+        status = f"ERRO - {r['erro']}" if r['erro'] else f"ok ({r['avisos']} aviso(s))"
+        print(f"{r['planta']:<8}{r['formatos']:>10}{r['tempo_s'] * 1000:>12.1f}  {status}")
+    print(f"\nTotal: {len(resultados)} planta(s) em {total:.2f} s")
+    if erros_validacao:
+        print(f"Validação: {len(erros_validacao)} erro(s) em {args.saida / 'validacao_erros.csv'}")
+    elif args.so_validar:
+        print("Validação: nenhum erro encontrado.")
+    if gravar_historico:
+        print(f"Histórico: ciclo {ciclo} gravado em {HISTORICO.raiz}")
+    return 1 if any(r['erro'] for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Benchmark do cálculo do Reforecast com plantas sintéticas.
+
+Uso:
+    python bench_rfcst.py [--formatos 1 2 5 10 20] [--meses Jan Jun Nov] [--repeticoes 5] [--saida bench.json]
+    python bench_rfcst.py --so-importacao
+
+Para cada tipo de planta (Cans e Ends), número de formatos e mês de corte, mede separadamente:
+- parse_decimais: corrige_decimais_df nas tabelas digitadas (texto com decimal brasileiro);
+- calculo_formatos: calcular_formatos (regras por formato/KPI);
+- consolidacao_geral: consolidar_geral sobre as parciais dos formatos;
+- pos_processamento: AOP ou Ciclo Anterior + gás e agregação de energia por índices (_pos_processar_formato / preparar_saida_*);
+- calcular_planta: fluxo completo, sem cache;
+- previa_spoilage: cálculo da app_previa (somente Spoilage, pandas), como referência.
+
+Mede também o tempo de importação (em um interpretador novo) dos módulos usados sem interface e confere o
+orçamento em ORCAMENTO_IMPORTACAO_MS: acima dele, ou se o módulo carregar pandas/Streamlit, o script sai com código 1.
+
+O resultado (mediana e mínimo em segundos de cada etapa) é gravado em JSON para comparar versões.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import app_previa
+from cache_rfcst import CACHE_FORMATOS
+from nucleo_rfcst import (
+    PLANTAS_CONFIG, _pos_processar_formato, calcular_planta, montar_blocos_formatos, preparar_saida_anual,
+    preparar_saida_metas,
+)
+from importacao_rfcst import corrige_decimais_df
+from motor_reforecast import CHAVES_PARCIAIS, MESES, calcular_formatos, consolidar_geral
+
+PLANTAS_BENCH = {'Cans': 'BRJC', 'Ends': 'BRAM'}
+
+# Mediana do tempo de importação (ms) permitida para os módulos usados por lote, API e workers
+ORCAMENTO_IMPORTACAO_MS = {'motor_reforecast': 200, 'nucleo_rfcst': 200}
+MODULOS_PESADOS = ('pandas', 'streamlit')
+
+
+def gerar_planta(kpis: list, n_formatos: int, semente: int = 0):
+    """Dados sintéticos de uma planta: (dados em texto como no editor, dados já numéricos)."""
+    rng = np.random.default_rng(semente)
+    textos, numeros = {}, {}
+    for i in range(n_formatos):
+        nome = f"Formato_{i + 1}"
+        volume = pd.DataFrame([rng.uniform(500, 5000, len(MESES))], index=["Volume Total"], columns=MESES)
+        aop = pd.DataFrame(rng.uniform(0.5, 12, (len(kpis), len(MESES) + 1)), index=kpis, columns=MESES + ['FY'])
+        # Alguns KPIs com YTD alto, para exercitar o bloqueio
+        aop.iloc[::4, :6] *= 3
+        numeros[nome] = {'volume': volume, 'aop': aop, 'aop_show': aop.copy()}
+        textos[nome] = {
+            tabela: df.map(lambda v: f"{v:,.4f}".replace(',', '_').replace('.', ',').replace('_', '.'))
+            for tabela, df in numeros[nome].items()
+        }
+    return textos, numeros
+
+
+def cronometrar(funcao, repeticoes: int) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {'mediana_s': statistics.median(tempos), 'min_s': min(tempos)}
+
+
+def medir_planta(tipo: str, n_formatos: int, mes: str, repeticoes: int) -> dict:
+    planta = PLANTAS_BENCH[tipo]
+    cfg_planta = PLANTAS_CONFIG[planta]
+    kpis = cfg_planta['kpis']
+    idx_mes = MESES.index(mes)
+    colunas_futuro = MESES[idx_mes + 1:]
+    mascara_spoilage = cfg_planta['mascara_spoilage']
+
+    textos, dados = gerar_planta(kpis, n_formatos, semente=n_formatos)
+    nomes = list(dados)
+    vol_bloco, coef_bloco = montar_blocos_formatos(
+        nomes, {f: dados[f]['volume'] for f in nomes}, {f: dados[f]['aop'] for f in nomes}, kpis
+    )
+    res = calcular_formatos(vol_bloco, coef_bloco, idx_mes, mascara_spoilage)
+    parciais = {chave: res[chave] for chave in CHAVES_PARCIAIS}
+    res_geral = consolidar_geral(parciais, mascara_spoilage)
+
+    def parse():
+        for tabelas in textos.values():
+            for df in tabelas.values():
+                corrige_decimais_df(df)
+
+    def pos_processar():
+        for f, nome in enumerate(nomes):
+            _pos_processar_formato({chave: valores[f] for chave, valores in res.items()},
+                                   dados[nome], cfg_planta, colunas_futuro)
+        preparar_saida_anual(res_geral['geral_coef_anual'], cfg_planta)
+        preparar_saida_metas(res_geral['geral_metas'], cfg_planta, colunas_futuro)
+
+    def planta_completa():
+        CACHE_FORMATOS.limpar()
+        calcular_planta(planta, nomes, dados, mes)
+
+    etapas = {
+        'parse_decimais': parse,
+        'calculo_formatos': lambda: calcular_formatos(vol_bloco, coef_bloco, idx_mes, mascara_spoilage),
+        'consolidacao_geral': lambda: consolidar_geral(parciais, mascara_spoilage),
+        'pos_processamento': pos_processar,
+        'calcular_planta': planta_completa,
+    }
+    resultado = {nome: cronometrar(funcao, repeticoes) for nome, funcao in etapas.items()}
+    CACHE_FORMATOS.limpar()
+    return resultado
+
+
+def medir_previa(n_formatos: int, mes: str, repeticoes: int) -> dict:
+    """Fluxo vetorizado (pandas) da app_previa, que só trata Spoilage."""
+    idx_mes = MESES.index(mes)
+    meses_previa = app_previa.MESES
+    rng = np.random.default_rng(n_formatos)
+    dados = {
+        f"Formato_{i + 1}": {
+            'volume': pd.DataFrame([rng.uniform(500, 5000, 12)], index=["Volume Total"], columns=meses_previa),
+            'aop': pd.DataFrame([rng.uniform(0.5, 3, 13)], index=['Spoilage'], columns=meses_previa + ['FY']),
+        }
+        for i in range(n_formatos)
+    }
+    return {'previa_spoilage': cronometrar(
+        lambda: app_previa.calcular_spoilage(list(dados), dados, meses_previa[:idx_mes + 1], meses_previa[idx_mes + 1:]),
+        repeticoes,
+    )}
+
+
+def medir_importacao(modulo: str, repeticoes: int) -> dict:
+    """Importa o módulo em interpretadores novos; também lista os módulos pesados que ele carregou."""
+    codigo = (
+        "import json, sys, time\n"
+        "inicio = time.perf_counter()\n"
+        f"import {modulo}\n"
+        "print(json.dumps({'s': time.perf_counter() - inicio, "
+        f"'pesados': [m for m in {MODULOS_PESADOS!r} if m in sys.modules]}}))\n"
+    )
+    tempos, pesados = [], set()
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', codigo], cwd=Path(__file__).parent,
+                               capture_output=True, text=True, check=True)
+        medicao = json.loads(saida.stdout.strip().splitlines()[-1])
+        tempos.append(medicao['s'] * 1000)
+        pesados.update(medicao['pesados'])
+    mediana = statistics.median(tempos)
+    return {
+        'modulo': modulo, 'mediana_ms': mediana, 'min_ms': min(tempos),
+        'orcamento_ms': ORCAMENTO_IMPORTACAO_MS[modulo], 'modulos_pesados': sorted(pesados),
+        'dentro_do_orcamento': mediana <= ORCAMENTO_IMPORTACAO_MS[modulo] and not pesados,
+    }
+
+
+def imprimir_importacao(importacao: list):
+    for medicao in importacao:
+        situacao = "ok" if medicao['dentro_do_orcamento'] else "ACIMA DO ORÇAMENTO"
+        pesados = f" | carregou {', '.join(medicao['modulos_pesados'])}" if medicao['modulos_pesados'] else ""
+        print(f"importação {medicao['modulo']}: {medicao['mediana_ms']:.1f} ms "
+              f"(orçamento {medicao['orcamento_ms']} ms){pesados} -> {situacao}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do cálculo do Reforecast com plantas sintéticas.")
+    parser.add_argument('--formatos', type=int, nargs='*', default=[1, 2, 5, 10, 20], help="Números de formatos")
+    parser.add_argument('--meses', nargs='*', default=MESES, choices=MESES, help="Meses de corte (padrão: todos)")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Repetições de cada medição")
+    parser.add_argument('--saida', type=Path, default=Path("bench_rfcst.json"), help="Arquivo JSON de saída")
+    parser.add_argument('--so-importacao', action='store_true', help="Só mede o tempo de importação e confere o orçamento")
+    args = parser.parse_args(argv)
+
+    importacao = [medir_importacao(modulo, args.repeticoes) for modulo in ORCAMENTO_IMPORTACAO_MS]
+    codigo_saida = 0 if all(m['dentro_do_orcamento'] for m in importacao) else 1
+    if args.so_importacao:
+        imprimir_importacao(importacao)
+        return codigo_saida
+
+    medicoes = []
+    for n_formatos in args.formatos:
+        for mes in args.meses:
+            for tipo in PLANTAS_BENCH:
+                for etapa, tempos in medir_planta(tipo, n_formatos, mes, args.repeticoes).items():
+                    medicoes.append({'tipo': tipo, 'formatos': n_formatos, 'mes': mes, 'etapa': etapa, **tempos})
+            for etapa, tempos in medir_previa(n_formatos, mes, args.repeticoes).items():
+                medicoes.append({'tipo': 'Spoilage', 'formatos': n_formatos, 'mes': mes, 'etapa': etapa, **tempos})
+
+    relatorio = {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'plataforma': platform.platform(),
+        },
+        'repeticoes': args.repeticoes,
+        'importacao': importacao,
+        'medicoes': medicoes,
+    }
+    args.saida.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    # Resumo: mediana (entre os meses) da mediana de cada etapa, em ms
+    resumo = pd.DataFrame(medicoes).groupby(['tipo', 'formatos', 'etapa'])['mediana_s'].median().unstack('etapa') * 1000
+    print(resumo.round(3).to_string())
+    print()
+    imprimir_importacao(importacao)
+    print(f"\nResultado completo em {args.saida}")
+    return codigo_saida
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Cache de resultados do Reforecast ---
+# Fica em um módulo próprio porque o script principal do Streamlit é reexecutado a cada
+# interação: só assim o cache sobrevive aos reruns e é compartilhado entre as sessões do servidor.
+
+
+class CacheLRU:
+    """Cache em memória com tamanho máximo e descarte do item usado há mais tempo (LRU)."""
+
+    def __init__(self, max_itens: int = 64):
+        self.max_itens = max(1, int(max_itens))
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.descartes = 0
+
+    def get(self, chave: str):
+        """Retorna o valor guardado (e o marca como recente) ou None se não houver."""
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                return self._itens[chave]
+            self.misses += 1
+            return None
+
+    def set(self, chave: str, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'itens': len(self._itens),
+                'max_itens': self.max_itens,
+                'hits': self.hits,
+                'misses': self.misses,
+                'descartes': self.descartes,
+                'taxa_acerto': (self.hits / total) if total else 0.0,
+            }
+
+
+def _atualizar_hash(h, valor):
+    # Sem importar o pandas: se ele não foi carregado, nenhum valor pode ser um DataFrame
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(valor, pd.DataFrame):
+        h.update(repr((list(valor.index), list(valor.columns))).encode())
+        if all(pd.api.types.is_numeric_dtype(t) for t in valor.dtypes):
+            h.update(np.ascontiguousarray(valor.to_numpy(dtype=float)).tobytes())
+        else:
+            # Editores com texto (ex.: decimal brasileiro ainda não convertido)
+            h.update(repr(list(valor.dtypes.astype(str))).encode())
+            h.update(pd.util.hash_pandas_object(valor, index=False).to_numpy().tobytes())
+    elif isinstance(valor, np.ndarray):
+        h.update(repr((valor.dtype.str, valor.shape)).encode())
+        h.update(np.ascontiguousarray(valor).tobytes())
+    elif isinstance(valor, (list, tuple)):
+        h.update(f"<{type(valor).__name__}:{len(valor)}>".encode())
+        for item in valor:
+            _atualizar_hash(h, item)
+    else:
+        h.update(repr(valor).encode())
+    h.update(b"|")
+
+
+def hash_entradas(*partes) -> str:
+    """Hash estável do conteúdo das entradas (DataFrames, arrays, textos e números)."""
+    h = hashlib.blake2b(digest_size=20)
+    for parte in partes:
+        _atualizar_hash(h, parte)
+    return h.hexdigest()
+
+
+def chave_calculo_planta(tipo_planta: str, mes_reforecast: str, fator_gas: float,
+                         nomes_formatos: list, dados_formatos: dict) -> str:
+    """Chave do cálculo de uma planta: volume, aop e aop_show de cada formato, mês, fator de gás e tipo."""
+    por_formato = [
+        (nome, dados_formatos[nome]['volume'], dados_formatos[nome]['aop'], dados_formatos[nome]['aop_show'])
+        for nome in nomes_formatos
+    ]
+    return hash_entradas(tipo_planta, mes_reforecast, float(fator_gas), por_formato)
+
+
+def chave_calculo_formato(tipo_planta: str, mes_reforecast: str, fator_gas: float, dados_formato: dict) -> str:
+    """Chave do cálculo de um único formato (base do recálculo incremental do Geral)."""
+    return hash_entradas(
+        tipo_planta, mes_reforecast, float(fator_gas),
+        dados_formato['volume'], dados_formato['aop'], dados_formato['aop_show'],
+    )
+
+
+CACHE_RESULTADOS = CacheLRU(max_itens=int(os.environ.get('RFCST_CACHE_MAX_ITENS', 64)))
+CACHE_FORMATOS = CacheLRU(max_itens=int(os.environ.get('RFCST_CACHE_MAX_FORMATOS', 512)))
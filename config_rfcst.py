@@ -0,0 +1,138 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+# --- Cadastro de plantas e KPIs ---
+# Plantas, tipos, listas de KPIs, gás e energia vêm de config_rfcst.json (ou do arquivo em
+# RFCST_CONFIG_PATH), lido uma vez por processo. Cada planta é compilada em índices e máscaras
+# (linhas de spoilage, linha do gás, linhas de energia a somar, ordem de saída), de modo que o
+# cálculo usa indexação de arrays em vez de comparar nomes de KPI. Nova planta: só editar o JSON.
+
+VERSOES_SUPORTADAS = (1,)
+CAMINHO_PADRAO = Path(__file__).parent / "config_rfcst.json"
+
+
+def carregar_config(caminho=None) -> dict:
+    """Lê e valida o arquivo de configuração. Todos os problemas encontrados vão em um único ValueError."""
+    caminho = Path(caminho or os.environ.get('RFCST_CONFIG_PATH') or CAMINHO_PADRAO)
+    with open(caminho, encoding='utf-8') as arquivo:
+        config = json.load(arquivo)
+    erros = validar_config(config)
+    if erros:
+        raise ValueError(f"Configuração inválida em {caminho}:\n" + "\n".join(f"- {erro}" for erro in erros))
+    return config
+
+
+def validar_config(config: dict) -> list:
+    if config.get('versao') not in VERSOES_SUPORTADAS:
+        return [f"versão {config.get('versao')!r} não suportada (use {', '.join(map(str, VERSOES_SUPORTADAS))})"]
+    erros = []
+    gas, energia, tipos = config.get('gas', {}), config.get('energia', {}), config.get('tipos', {})
+    fatores = gas.get('fatores', {})
+    if gas.get('tipo_padrao') not in fatores:
+        erros.append(f"gas.tipo_padrao {gas.get('tipo_padrao')!r} sem fator em gas.fatores")
+
+    for tipo, definicao in tipos.items():
+        kpis = definicao.get('kpis') or []
+        if not kpis or len(set(kpis)) != len(kpis):
+            erros.append(f"tipos.{tipo}.kpis vazia ou com KPIs repetidos")
+        for kpi in definicao.get('kpis_spoilage', []):
+            if kpi not in kpis:
+                erros.append(f"tipos.{tipo}.kpis_spoilage: {kpi!r} não está em kpis")
+        saidas_validas = set(kpis)
+        if gas.get('kpi') in kpis:
+            saidas_validas.add(gas.get('kpi_saida'))
+        if energia.get('ponta') in kpis and energia.get('fora_ponta') in kpis:
+            saidas_validas.add(energia.get('kpi_saida'))
+        for kpi in definicao.get('ordem_saida', []):
+            if kpi not in saidas_validas:
+                erros.append(f"tipos.{tipo}.ordem_saida: {kpi!r} não vem de nenhum KPI do tipo")
+
+    if not config.get('plantas'):
+        erros.append("nenhuma planta em 'plantas'")
+    for planta, definicao in config.get('plantas', {}).items():
+        if definicao.get('tipo') not in tipos:
+            erros.append(f"plantas.{planta}: tipo {definicao.get('tipo')!r} desconhecido")
+        if 'gas' in definicao and definicao['gas'] not in fatores:
+            erros.append(f"plantas.{planta}: gás {definicao['gas']!r} sem fator em gas.fatores")
+    return erros
+
+
+def compilar_planta(config: dict, planta: str) -> dict:
+    """
+    Tudo o que o cálculo precisa saber de uma planta, já em índices:
+    - mascara_spoilage: KPIs com fator 100;
+    - idx_gas / tipo_gas / fator_gas (None, None, 1.0 sem KPI de gás);
+    - kpis_saida, idx_saida, escala_saida, pos_soma, idx_soma: saída[j] = valores[idx_saida[j]] * escala_saida[j],
+      mais valores[idx_soma] somados nas linhas pos_soma (Ponta + Fora Ponta);
+    - matriz_saida: a mesma transformação como matriz (KPIs exibidos x KPIs de cálculo).
+    """
+    gas, energia = config['gas'], config['energia']
+    tipo = config['plantas'][planta]['tipo']
+    definicao = config['tipos'][tipo]
+    kpis = definicao['kpis']
+    posicao = {kpi: k for k, kpi in enumerate(kpis)}
+
+    idx_gas = posicao.get(gas['kpi'])
+    tipo_gas = config['plantas'][planta].get('gas', gas['tipo_padrao']) if idx_gas is not None else None
+    fator_gas = float(gas['fatores'][tipo_gas]) if tipo_gas is not None else 1.0
+
+    # Origem de cada KPI exibido: {kpi de cálculo: peso}
+    origens = {}
+    if idx_gas is not None:
+        origens[gas['kpi_saida']] = {gas['kpi']: fator_gas}
+    if energia['ponta'] in posicao and energia['fora_ponta'] in posicao:
+        origens[energia['kpi_saida']] = {energia['ponta']: 1.0, energia['fora_ponta']: 1.0}
+
+    kpis_saida, idx_saida, escala_saida, pos_soma, idx_soma = [], [], [], [], []
+    for kpi in definicao['ordem_saida']:
+        pesos = origens.get(kpi, {kpi: 1.0} if kpi in posicao else {})
+        if not pesos:
+            continue
+        (primeiro, peso), *demais = pesos.items()
+        kpis_saida.append(kpi)
+        idx_saida.append(posicao[primeiro])
+        escala_saida.append(peso)
+        for extra, _ in demais:
+            pos_soma.append(len(kpis_saida) - 1)
+            idx_soma.append(posicao[extra])
+
+    matriz_saida = np.zeros((len(kpis_saida), len(kpis)))
+    for j, kpi in enumerate(kpis_saida):
+        for origem, peso in origens.get(kpi, {kpi: 1.0}).items():
+            matriz_saida[j, posicao[origem]] = peso
+
+    return {
+        'tipo': tipo,
+        'kpis': kpis,
+        'mascara_spoilage': np.isin(kpis, definicao.get('kpis_spoilage', [])),
+        'idx_gas': idx_gas,
+        'tipo_gas': tipo_gas,
+        'fator_gas': fator_gas,
+        'nomes_exibicao': [gas['kpi_saida'] if k == idx_gas else kpi for k, kpi in enumerate(kpis)],
+        'kpis_saida': kpis_saida,
+        'idx_saida': np.array(idx_saida, dtype=np.intp),
+        'escala_saida': np.array(escala_saida),
+        'pos_soma': np.array(pos_soma, dtype=np.intp),
+        'idx_soma': np.array(idx_soma, dtype=np.intp),
+        'matriz_saida': matriz_saida,
+    }
+
+
+def compilar_registro(config: dict) -> dict:
+    """{planta: compilar_planta(...)}, na ordem do arquivo."""
+    return {planta: compilar_planta(config, planta) for planta in config['plantas']}
+
+
+def aplicar_saida(cfg_planta: dict, valores: np.ndarray) -> np.ndarray:
+    """KPIs de cálculo (1º eixo) -> KPIs exibidos: gás convertido e Ponta + Fora Ponta somados."""
+    escala = cfg_planta['escala_saida'].reshape((-1,) + (1,) * (valores.ndim - 1))
+    saida = valores[cfg_planta['idx_saida']] * escala
+    np.add.at(saida, cfg_planta['pos_soma'], valores[cfg_planta['idx_soma']])
+    return saida
+
+
+CONFIG = carregar_config()
+REGISTRO_PLANTAS = compilar_registro(CONFIG)
@@ -0,0 +1,109 @@
+import itertools
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from motor_reforecast import MESES, N_MESES
+
+# --- Estado compacto de uma planta no plant_store ---
+# Em vez de três DataFrames por formato, cada planta guarda três blocos float64 com todos os
+# formatos: volume (F, 12) e aop/aop_show (F, K, 13, a última coluna é o FY). A lista de KPIs é
+# a do PLANTAS_CONFIG (referência, sem cópia) e os índices de linhas/colunas são compartilhados.
+# DataFrames só são criados na borda (editores e cálculo), como visões somente leitura dos blocos.
+# 'versao' muda a cada alteração real dos blocos; o que é derivado deles e guardado no estado
+# (ex.: as somas YTD do fechamento do mês) vale só para a versão em que foi apurado.
+
+TABELAS_FORMATO = ('volume', 'aop', 'aop_show')
+INDICE_VOLUME = ["Volume Total"]
+COLUNAS_AOP = MESES + ['FY']
+_VERSOES = itertools.count(1)
+
+
+@lru_cache(maxsize=None)
+def _indice(rotulos: tuple) -> pd.Index:
+    return pd.Index(rotulos)
+
+
+def layout_tabela(tabela: str, kpis: list):
+    """Índice e colunas com que cada tabela é exibida na interface."""
+    if tabela == 'volume':
+        return INDICE_VOLUME, MESES
+    return kpis, COLUNAS_AOP
+
+
+def novo_estado_planta(kpis: list, num_formatos: int = 2) -> dict:
+    return {
+        'num_formatos': num_formatos,
+        'nomes_formatos': [f'Formato_{i+1}' for i in range(num_formatos)],
+        'kpis': kpis,
+        'volume': np.zeros((num_formatos, N_MESES)),
+        'aop': np.zeros((num_formatos, len(kpis), N_MESES + 1)),
+        'aop_show': np.zeros((num_formatos, len(kpis), N_MESES + 1)),
+        'versao': next(_VERSOES),
+    }
+
+
+def marcar_alteracao(plant_state: dict) -> int:
+    """Nova versão dos blocos (única no processo): o que foi derivado da versão anterior deixa de valer."""
+    plant_state['versao'] = next(_VERSOES)
+    return plant_state['versao']
+
+
+def garantir_formatos(plant_state: dict, num_formatos: int):
+    """
+    Aumenta os blocos para num_formatos (os novos começam zerados). Nunca reduz: quem diminui o
+    número de formatos e depois volta encontra os dados digitados antes.
+    """
+    atual = plant_state['volume'].shape[0]
+    if num_formatos > atual:
+        for tabela in TABELAS_FORMATO:
+            bloco = plant_state[tabela]
+            plant_state[tabela] = np.concatenate([bloco, np.zeros((num_formatos - atual,) + bloco.shape[1:])])
+        marcar_alteracao(plant_state)
+
+
+def _visao(valores: np.ndarray, indice: list, colunas: list) -> pd.DataFrame:
+    valores = valores.view()
+    valores.flags.writeable = False
+    return pd.DataFrame(valores, index=_indice(tuple(indice)), columns=_indice(tuple(colunas)), copy=False)
+
+
+def quadros_formato(plant_state: dict, i: int) -> dict:
+    """{'volume', 'aop', 'aop_show'} de um formato como DataFrames (sem cópia; aop e aop_show com FY)."""
+    garantir_formatos(plant_state, i + 1)
+    kpis = plant_state['kpis']
+    return {
+        'volume': _visao(plant_state['volume'][i:i + 1], INDICE_VOLUME, MESES),
+        'aop': _visao(plant_state['aop'][i], kpis, COLUNAS_AOP),
+        'aop_show': _visao(plant_state['aop_show'][i], kpis, COLUNAS_AOP),
+    }
+
+
+def dados_formatos_planta(plant_state: dict) -> dict:
+    """dados_formatos no formato esperado por calcular_planta: {nome: quadros_formato}."""
+    return {nome: quadros_formato(plant_state, i) for i, nome in enumerate(plant_state['nomes_formatos'])}
+
+
+def gravar_tabela(plant_state: dict, i: int, tabela: str, df: pd.DataFrame):
+    """
+    Copia uma tabela para o bloco, alinhada ao layout da planta (linhas/colunas ausentes e vazios viram 0).
+    Só muda a versão do estado se algum valor mudou (as abas regravam todas as tabelas a cada rerun).
+    """
+    garantir_formatos(plant_state, i + 1)
+    indice, colunas = layout_tabela(tabela, plant_state['kpis'])
+    valores = df.reindex(index=indice, columns=colunas).to_numpy(dtype=float)
+    valores = np.nan_to_num(valores, nan=0.0).reshape(plant_state[tabela][i].shape)
+    if not np.array_equal(plant_state[tabela][i], valores):
+        plant_state[tabela][i] = valores
+        marcar_alteracao(plant_state)
+
+
+def gravar_formato(plant_state: dict, i: int, dados_formato: dict):
+    for tabela in TABELAS_FORMATO:
+        gravar_tabela(plant_state, i, tabela, dados_formato[tabela])
+
+
+def bytes_estado(plant_state: dict) -> int:
+    """Memória ocupada pelos blocos numéricos de uma planta."""
+    return sum(plant_state[tabela].nbytes for tabela in TABELAS_FORMATO)
@@ -0,0 +1,91 @@
+"""
+Exportação dos resultados do Reforecast (linha "Necessário (FY)" e metas futuras do Geral e de cada formato).
+
+Os valores são exatamente os exibidos na interface, ou seja, as tabelas 'anual' e 'metas' de calcular_planta
+(gás convertido, renomeado e energia agregada). Formatos de saída:
+- Excel: uma aba por planta, no layout da tela (formato, kpi, Necessário (FY), meses futuros);
+- Parquet: dataset particionado por planta, em formato longo (planta, formato, kpi, mes, valor).
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+LINHA_ANUAL = "Necessário (FY)"
+MES_ANUAL = 'FY'
+COLUNAS_LONGAS = ['planta', 'formato', 'kpi', 'mes', 'valor']
+FORMATOS_EXPORTACAO = ('csv', 'xlsx', 'parquet')
+
+
+def resultado_para_tabela(resultado: dict) -> pd.DataFrame:
+    """Junta a linha 'Necessário (FY)' e as metas futuras de cada formato (Geral primeiro): uma linha por formato/KPI."""
+    blocos = []
+    for formato, res in [('Geral', resultado['geral'])] + list(resultado['formatos'].items()):
+        tabela = pd.concat([res['anual'].T, res['metas']], axis=1)
+        tabela.index.name = 'kpi'
+        tabela = tabela.reset_index()
+        tabela.insert(0, 'formato', formato)
+        blocos.append(tabela)
+    return pd.concat(blocos, ignore_index=True)
+
+
+def tabelas_para_longo(tabelas: dict) -> pd.DataFrame:
+    """
+    Converte {planta: resultado_para_tabela(...)} em uma única tabela (planta, formato, kpi, mes, valor).
+    A linha 'Necessário (FY)' vira mes = 'FY'. Montada direto sobre os arrays, sem melt por planta.
+    """
+    chaves, meses, valores = [], [], []
+    for planta, tabela in tabelas.items():
+        colunas_valor = [c for c in tabela.columns if c not in ('formato', 'kpi')]
+        bloco = tabela[colunas_valor].to_numpy(dtype=float)
+        n_linhas, n_colunas = bloco.shape
+        rotulos = np.array([MES_ANUAL if c == LINHA_ANUAL else c for c in colunas_valor], dtype=object)
+        chaves.append(pd.DataFrame({
+            'planta': planta,
+            'formato': np.repeat(tabela['formato'].to_numpy(dtype=object), n_colunas),
+            'kpi': np.repeat(tabela['kpi'].to_numpy(dtype=object), n_colunas),
+        }))
+        meses.append(np.tile(rotulos, n_linhas))
+        valores.append(bloco.ravel())
+    if not chaves:
+        return pd.DataFrame(columns=COLUNAS_LONGAS)
+    longo = pd.concat(chaves, ignore_index=True)
+    longo['mes'] = np.concatenate(meses)
+    longo['valor'] = np.concatenate(valores)
+    return longo
+
+
+def exportar_excel(tabelas: dict, destino):
+    """
+    Grava {planta: tabela} em um .xlsx com uma aba por planta. destino pode ser um caminho ou um buffer (BytesIO).
+    Usa o modo write-only do openpyxl, que grava linha a linha sem manter as células em memória.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise ImportError("A exportação para Excel requer o pacote openpyxl (pip install openpyxl).") from e
+    wb = Workbook(write_only=True)
+    for planta, tabela in tabelas.items():
+        ws = wb.create_sheet(title=str(planta)[:31])
+        ws.append(list(tabela.columns))
+        rotulos = tabela[['formato', 'kpi']].to_numpy(dtype=object).tolist()
+        numeros = tabela.drop(columns=['formato', 'kpi']).to_numpy(dtype=float)
+        celulas = numeros.astype(object)
+        celulas[~np.isfinite(numeros)] = None
+        for rotulo, linha in zip(rotulos, celulas.tolist()):
+            ws.append(rotulo + linha)
+    wb.save(destino)
+
+
+def exportar_parquet(tabelas: dict, pasta: Path):
+    """Grava {planta: tabela} como dataset Parquet particionado por planta (substitui as partições já existentes)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("A exportação para Parquet requer o pacote pyarrow (pip install pyarrow).") from e
+    longo = tabelas_para_longo(tabelas)
+    pq.write_to_dataset(
+        pa.Table.from_pandas(longo, preserve_index=False), root_path=str(pasta),
+        partition_cols=['planta'], existing_data_behavior='delete_matching',
+    )
@@ -0,0 +1,131 @@
+from datetime import datetime
+
+import numpy as np
+
+from config_rfcst import REGISTRO_PLANTAS
+from estado_rfcst import marcar_alteracao
+from motor_reforecast import CHAVES_PARCIAIS, MESES, calcular_formatos, consolidar_geral, fatores_kpi
+
+# --- Fechamento do mês (roll-forward) ---
+# Em vez de redigitar o YTD e recalcular tudo, o fechamento grava o realizado do mês que fechou
+# (volume e coeficientes de cada formato) nos blocos da planta e avança o mês do Reforecast.
+# As somas líquidas YTD por formato e KPI ficam no estado ('somas_ytd') e são atualizadas só com
+# o mês novo, O(formatos x KPIs); realizado_ytd e saldo_restante saem delas sem somar de novo os
+# meses já fechados. As somas são refeitas por completo só quando os blocos mudam por outro
+# caminho (edição, importação), o que se percebe pela 'versao' do estado.
+
+
+def somas_ytd(plant_state: dict, planta: str) -> dict:
+    """Somas YTD mantidas no estado ({'realizado_ytd' (F, K), 'volume_total' (F,)}), refeitas só se estiverem velhas."""
+    mes = plant_state.get('mes_reforecast', 'Jun')
+    somas = plant_state.get('somas_ytd')
+    if somas is None or somas['versao'] != plant_state.get('versao') or somas['mes'] != mes:
+        idx_mes = MESES.index(mes)
+        fator = fatores_kpi(REGISTRO_PLANTAS[planta]['mascara_spoilage'])
+        volume = plant_state['volume']
+        liquido = (plant_state['aop'][:, :, :idx_mes + 1] / fator[:, None]) * volume[:, None, :idx_mes + 1]
+        somas = {
+            'versao': plant_state.get('versao'),
+            'mes': mes,
+            'realizado_ytd': liquido.sum(axis=-1),
+            'volume_total': volume.sum(axis=-1),
+        }
+        plant_state['somas_ytd'] = somas
+    return somas
+
+
+def _metas_planta(plant_state: dict, planta: str) -> dict:
+    """Reforecast dos formatos em uso e do Geral, com o realizado YTD das somas mantidas."""
+    n = len(plant_state['nomes_formatos'])
+    mascara_spoilage = REGISTRO_PLANTAS[planta]['mascara_spoilage']
+    somas = somas_ytd(plant_state, planta)
+    res = calcular_formatos(
+        plant_state['volume'][:n], plant_state['aop'][:n], MESES.index(plant_state.get('mes_reforecast', 'Jun')),
+        mascara_spoilage, realizado_ytd=somas['realizado_ytd'][:n],
+    )
+    res_geral = consolidar_geral({chave: res[chave] for chave in CHAVES_PARCIAIS}, mascara_spoilage)
+    res['saldo_restante'] = np.maximum(res['total_fy'] - res['realizado_ytd'], 0.0)
+    res.update(res_geral)
+    return res
+
+
+def fechar_mes(plant_state: dict, planta: str, realizados: dict) -> dict:
+    """
+    Fecha o mês seguinte ao mês do Reforecast: grava o realizado, avança o corte e recalcula as metas.
+
+    realizados: {formato: {'volume': valor, 'coeficientes': {kpi: valor}}}. Formatos, KPIs ou volume
+    ausentes (ou None) mantêm o que já está na planta para esse mês; valores vazios (NaN) ou infinitos
+    levantam ValueError, para não gravar NaN no realizado nem nas somas YTD.
+    Retorna {'mes_fechado', 'mes_reforecast', 'gravado_em', 'auditoria'}; cada linha da auditoria é
+    {'formato', 'kpi', 'campo', 'antes', 'depois'} (só o que mudou; o Geral aparece como formato 'Geral').
+    """
+    kpis = REGISTRO_PLANTAS[planta]['kpis']
+    nomes_formatos = list(plant_state['nomes_formatos'])
+    mes_atual = plant_state.get('mes_reforecast', 'Jun')
+    idx_fechado = MESES.index(mes_atual) + 1
+    if idx_fechado >= len(MESES):
+        raise ValueError(f"O Reforecast já está em {mes_atual}: não há mês seguinte para fechar.")
+    desconhecidos = [f for f in realizados if f not in nomes_formatos]
+    if desconhecidos:
+        raise ValueError(f"Formato(s) que não pertencem à planta: {', '.join(map(str, desconhecidos))}")
+    for formato, realizado in realizados.items():
+        fora = [k for k in realizado.get('coeficientes', {}) if k not in kpis]
+        if fora:
+            raise ValueError(f"{formato}: KPI(s) que não pertencem à planta: {', '.join(fora)}")
+        valores = {"Volume Total": realizado.get('volume'), **realizado.get('coeficientes', {})}
+        nao_finitos = [k for k, v in valores.items() if v is not None and not np.isfinite(float(v))]
+        if nao_finitos:
+            raise ValueError(f"{formato}: realizado vazio ou inválido em {', '.join(nao_finitos)}")
+
+    n = len(nomes_formatos)
+    antes = _metas_planta(plant_state, planta)
+    volume_antes = plant_state['volume'][:n, idx_fechado].copy()
+    coef_antes = plant_state['aop'][:n, :, idx_fechado].copy()
+
+    volume_novo, coef_novo = volume_antes.copy(), coef_antes.copy()
+    posicao = {kpi: k for k, kpi in enumerate(kpis)}
+    for formato, realizado in realizados.items():
+        f = nomes_formatos.index(formato)
+        if realizado.get('volume') is not None:
+            volume_novo[f] = float(realizado['volume'])
+        for kpi, valor in realizado.get('coeficientes', {}).items():
+            if valor is not None:
+                coef_novo[f, posicao[kpi]] = float(valor)
+
+    # Grava o mês fechado e atualiza as somas só com ele (sem somar de novo os meses anteriores)
+    somas = somas_ytd(plant_state, planta)
+    fator = fatores_kpi(REGISTRO_PLANTAS[planta]['mascara_spoilage'])
+    plant_state['volume'][:n, idx_fechado] = volume_novo
+    plant_state['aop'][:n, :, idx_fechado] = coef_novo
+    # Arrays novos: o resultado 'antes' ainda referencia as somas anteriores
+    realizado_ytd, volume_total = somas['realizado_ytd'].copy(), somas['volume_total'].copy()
+    realizado_ytd[:n] += (coef_novo / fator) * volume_novo[:, None]
+    volume_total[:n] += volume_novo - volume_antes
+    somas['realizado_ytd'], somas['volume_total'] = realizado_ytd, volume_total
+    plant_state['mes_reforecast'] = MESES[idx_fechado]
+    somas['mes'] = plant_state['mes_reforecast']
+    somas['versao'] = marcar_alteracao(plant_state)
+    depois = _metas_planta(plant_state, planta)
+
+    auditoria = []
+
+    def _auditar(formatos, linhas, campo, valores_antes, valores_depois):
+        valores_antes = np.asarray(valores_antes, dtype=float)
+        valores_depois = np.asarray(valores_depois, dtype=float)
+        for i, j in zip(*np.nonzero(~np.isclose(valores_antes, valores_depois, rtol=0.0, atol=1e-12))):
+            auditoria.append({'formato': formatos[i], 'kpi': linhas[j], 'campo': campo,
+                              'antes': float(valores_antes[i, j]), 'depois': float(valores_depois[i, j])})
+
+    _auditar(nomes_formatos, ["Volume Total"], 'volume', volume_antes[:, None], volume_novo[:, None])
+    _auditar(nomes_formatos, kpis, 'coeficiente', coef_antes, coef_novo)
+    for campo in ('realizado_ytd', 'saldo_restante', 'bloqueado', 'coef_anual_necessario'):
+        _auditar(nomes_formatos, kpis, campo, antes[campo], depois[campo])
+    _auditar(['Geral'], kpis, 'bloqueado', antes['geral_bloqueado'][None], depois['geral_bloqueado'][None])
+    _auditar(['Geral'], kpis, 'coef_anual_necessario', antes['geral_coef_anual'][None], depois['geral_coef_anual'][None])
+
+    return {
+        'mes_fechado': MESES[idx_fechado],
+        'mes_reforecast': plant_state['mes_reforecast'],
+        'gravado_em': datetime.now().isoformat(timespec='seconds'),
+        'auditoria': auditoria,
+    }
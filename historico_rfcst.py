@@ -0,0 +1,376 @@
+"""
+Histórico de ciclos do Reforecast: cada cálculo gravado por planta e ciclo, com consulta e comparação.
+
+Uso:
+    python historico_rfcst.py listar [--plantas BRJC ...]
+    python historico_rfcst.py diff <ciclo_a> <ciclo_b> [--plantas BRJC ...] [--nivel Geral|formatos]
+                                   [--so-alteracoes] [--saida diff.csv]
+
+O ciclo é um rótulo livre; o padrão é "<ano>-<mês do Reforecast>" (ex.: 2026-Jun, 2026-Set).
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from motor_reforecast import MESES, N_MESES
+
+# --- Histórico de ciclos (colunar, particionado por planta e ciclo) ---
+# Cada ciclo calculado de uma planta vira um arquivo <raiz>/<planta>/<ciclo>.npy com uma coluna por
+# grandeza: entradas (volume, aop, aop_show), coef_anual_necessario, metas, KPIs bloqueados e KPIs
+# com 'AOP ou Ciclo Anterior' aplicado, por formato e do Geral (nos KPIs de cálculo, antes da
+# conversão do gás). As colunas ficam contíguas num único vetor float64 e o indice.json guarda, além
+# dos metadados de cada partição, a posição e o formato de cada coluna: ler uma partição é uma
+# leitura de arquivo e as colunas são visões dela. Gravar de novo o mesmo ciclo substitui a partição.
+# O app e o batch_rfcst.py podem gravar ao mesmo tempo: a partição e a leitura-alteração-escrita do
+# índice são feitas sob um arquivo de trava (indice.lock) e todo arquivo é escrito num temporário
+# único e trocado com os.replace.
+
+VERSAO_HISTORICO = 1
+ARQUIVO_INDICE = "indice.json"
+ARQUIVO_TRAVA = "indice.lock"
+TRAVA_ABANDONADA_S = 30.0  # trava mais velha que isso é de um processo que morreu
+PERIODOS = ['FY'] + MESES
+CICLO_VALIDO = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]*')
+
+
+def ciclo_padrao(mes_reforecast: str, ano: int = None) -> str:
+    return f"{ano or datetime.now().year}-{mes_reforecast}"
+
+
+def ordem_ciclo(ciclo: str):
+    """Ordena rótulos "<ano>-<mês>" cronologicamente; os demais vão depois, em ordem alfabética."""
+    ano, _, mes = ciclo.partition('-')
+    if ano.isdigit() and mes in MESES:
+        return (0, int(ano), MESES.index(mes), '')
+    return (1, 0, 0, ciclo)
+
+
+def registro_ciclo(nomes_formatos: list, dados_formatos: dict, resultado: dict, kpis: list) -> dict:
+    """
+    Colunas gravadas no histórico a partir das entradas e do resultado de calcular_planta.
+    Formatos: (F, ...) na ordem de nomes_formatos; Geral: (K, ...).
+    """
+    def _bloco(tabela, linhas, colunas):
+        return np.stack([
+            dados_formatos[f][tabela].reindex(index=linhas, columns=colunas).to_numpy(dtype=float)
+            for f in nomes_formatos
+        ])
+
+    formatos = [resultado['formatos'][f] for f in nomes_formatos]
+    geral = resultado['geral']
+    return {
+        'volume': _bloco('volume', ["Volume Total"], MESES)[:, 0],
+        'aop': _bloco('aop', kpis, MESES + ['FY']),
+        'aop_show': _bloco('aop_show', kpis, MESES + ['FY']),
+        'coef_anual_necessario': np.stack([r['coef_anual_necessario'].reindex(kpis).to_numpy(dtype=float) for r in formatos]),
+        'metas_futuras': np.stack([r['metas_futuras'].reindex(index=kpis, columns=MESES).to_numpy(dtype=float) for r in formatos]),
+        'metas_exibidas': np.stack([r['metas_exibidas'].reindex(index=kpis, columns=MESES).to_numpy(dtype=float) for r in formatos]),
+        'bloqueado': np.stack([np.isin(kpis, list(r['bloqueado_por_kpi'])) for r in formatos]),
+        'aop_show_aplicado': np.stack([np.asarray(r['aop_show_aplicado'], dtype=bool) for r in formatos]),
+        'geral_coef_anual': geral['coef_anual_necessario'].reindex(kpis).to_numpy(dtype=float),
+        'geral_metas': geral['metas_futuras'].reindex(index=kpis, columns=MESES).to_numpy(dtype=float),
+        'geral_bloqueado': np.isin(kpis, list(resultado['kpis_bloqueados_no_geral'])),
+    }
+
+
+class HistoricoCiclos:
+    """Histórico em disco: um .npy por planta/ciclo e um índice JSON com os metadados e o layout das colunas."""
+
+    def __init__(self, raiz):
+        self.raiz = Path(raiz)
+        self._lock = threading.Lock()
+        self._indice = {}  # (planta, ciclo) -> metadados
+        self._mtime_indice = None
+
+    # Índice
+    def _caminho_indice(self) -> Path:
+        return self.raiz / ARQUIVO_INDICE
+
+    def _atualizar_indice(self):
+        """Relê o indice.json se outro processo o alterou."""
+        caminho = self._caminho_indice()
+        try:
+            mtime = caminho.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._indice, self._mtime_indice = {}, None
+            return
+        if mtime == self._mtime_indice:
+            return
+        with open(caminho, encoding='utf-8') as arquivo:
+            conteudo = json.load(arquivo)
+        self._indice = {(p['planta'], p['ciclo']): p for p in conteudo.get('particoes', [])}
+        self._mtime_indice = mtime
+
+    def _gravar_indice(self):
+        particoes = sorted(self._indice.values(), key=lambda p: (p['planta'], ordem_ciclo(p['ciclo'])))
+        conteudo = json.dumps({'versao': VERSAO_HISTORICO, 'particoes': particoes}, ensure_ascii=False, indent=1)
+        _substituir(self._caminho_indice(), lambda arquivo: arquivo.write(conteudo.encode('utf-8')))
+        self._mtime_indice = self._caminho_indice().stat().st_mtime_ns
+
+    @contextmanager
+    def _trava_indice(self, espera_s: float = 10.0):
+        """Trava entre threads e processos para ler, alterar e regravar o índice."""
+        caminho = self.raiz / ARQUIVO_TRAVA
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        limite = time.monotonic() + espera_s
+        with self._lock:
+            while True:
+                try:
+                    os.close(os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                    break
+                except FileExistsError:
+                    try:
+                        if time.time() - caminho.stat().st_mtime > TRAVA_ABANDONADA_S:
+                            caminho.unlink(missing_ok=True)
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if time.monotonic() > limite:
+                        raise TimeoutError(f"Histórico travado por outro processo ({caminho}).")
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                caminho.unlink(missing_ok=True)
+
+    def particoes(self, plantas=None, ciclos=None) -> list:
+        """Metadados das partições, filtrados por plantas e/ou ciclos, em ordem de planta e ciclo."""
+        with self._lock:
+            self._atualizar_indice()
+            selecionadas = [
+                p for p in self._indice.values()
+                if (plantas is None or p['planta'] in plantas) and (ciclos is None or p['ciclo'] in ciclos)
+            ]
+        return sorted(selecionadas, key=lambda p: (p['planta'], ordem_ciclo(p['ciclo'])))
+
+    def ciclos(self, planta: str = None) -> list:
+        return sorted({p['ciclo'] for p in self.particoes(None if planta is None else [planta])}, key=ordem_ciclo)
+
+    # Gravação e leitura
+    def registrar(self, planta: str, ciclo: str, mes_reforecast: str, nomes_formatos: list, kpis: list,
+                  colunas: dict) -> dict:
+        """Grava (ou substitui) a partição planta/ciclo com as colunas de registro_ciclo."""
+        if not CICLO_VALIDO.fullmatch(ciclo or ''):
+            raise ValueError(f"Rótulo de ciclo inválido: {ciclo!r} (use letras, números, '_', '-' ou '.', sem '.' no início)")
+        pasta = self.raiz / planta
+        pasta.mkdir(parents=True, exist_ok=True)
+        layout, inicio = {}, 0
+        for nome, valores in colunas.items():
+            valores = np.asarray(valores)
+            layout[nome] = [inicio, list(valores.shape), 'bool' if valores.dtype == bool else 'float64']
+            inicio += valores.size
+        vetor = np.concatenate([np.asarray(v, dtype=float).ravel() for v in colunas.values()])
+        metadados = {
+            'planta': planta,
+            'ciclo': ciclo,
+            'mes_reforecast': mes_reforecast,
+            'nomes_formatos': list(nomes_formatos),
+            'kpis': list(kpis),
+            'arquivo': f"{planta}/{ciclo}.npy",
+            'colunas': layout,
+            'gravado_em': datetime.now().isoformat(timespec='seconds'),
+        }
+        # Arquivo e índice sob a mesma trava: o layout gravado no índice é sempre o do arquivo em disco
+        with self._trava_indice():
+            _substituir(pasta / f"{ciclo}.npy", lambda arquivo: np.save(arquivo, vetor))
+            self._atualizar_indice()
+            self._indice[(planta, ciclo)] = metadados
+            self._gravar_indice()
+        return metadados
+
+    def carregar(self, metadados: dict) -> dict:
+        """Metadados da partição + todas as suas colunas (arrays)."""
+        vetor = np.load(self.raiz / metadados['arquivo'], allow_pickle=False)
+        registro = dict(metadados)
+        for nome, (inicio, forma, tipo) in metadados['colunas'].items():
+            coluna = vetor[inicio:inicio + int(np.prod(forma))].reshape(forma)
+            registro[nome] = coluna.astype(bool) if tipo == 'bool' else coluna
+        return registro
+
+    def carregar_ciclos(self, plantas=None, ciclos=None) -> list:
+        """Partições (metadados + colunas) das plantas e ciclos pedidos."""
+        return [self.carregar(p) for p in self.particoes(plantas, ciclos)]
+
+    def apagar(self, planta: str, ciclo: str):
+        with self._trava_indice():
+            self._atualizar_indice()
+            metadados = self._indice.pop((planta, ciclo), None)
+            if metadados is None:
+                return
+            (self.raiz / metadados['arquivo']).unlink(missing_ok=True)
+            self._gravar_indice()
+
+    # Consultas
+    def tabela_geral(self, plantas=None, ciclos=None):
+        """Tabela longa do Geral: planta, ciclo, kpi, bloqueado, FY (Necessário) e metas de Jan..Dez."""
+        import pandas as pd
+        registros = self.carregar_ciclos(plantas, ciclos)
+        if not registros:
+            return pd.DataFrame(columns=['planta', 'ciclo', 'mes_reforecast', 'kpi', 'bloqueado'] + PERIODOS)
+        tamanhos = [len(r['kpis']) for r in registros]
+        valores = np.concatenate([_valores_periodos(r['geral_coef_anual'], r['geral_metas'], r['mes_reforecast']) for r in registros])
+        tabela = pd.DataFrame({
+            'planta': np.repeat([r['planta'] for r in registros], tamanhos),
+            'ciclo': np.repeat([r['ciclo'] for r in registros], tamanhos),
+            'mes_reforecast': np.repeat([r['mes_reforecast'] for r in registros], tamanhos),
+            'kpi': np.concatenate([r['kpis'] for r in registros]),
+            'bloqueado': np.concatenate([r['geral_bloqueado'] for r in registros]),
+        })
+        return pd.concat([tabela, pd.DataFrame(valores, columns=PERIODOS)], axis=1)
+
+    def diferencas(self, ciclo_a: str, ciclo_b: str, plantas=None, nivel: str = 'Geral', so_alteracoes: bool = False):
+        """
+        Compara dois ciclos em todas as plantas que têm os dois (ou nas plantas pedidas).
+
+        nivel='Geral' compara o consolidado; nivel='formatos' compara os formatos de mesmo nome.
+        Retorna uma tabela longa: planta, formato, kpi, periodo (FY = Necessário, Jan..Dez = metas
+        exibidas), valor_a, valor_b, delta e o bloqueio em cada ciclo. Meses que não são futuros
+        num ciclo ficam vazios nele.
+        """
+        import pandas as pd
+        por_chave = {(r['planta'], r['ciclo']): r for r in self.carregar_ciclos(plantas, [ciclo_a, ciclo_b])}
+        rotulos, lados_a, lados_b = [], [], []
+        for planta in sorted({p for p, _ in por_chave}):
+            a, b = por_chave.get((planta, ciclo_a)), por_chave.get((planta, ciclo_b))
+            if a is None or b is None:
+                continue
+            kpis = list(a['kpis']) + [k for k in b['kpis'] if k not in a['kpis']]
+            for formato, lado_a, lado_b in _pares_nivel(a, b, nivel):
+                rotulos.append((planta, formato, kpis))
+                lados_a.append(_alinhar(lado_a, a['kpis'], kpis))
+                lados_b.append(_alinhar(lado_b, b['kpis'], kpis))
+
+        colunas = ['planta', 'formato', 'kpi', 'periodo', 'valor_a', 'valor_b', 'delta', 'bloqueado_a', 'bloqueado_b']
+        if not rotulos:
+            return pd.DataFrame(columns=colunas)
+        # Todas as plantas/formatos empilhados: (linhas, 13) de cada lado e uma única subtração
+        valores_a = np.concatenate([v for v, _ in lados_a])
+        valores_b = np.concatenate([v for v, _ in lados_b])
+        bloqueado_a = np.concatenate([m for _, m in lados_a])
+        bloqueado_b = np.concatenate([m for _, m in lados_b])
+        delta = valores_b - valores_a
+        n_periodos = len(PERIODOS)
+        tabela = pd.DataFrame({
+            'planta': np.repeat([p for p, _, k in rotulos for _ in k], n_periodos),
+            'formato': np.repeat([f for _, f, k in rotulos for _ in k], n_periodos),
+            'kpi': np.repeat([kpi for _, _, k in rotulos for kpi in k], n_periodos),
+            'periodo': np.tile(PERIODOS, len(valores_a)),
+            'valor_a': valores_a.ravel(),
+            'valor_b': valores_b.ravel(),
+            'delta': delta.ravel(),
+            'bloqueado_a': np.repeat(bloqueado_a, n_periodos),
+            'bloqueado_b': np.repeat(bloqueado_b, n_periodos),
+        }, columns=colunas)
+        if so_alteracoes:
+            alterado = (
+                ~np.isclose(tabela['valor_a'].to_numpy(), tabela['valor_b'].to_numpy(), rtol=0.0, atol=1e-9, equal_nan=True)
+                | (tabela['bloqueado_a'].to_numpy() != tabela['bloqueado_b'].to_numpy())
+            )
+            tabela = tabela[alterado].reset_index(drop=True)
+        return tabela
+
+
+def _substituir(destino: Path, escrever):
+    """Escreve num temporário único da mesma pasta e troca pelo destino com os.replace (atômico)."""
+    descritor, temporario = tempfile.mkstemp(prefix=f".{destino.name}.", suffix='.tmp', dir=destino.parent)
+    try:
+        with os.fdopen(descritor, 'wb') as arquivo:
+            escrever(arquivo)
+        os.replace(temporario, destino)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+
+
+def _valores_periodos(coef_anual, metas, mes_reforecast: str) -> np.ndarray:
+    """(..., K, 13): FY (Necessário) seguido das metas; meses que não são futuros no ciclo viram NaN."""
+    metas = np.where(np.arange(N_MESES) > MESES.index(mes_reforecast), metas, np.nan)
+    return np.concatenate([np.asarray(coef_anual, dtype=float)[..., None], metas], axis=-1)
+
+
+def _pares_nivel(a: dict, b: dict, nivel: str):
+    """(formato, (valores, bloqueado) de a, (valores, bloqueado) de b) a comparar."""
+    if nivel == 'Geral':
+        yield ('Geral',
+               (_valores_periodos(a['geral_coef_anual'], a['geral_metas'], a['mes_reforecast']), a['geral_bloqueado']),
+               (_valores_periodos(b['geral_coef_anual'], b['geral_metas'], b['mes_reforecast']), b['geral_bloqueado']))
+        return
+    if nivel != 'formatos':
+        raise ValueError(f"nivel deve ser 'Geral' ou 'formatos', não {nivel!r}")
+    valores_a = _valores_periodos(a['coef_anual_necessario'], a['metas_exibidas'], a['mes_reforecast'])
+    valores_b = _valores_periodos(b['coef_anual_necessario'], b['metas_exibidas'], b['mes_reforecast'])
+    for i, formato in enumerate(a['nomes_formatos']):
+        if formato in b['nomes_formatos']:
+            j = b['nomes_formatos'].index(formato)
+            yield formato, (valores_a[i], a['bloqueado'][i]), (valores_b[j], b['bloqueado'][j])
+
+
+def _alinhar(lado, kpis_origem, kpis_destino):
+    """Reordena (valores, bloqueado) para kpis_destino; KPIs ausentes no ciclo ficam NaN / False."""
+    valores, bloqueado = lado
+    kpis_origem = list(kpis_origem)
+    if kpis_origem == list(kpis_destino):
+        return valores, bloqueado
+    posicao = np.array([kpis_origem.index(k) if k in kpis_origem else -1 for k in kpis_destino])
+    presente = posicao >= 0
+    return (np.where(presente[:, None], valores[posicao], np.nan),
+            np.where(presente, bloqueado[posicao], False))
+
+
+def _abrir_historico_padrao():
+    """Histórico do servidor; RFCST_HISTORICO_PATH vazio desliga a gravação de ciclos."""
+    caminho = os.environ.get('RFCST_HISTORICO_PATH', str(Path(__file__).parent / "historico_rfcst"))
+    return HistoricoCiclos(caminho) if caminho else None
+
+
+HISTORICO = _abrir_historico_padrao()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta o histórico de ciclos do Reforecast.")
+    parser.add_argument('--historico', type=Path, help="Pasta do histórico (padrão: RFCST_HISTORICO_PATH)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    listar = sub.add_parser('listar', help="Ciclos gravados por planta")
+    listar.add_argument('--plantas', nargs='*')
+    diff = sub.add_parser('diff', help="Diferenças entre dois ciclos")
+    diff.add_argument('ciclo_a')
+    diff.add_argument('ciclo_b')
+    diff.add_argument('--plantas', nargs='*')
+    diff.add_argument('--nivel', default='Geral', choices=['Geral', 'formatos'])
+    diff.add_argument('--so-alteracoes', action='store_true', help="Só linhas com valor ou bloqueio diferente")
+    diff.add_argument('--saida', type=Path, help="Grava a tabela em CSV em vez de imprimir")
+    args = parser.parse_args(argv)
+
+    historico = HistoricoCiclos(args.historico) if args.historico else HISTORICO
+    if historico is None:
+        parser.error("Histórico desligado (RFCST_HISTORICO_PATH vazio); use --historico.")
+
+    if args.comando == 'listar':
+        for particao in historico.particoes(args.plantas or None):
+            print(f"{particao['planta']:<8}{particao['ciclo']:<12}{len(particao['nomes_formatos']):>3} formato(s)  "
+                  f"gravado em {particao['gravado_em']}")
+        return 0
+
+    inicio = time.perf_counter()
+    tabela = historico.diferencas(args.ciclo_a, args.ciclo_b, args.plantas or None, args.nivel, args.so_alteracoes)
+    tempo_ms = (time.perf_counter() - inicio) * 1000
+    if args.saida:
+        tabela.to_csv(args.saida, sep=';', decimal=',', index=False, encoding='utf-8-sig')
+        print(f"{len(tabela)} linha(s) gravadas em {args.saida} ({tempo_ms:.0f} ms)")
+    else:
+        print(tabela.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
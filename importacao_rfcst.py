@@ -0,0 +1,206 @@
+"""
+Importação em massa dos dados de entrada de uma planta (volume, aop e aop_show de todos os formatos).
+
+Aceita um ou mais arquivos .csv e/ou .xlsx no layout longo descrito no README:
+uma linha por formato/tabela/KPI, com as colunas formato, tabela, kpi, Jan..Dez e FY.
+Em planilhas, cada aba segue o mesmo layout (com o próprio cabeçalho) e as abas são somadas.
+"""
+import csv
+import io
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from motor_reforecast import MESES
+
+TABELAS_ENTRADA = ('volume', 'aop', 'aop_show')
+COLUNAS_CHAVE = ('formato', 'tabela', 'kpi')
+MAX_ERROS_EXIBIDOS = 20
+
+
+def _to_float_br(texto: str):
+    """Converte um texto com decimal brasileiro para float; None se não for possível."""
+    s = texto.strip().replace(" ", "")
+    if not s:
+        return np.nan
+    if ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+def corrige_decimais_df(df: pd.DataFrame):
+    """
+    Converte o DataFrame do editor para float aceitando decimal brasileiro
+    ("1.234,56": vírgula é o decimal, pontos são milhar, espaços são ignorados).
+
+    Se todas as colunas já são numéricas, nada é analisado; caso contrário só as células de
+    texto passam pelo parser, numa única passada pelo bloco. Retorna (df_float, celulas_invalidas), onde celulas_invalidas
+    lista (linha, coluna, valor) das células preenchidas que não puderam ser convertidas (textos e
+    também outros tipos, como datas vindas do Excel); elas ficam como NaN no resultado. Células vazias contam como NaN.
+    """
+    colunas_texto = [col for col, tipo in df.dtypes.items() if not pd.api.types.is_numeric_dtype(tipo)]
+    if not colunas_texto:
+        return df.astype(float), []
+
+    plano = df.to_numpy(dtype=object).ravel()
+    eh_texto = np.fromiter((isinstance(v, str) for v in plano), dtype=bool, count=plano.size)
+    convertidos = np.empty(plano.size, dtype=float)
+    nao_convertidas = np.zeros(plano.size, dtype=bool)
+    try:
+        convertidos[~eh_texto] = plano[~eh_texto].astype(float)
+    except (TypeError, ValueError):
+        # Tipos que não são número nem texto (ex.: datetime do openpyxl) viram NaN e são reportados
+        outros = pd.Series(plano[~eh_texto], dtype=object)
+        convertidos[~eh_texto] = pd.to_numeric(outros, errors='coerce')
+        nao_convertidas[~eh_texto] = outros.notna().to_numpy() & np.isnan(convertidos[~eh_texto])
+    celulas_invalidas = []
+    n_colunas = len(df.columns)
+    for pos in np.flatnonzero(eh_texto | nao_convertidas):
+        if nao_convertidas[pos]:
+            celulas_invalidas.append((df.index[pos // n_colunas], df.columns[pos % n_colunas], plano[pos]))
+            continue
+        valor = _to_float_br(plano[pos])
+        if valor is None:
+            celulas_invalidas.append((df.index[pos // n_colunas], df.columns[pos % n_colunas], plano[pos]))
+            valor = np.nan
+        convertidos[pos] = valor
+    return pd.DataFrame(convertidos.reshape(df.shape), index=df.index, columns=df.columns), celulas_invalidas
+
+def _blocos_csv(arquivo):
+    """Lê o CSV linha a linha (sem carregar o arquivo inteiro); separador ';' ou ','."""
+    nome = Path(getattr(arquivo, 'name', str(arquivo))).name
+    if isinstance(arquivo, (str, Path)):
+        texto = open(arquivo, newline='', encoding='utf-8-sig')
+    else:
+        arquivo.seek(0)
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        primeira = texto.readline()
+        delimitador = ';' if ';' in primeira else ','
+        cabecalho = next(csv.reader([primeira], delimiter=delimitador), [])
+        yield nome, cabecalho, csv.reader(texto, delimiter=delimitador)
+    finally:
+        if isinstance(arquivo, (str, Path)):
+            texto.close()
+        else:
+            texto.detach()
+
+
+def _blocos_excel(arquivo):
+    """Lê as abas da planilha em modo somente-leitura (streaming de linhas, sem montar o workbook em memória)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportError("A leitura de .xlsx requer o pacote openpyxl (pip install openpyxl).") from e
+    nome = Path(getattr(arquivo, 'name', str(arquivo))).name
+    if not isinstance(arquivo, (str, Path)):
+        arquivo.seek(0)
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            linhas = ws.iter_rows(values_only=True)
+            cabecalho = next(linhas, None)
+            if cabecalho is not None:
+                yield f"{nome}[{ws.title}]", cabecalho, linhas
+    finally:
+        wb.close()
+
+
+def _texto(valor) -> str:
+    return '' if valor is None else str(valor).strip()
+
+
+def ler_entrada_planta(arquivos, kpis: list, celulas_invalidas: list = None):
+    """
+    Lê os arquivos de uma planta e devolve (nomes_formatos, dados_formatos) no mesmo
+    formato que a interface guarda no plant_store.
+
+    arquivos: caminho ou arquivo aberto (ex.: upload do Streamlit), ou uma lista deles.
+    Os nomes de KPI são validados de uma vez contra `kpis`; todos os problemas encontrados
+    (colunas, tabelas ou KPIs desconhecidos, linhas duplicadas, células não numéricas)
+    são reunidos em um único ValueError.
+    Com uma lista em celulas_invalidas, as células não numéricas não geram erro: entram na lista como
+    (formato, tabela, kpi, coluna, valor) e, como os vazios, ficam NaN para a validação (validacao_rfcst).
+    """
+    if isinstance(arquivos, (str, Path)) or hasattr(arquivos, 'read'):
+        arquivos = [arquivos]
+
+    chaves, valores, origens, erros = [], [], [], []
+    for arquivo in arquivos:
+        extensao = Path(getattr(arquivo, 'name', str(arquivo))).suffix.lower()
+        blocos = _blocos_excel(arquivo) if extensao in ('.xlsx', '.xlsm') else _blocos_csv(arquivo)
+        for origem, cabecalho, linhas in blocos:
+            cabecalho = [_texto(c) for c in cabecalho]
+            faltando = [c for c in COLUNAS_CHAVE + tuple(MESES) if c not in cabecalho]
+            if faltando:
+                erros.append(f"{origem}: colunas ausentes: {', '.join(faltando)}")
+                continue
+            pos_chave = [cabecalho.index(c) for c in COLUNAS_CHAVE]
+            pos_valores = [cabecalho.index(c) for c in MESES] + [cabecalho.index('FY') if 'FY' in cabecalho else None]
+            for n_linha, linha in enumerate(linhas, start=2):
+                if not linha or all(_texto(v) == '' for v in linha):
+                    continue
+                linha = list(linha) + [None] * (len(cabecalho) - len(linha))
+                chaves.append([_texto(linha[p]) for p in pos_chave])
+                valores.append([linha[p] if p is not None else None for p in pos_valores])
+                origens.append(f"{origem}, linha {n_linha}")
+
+    if not chaves and not erros:
+        erros.append("Nenhuma linha de dados encontrada.")
+    tabela = pd.DataFrame(chaves, columns=list(COLUNAS_CHAVE))
+    if len(tabela):
+        tabela['tabela'] = tabela['tabela'].str.lower()
+
+        # Validação em bloco: tabelas e KPIs desconhecidos, linhas repetidas
+        tabelas_invalidas = sorted(set(tabela['tabela']) - set(TABELAS_ENTRADA))
+        if tabelas_invalidas:
+            erros.append(f"Tabela(s) desconhecida(s): {', '.join(tabelas_invalidas)} (use {', '.join(TABELAS_ENTRADA)})")
+        linhas_kpi = tabela['tabela'].isin(['aop', 'aop_show']).to_numpy()
+        kpis_invalidos = sorted(set(tabela.loc[linhas_kpi & ~tabela['kpi'].isin(kpis).to_numpy(), 'kpi']))
+        if kpis_invalidos:
+            erros.append(f"KPI(s) que não pertencem à planta: {', '.join(repr(k) for k in kpis_invalidos)}")
+        # A tabela de volume tem uma única linha por formato, qualquer que seja o rótulo da coluna kpi
+        chave_kpi = tabela['kpi'].where(tabela['tabela'] != 'volume', '')
+        repetidas = tabela.assign(kpi=chave_kpi).duplicated(keep=False).to_numpy()
+        for i in np.flatnonzero(repetidas):
+            erros.append(f"{origens[i]}: linha repetida para {tabela.at[i, 'formato']} / {tabela.at[i, 'tabela']} / {tabela.at[i, 'kpi']}")
+
+        numeros, invalidas = corrige_decimais_df(pd.DataFrame(valores, columns=MESES + ['FY'], dtype=object))
+        for linha, coluna, valor in invalidas:
+            if celulas_invalidas is None:
+                erros.append(f"{origens[linha]}, coluna {coluna}: valor não numérico '{valor}'")
+            else:
+                formato, tabela_linha, kpi = tabela.loc[linha, list(COLUNAS_CHAVE)]
+                celulas_invalidas.append((formato, tabela_linha, "Volume Total" if tabela_linha == 'volume' else kpi,
+                                          coluna, valor))
+
+    if erros:
+        excedente = len(erros) - MAX_ERROS_EXIBIDOS
+        mensagem = "\n".join(erros[:MAX_ERROS_EXIBIDOS])
+        if excedente > 0:
+            mensagem += f"\n... e mais {excedente} problema(s)."
+        raise ValueError(mensagem)
+
+    tabela = pd.concat([tabela, numeros if celulas_invalidas is not None else numeros.fillna(0.0)], axis=1)
+    nomes_formatos = list(dict.fromkeys(tabela['formato']))
+    dados_formatos = {}
+    for formato, linhas in tabela.groupby('formato', sort=False):
+        por_tabela = {t: linhas[linhas['tabela'] == t].set_index('kpi') for t in TABELAS_ENTRADA}
+
+        vol = por_tabela['volume']
+        serie_vol = vol[MESES].iloc[0].to_numpy() if len(vol) else 0.0
+        df_volume = pd.DataFrame([serie_vol], index=["Volume Total"], columns=MESES, dtype=float)
+
+        df_aop_show = por_tabela['aop_show'].reindex(index=kpis, columns=MESES + ['FY'], fill_value=0.0)
+        df_aop = por_tabela['aop'].reindex(index=kpis, columns=MESES + ['FY'], fill_value=0.0)
+        if len(por_tabela['aop_show']):
+            # Assim como na interface, o FY vem da tabela 'AOP ou Ciclo Anterior'
+            df_aop['FY'] = df_aop_show['FY']
+        else:
+            df_aop_show['FY'] = df_aop['FY']
+
+        dados_formatos[formato] = {'volume': df_volume, 'aop': df_aop, 'aop_show': df_aop_show}
+    return nomes_formatos, dados_formatos
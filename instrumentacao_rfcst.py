@@ -0,0 +1,58 @@
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+# --- Medição de tempo por etapa de cada rerun ---
+# Ligada por RFCST_TEMPOS=1 (ou, na interface, por ?debug=1 na URL). Desligada, cada marcação é
+# só um teste de booleano, sem relógio nem alocação.
+
+LOGGER = logging.getLogger('rfcst.tempos')
+if not LOGGER.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    LOGGER.addHandler(_handler)
+    LOGGER.setLevel(logging.INFO)
+    LOGGER.propagate = False
+
+
+def tempos_ativos_por_padrao() -> bool:
+    return os.environ.get('RFCST_TEMPOS', '').strip().lower() in ('1', 'true', 'sim')
+
+
+class Cronometro:
+    """
+    Cronômetro de voltas: marcar(nome) registra o tempo desde a marcação anterior.
+    Nomes repetidos (ex.: a mesma etapa em vários formatos) são somados.
+    """
+
+    def __init__(self, ativo: bool):
+        self.ativo = ativo
+        self.etapas = {}
+        self._inicio = self._ultimo = time.perf_counter() if ativo else 0.0
+
+    def marcar(self, nome: str):
+        if not self.ativo:
+            return
+        agora = time.perf_counter()
+        self.etapas[nome] = self.etapas.get(nome, 0.0) + (agora - self._ultimo)
+        self._ultimo = agora
+
+    def total(self) -> float:
+        return (self._ultimo - self._inicio) if self.ativo else 0.0
+
+    def registrar(self, **contexto) -> dict:
+        """Emite uma linha de log JSON com as etapas (ms) e o contexto (planta, número de formatos...)."""
+        if not self.ativo:
+            return {}
+        registro = {
+            'evento': 'rerun',
+            'data': datetime.now().isoformat(timespec='milliseconds'),
+            **contexto,
+            'total_ms': round(self.total() * 1000, 3),
+            'etapas_ms': {nome: round(segundos * 1000, 3) for nome, segundos in self.etapas.items()},
+        }
+        LOGGER.info(json.dumps(registro, ensure_ascii=False))
+        return registro
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from estado_rfcst import bytes_estado
+from store_rfcst import STORE_PLANTAS
+
+# --- Limite de memória do plant_store ---
+# Cada sessão guarda suas plantas em um PlantasSessao (da menos para a mais recente). O
+# REGISTRO_MEMORIA, único no processo, enxerga todas as sessões (por referência fraca: sessão
+# encerrada sai sozinha) e aplica dois limites: plantas residentes por sessão e orçamento de bytes
+# do servidor. A planta descartada é gravada antes em disco (store_rfcst) e recarregada quando for
+# selecionada de novo; sem persistência ela também é descartada (os limites valem sempre) e volta,
+# quando selecionada, com os valores padrão.
+
+LOGGER = logging.getLogger('rfcst.memoria')
+
+
+def bytes_objeto(valor) -> int:
+    """Bytes dos dados numéricos de um resultado guardado na sessão (arrays, DataFrames e contêineres)."""
+    if isinstance(valor, np.ndarray):
+        return valor.nbytes
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True))
+    if isinstance(valor, dict):
+        return sum(bytes_objeto(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(bytes_objeto(v) for v in valor)
+    return 0
+
+
+class PlantasSessao(OrderedDict):
+    """
+    plant_store de uma sessão: {planta: plant_state}, na ordem de uso (a última é a mais recente).
+    Os resultados derivados de cada planta (varredura, simulação...) ficam em 'anexos', para
+    entrarem na conta de memória e saírem junto com ela.
+    """
+
+    def __init__(self, plantas=None):
+        super().__init__(plantas or {})
+        self.anexos = {}
+        self.usos = {planta: time.monotonic() for planta in self}
+        self.bytes_por_planta = {}
+        self.descartes = 0
+        for planta in self:
+            self.atualizar_bytes(planta)
+
+    def atualizar_bytes(self, planta: str):
+        self.bytes_por_planta[planta] = bytes_estado(self[planta]) + bytes_objeto(self.anexos.get(planta, {}))
+
+    def bytes_total(self) -> int:
+        return sum(self.bytes_por_planta.values())
+
+
+class RegistroMemoria:
+    """Limites de plantas por sessão e de bytes no servidor, com descarte LRU e métricas."""
+
+    def __init__(self, max_plantas_sessao: int = 5, orcamento_bytes: int = 0, gravar=None):
+        self.max_plantas_sessao = max(1, int(max_plantas_sessao))
+        self.orcamento_bytes = max(0, int(orcamento_bytes))  # 0 = sem orçamento global
+        self.gravar = gravar  # gravar(planta, plant_state) antes do descarte; None = descarta sem gravar
+        self._sessoes = weakref.WeakValueDictionary()  # id(sessão) -> sessão
+        self._lock = threading.RLock()
+        self.descartes_sessao = 0
+        self.descartes_orcamento = 0
+
+    def nova_sessao(self, plantas=None) -> PlantasSessao:
+        sessao = PlantasSessao(plantas)
+        with self._lock:
+            self._sessoes[id(sessao)] = sessao
+        return sessao
+
+    def obter(self, sessao: PlantasSessao, planta: str):
+        """plant_state residente (marcado como o mais recente) ou None."""
+        with self._lock:
+            plant_state = sessao.get(planta)
+            if plant_state is not None:
+                sessao.move_to_end(planta)
+                sessao.usos[planta] = time.monotonic()
+            return plant_state
+
+    def guardar(self, sessao: PlantasSessao, planta: str, plant_state: dict):
+        """Guarda a planta como a mais recente da sessão e aplica os limites."""
+        with self._lock:
+            sessao[planta] = plant_state
+            sessao.move_to_end(planta)
+            sessao.usos[planta] = time.monotonic()
+            sessao.atualizar_bytes(planta)
+            self._aplicar_limites(sessao, planta)
+
+    def anexar(self, sessao: PlantasSessao, planta: str, nome: str, valor):
+        """Guarda um resultado derivado da planta (só enquanto ela estiver residente)."""
+        with self._lock:
+            if planta not in sessao:
+                return
+            sessao.anexos.setdefault(planta, {})[nome] = valor
+            sessao.atualizar_bytes(planta)
+            self._aplicar_limites(sessao, planta)
+
+    def _descartar(self, sessao: PlantasSessao, planta: str):
+        if self.gravar is not None:
+            self.gravar(planta, sessao[planta])
+        else:
+            LOGGER.info("Planta %s descartada da memória sem persistência: volta com os valores padrão.", planta)
+        del sessao[planta]
+        sessao.anexos.pop(planta, None)
+        sessao.usos.pop(planta, None)
+        sessao.bytes_por_planta.pop(planta, None)
+        sessao.descartes += 1
+
+    def _total_bytes(self) -> int:
+        return sum(sessao.bytes_total() for sessao in self._sessoes.values())
+
+    def _aplicar_limites(self, sessao: PlantasSessao, atual: str):
+        # 1) Limite por sessão: sai a planta usada há mais tempo (nunca a atual)
+        while len(sessao) > self.max_plantas_sessao:
+            mais_antiga = next(iter(sessao))
+            if mais_antiga == atual:
+                break
+            self._descartar(sessao, mais_antiga)
+            self.descartes_sessao += 1
+
+        # 2) Orçamento do servidor: LRU entre as plantas de todas as sessões
+        if not self.orcamento_bytes:
+            return
+        total = self._total_bytes()
+        if total <= self.orcamento_bytes:
+            return
+        candidatas = sorted(
+            ((s.usos.get(planta, 0.0), s, planta) for s in list(self._sessoes.values()) for planta in list(s)
+             if not (s is sessao and planta == atual)),
+            key=lambda item: item[0],
+        )
+        for _, s, planta in candidatas:
+            if total <= self.orcamento_bytes:
+                break
+            total -= s.bytes_por_planta.get(planta, 0)
+            self._descartar(s, planta)
+            self.descartes_orcamento += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            sessoes = list(self._sessoes.values())
+            por_sessao = [sessao.bytes_total() for sessao in sessoes]
+            residentes = sum(len(sessao) for sessao in sessoes)
+        return {
+            'sessoes': len(por_sessao),
+            'plantas_residentes': residentes,
+            'bytes_total': sum(por_sessao),
+            'bytes_sessao_media': (sum(por_sessao) / len(por_sessao)) if por_sessao else 0.0,
+            'bytes_sessao_max': max(por_sessao, default=0),
+            'orcamento_bytes': self.orcamento_bytes,
+            'max_plantas_sessao': self.max_plantas_sessao,
+            'descartes_sessao': self.descartes_sessao,
+            'descartes_orcamento': self.descartes_orcamento,
+            'persistencia': self.gravar is not None,
+        }
+
+
+REGISTRO_MEMORIA = RegistroMemoria(
+    max_plantas_sessao=int(os.environ.get('RFCST_PLANTAS_POR_SESSAO', 5)),
+    orcamento_bytes=int(float(os.environ.get('RFCST_MEMORIA_MAX_MB', 512)) * 1024 * 1024),
+    gravar=STORE_PLANTAS.salvar if STORE_PLANTAS is not None else None,
+)
@@ -0,0 +1,200 @@
+import numpy as np
+
+from config_rfcst import REGISTRO_PLANTAS
+from motor_reforecast import MESES, N_MESES, calcular_formatos, consolidar_geral, fatores_kpi
+from nucleo_rfcst import montar_blocos_formatos
+
+# --- Otimização do mix de formatos ---
+# O inverso da calculadora: com os coeficientes planejados de cada formato ('AOP ou Ciclo Anterior')
+# e o volume total de cada mês futuro, qual divisão do volume entre os formatos mantém o Geral de
+# cada KPI dentro do FY? Pelas mesmas contas do Geral (valores líquidos somados), o Geral do ano fecha
+# no FY quando sum_{f, m} x[f, m] * (coef[f, k, m] - FY[f, k]) / fator <= folga YTD[k], com x[f, m] =
+# mix[m, f] * volume total[m]. As incógnitas são o mix de cada mês (soma 1, entre os limites de cada
+# formato); o FY é anual, então os meses dividem a mesma folga. Resolvido só com NumPy, todos os meses juntos:
+#   1) gradiente projetado (FISTA) no excesso ao quadrado: a menor violação possível, se não houver mix viável;
+#   2) gradiente projetado no dual (um multiplicador por KPI), com os limites folgados por essa violação:
+#      o mix mais perto do atual. A projeção de cada mês no conjunto de mixes é exata e vetorizada.
+
+
+def _projetar_mix(v, minimo, maximo):
+    """Projeção de cada linha de v (N, F) em {s : soma(s) = 1, minimo <= s <= maximo}, exata (pontos de quebra)."""
+    # soma(clip(v - t, minimo, maximo)) é linear por partes e decrescente em t; as quebras são v - minimo e v - maximo
+    quebras = np.sort(np.concatenate([v - minimo, v - maximo], axis=-1), axis=-1)
+    somas = np.minimum(np.maximum(v[:, None, :] - quebras[:, :, None], minimo), maximo).sum(axis=-1)
+    linhas = np.arange(len(v))
+    j = np.clip((somas > 1.0).sum(axis=-1), 1, quebras.shape[-1] - 1)
+    t0, t1, g0, g1 = quebras[linhas, j - 1], quebras[linhas, j], somas[linhas, j - 1], somas[linhas, j]
+    queda = g0 - g1
+    t = np.where(queda > 0, t0 + (g0 - 1.0) * (t1 - t0) / np.where(queda > 0, queda, 1.0), t1)
+    return np.minimum(np.maximum(v - t[:, None], minimo), maximo)
+
+
+def otimizar_mix(volumes, coeficientes, coef_planejados, idx_mes_reforecast: int, mascara_spoilage,
+                 volume_total=None, minimo=None, maximo=None, iteracoes: int = 400, tolerancia: float = 1e-9) -> dict:
+    """
+    Divisão do volume futuro entre os formatos que mantém o Geral de cada KPI dentro do FY.
+
+    volumes (F, 12) e coeficientes (F, K, 13): como em calcular_formatos (YTD realizado e FY de cada formato).
+    coef_planejados (F, K, 12): coeficientes esperados de cada formato nos meses futuros.
+    volume_total (12,): volume total de cada mês (padrão: a soma atual dos formatos); só os meses futuros contam.
+    minimo / maximo (F,): participação mínima e máxima de cada formato no volume do mês (0 a 1).
+
+    KPIs bloqueados no Geral ou sem FY ficam fora das restrições (ativo (K,) False). Sem mix viável, fica o
+    de menor excesso. Retorna mix (F, 12), volumes (F, 12), viavel (bool), dentro_fy (K,), geral_mes (K, 12)
+    e, com o mix atual e com o otimizado, o FY do Geral (fy_geral_atual, fy_geral) e o coeficiente anual
+    projetado do Geral (geral_projetado_atual, geral_projetado), (K,).
+    """
+    vol = np.where(np.isnan(np.asarray(volumes, dtype=float)), 0.0, np.asarray(volumes, dtype=float))
+    coef = np.asarray(coeficientes, dtype=float)
+    plano = np.where(np.isnan(np.asarray(coef_planejados, dtype=float)), 0.0, np.asarray(coef_planejados, dtype=float))
+    n_formatos = vol.shape[0]
+    fator = fatores_kpi(mascara_spoilage)
+    fy = np.where(np.isnan(coef[..., N_MESES]), 0.0, coef[..., N_MESES])
+    futuro = np.arange(N_MESES) > idx_mes_reforecast
+    minimo = np.zeros(n_formatos) if minimo is None else np.asarray(minimo, dtype=float)
+    maximo = np.ones(n_formatos) if maximo is None else np.asarray(maximo, dtype=float)
+    if minimo.sum() > 1.0 + 1e-12 or maximo.sum() < 1.0 - 1e-12 or (minimo > maximo).any():
+        raise ValueError("Limites de participação incompatíveis: a soma dos mínimos deve ser <= 100% e a dos máximos >= 100%.")
+
+    total = vol.sum(axis=0) if volume_total is None else np.asarray(volume_total, dtype=float)
+    total = np.where(futuro, np.maximum(np.nan_to_num(total), 0.0), 0.0)
+    meses = np.flatnonzero(total > 0)
+
+    res = calcular_formatos(vol, coef, idx_mes_reforecast, mascara_spoilage)
+    geral = consolidar_geral(res, mascara_spoilage)
+    ativo = ~geral['geral_bloqueado'] & (fy > 0).any(axis=0)
+    volume_ytd = vol[:, ~futuro].sum(axis=-1)
+    # Folga YTD do Geral (FY do volume já produzido - realizado), em valor líquido, e o limite por unidade de volume
+    folga = ((fy / fator) * volume_ytd[:, None] - res['realizado_ytd']).sum(axis=0)
+    b = fator * folga / total.sum() if total.sum() > 0 else np.zeros_like(folga)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mix_atual = np.where(vol.sum(axis=0) > 0, vol / vol.sum(axis=0), 1.0 / n_formatos)
+    mix_atual = _projetar_mix(mix_atual.T, minimo, maximo).T
+    mix = mix_atual.copy()
+
+    if len(meses) and ativo.any():
+        # G[m, k, f] = peso do mês x (coef planejado - FY), com b, por KPI normalizado (escalas bem diferentes)
+        peso = total[meses] / total.sum()
+        G = peso[:, None, None] * (plano[:, ativo][:, :, meses].transpose(2, 1, 0) - fy[:, ativo].T[None])
+        b_ativo = b[ativo]
+        escala = np.maximum(np.abs(G).sum(axis=(0, 2)), np.abs(b_ativo))
+        escala = np.where(escala > 0, escala, 1.0)
+        G, b_ativo = G / escala[:, None], b_ativo / escala
+        passo = 1.0 / max(np.linalg.norm(G.transpose(1, 0, 2).reshape(len(b_ativo), -1), ord=2), 1e-12) ** 2
+        s0 = mix_atual[:, meses].T
+
+        def _restricoes(s):
+            return np.einsum('mkf,mf->k', G, s) - b_ativo
+
+        # 1) Menor violação: min ||max(0, G s - b)||² no conjunto dos mixes
+        s, y, t = s0, s0, 1.0
+        for _ in range(iteracoes):
+            s_novo = _projetar_mix(y - passo * np.einsum('mkf,k->mf', G, np.maximum(_restricoes(y), 0.0)), minimo, maximo)
+            t_novo = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+            y = s_novo + ((t - 1.0) / t_novo) * (s_novo - s)
+            parou = np.abs(s_novo - s).max() <= tolerancia
+            s, t = s_novo, t_novo
+            if parou:
+                break
+        s_menor_violacao = s
+        folga_extra = np.maximum(_restricoes(s), 0.0) + tolerancia
+
+        # 2) Mix mais perto do atual que respeita os limites: gradiente projetado (acelerado) no dual.
+        # Só para quando o multiplicador estabiliza e o mix dele já respeita as restrições (folgadas).
+        lam = mu = np.zeros(len(b_ativo))
+        t = 1.0
+        for _ in range(iteracoes):
+            s = _projetar_mix(s0 - np.einsum('mkf,k->mf', G, mu), minimo, maximo)
+            lam_novo = np.maximum(mu + passo * (_restricoes(s) - folga_extra), 0.0)
+            t_novo = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+            mu = lam_novo + ((t - 1.0) / t_novo) * (lam_novo - lam)
+            estavel = np.abs(lam_novo - lam).max() <= tolerancia
+            lam, t = lam_novo, t_novo
+            if estavel and (_restricoes(_projetar_mix(s0 - np.einsum('mkf,k->mf', G, lam), minimo, maximo)) <= folga_extra).all():
+                break
+        s = _projetar_mix(s0 - np.einsum('mkf,k->mf', G, lam), minimo, maximo)
+        # Se o dual esgotou as iterações com o mix ainda fora das restrições, fica o mix de menor violação (fase 1)
+        mix[:, meses] = (s if (_restricoes(s) <= folga_extra).all() else s_menor_violacao).T
+
+    mix[:, ~futuro] = mix_atual[:, ~futuro]
+    volumes_otimizados = np.where(futuro, mix * total, vol)
+
+    def _projecao(volumes_cenario):
+        # Geral do ano: realizado YTD + planejado futuro, sobre o volume do ano; e o FY do Geral com esse volume
+        volume_ano = volumes_cenario.sum(axis=-1)
+        liquido = res['realizado_ytd'].sum(axis=0) + np.einsum('fkm,fm->k', plano / fator[:, None], np.where(futuro, volumes_cenario, 0.0))
+        fy_geral = ((fy / fator) * volume_ano[:, None]).sum(axis=0)
+        base = max(volume_ano.sum(), 1e-300)
+        return fator * fy_geral / base, fator * liquido / base
+
+    fy_atual, projetado_atual = _projecao(np.where(futuro, mix_atual * total, vol))
+    fy_otimizado, projetado = _projecao(volumes_otimizados)
+    dentro = projetado <= fy_otimizado + 1e-6 * np.maximum(np.abs(fy_otimizado), 1.0)
+    return {
+        'mix': mix,
+        'volumes': volumes_otimizados,
+        'viavel': bool((dentro | ~ativo).all()),
+        'ativo': ativo,
+        'dentro_fy': dentro & ativo,
+        # Coeficiente do Geral em cada mês futuro com o mix otimizado (média dos planejados, pesada pelo volume)
+        'geral_mes': np.where(futuro, np.einsum('fkm,fm->km', plano, mix), 0.0),
+        'fy_geral_atual': fy_atual,
+        'geral_projetado_atual': projetado_atual,
+        'fy_geral': fy_otimizado,
+        'geral_projetado': projetado,
+    }
+
+
+def otimizar_mix_planta(planta: str, nomes_formatos: list, dados_formatos: dict, mes_reforecast: str,
+                        volume_total=None, limites=None) -> dict:
+    """
+    otimizar_mix a partir das tabelas da planta. Os coeficientes planejados são os meses de 'AOP ou Ciclo
+    Anterior'; células vazias ou zeradas caem nos 'Coeficientes YTD + Ciclo Anterior' do mesmo mês.
+    volume_total: {mês futuro: volume}; os meses ausentes ficam com a soma atual dos formatos.
+    limites: {formato: (mínimo, máximo)} em participação (0 a 1) do volume de cada mês.
+    Retorna 'viavel', as tabelas 'volumes' e 'mix' (%) (formatos x meses futuros), 'kpis' (FY e Geral
+    projetado do ano, com o mix atual e o otimizado) e 'geral_mes' (Geral de cada mês com o mix otimizado).
+    """
+    import pandas as pd
+    cfg_planta = REGISTRO_PLANTAS[planta]
+    kpis_da_planta = cfg_planta['kpis']
+    idx_mes = MESES.index(mes_reforecast)
+    colunas_futuro = MESES[idx_mes + 1:]
+    volumes = {f: dados_formatos[f]['volume'] for f in nomes_formatos}
+    aops = {f: dados_formatos[f]['aop'] for f in nomes_formatos}
+    vol_bloco, coef_bloco = montar_blocos_formatos(nomes_formatos, volumes, aops, kpis_da_planta)
+    plano = np.stack([
+        dados_formatos[f]['aop_show'].reindex(index=kpis_da_planta, columns=MESES).to_numpy(dtype=float)
+        for f in nomes_formatos
+    ])
+    plano = np.where(np.isnan(plano) | (plano == 0), coef_bloco[..., :N_MESES], plano)
+    total = vol_bloco.sum(axis=0)
+    for mes, valor in (volume_total or {}).items():
+        total[MESES.index(mes)] = valor
+    limites = limites or {}
+    minimo = np.array([limites.get(f, (0.0, 1.0))[0] for f in nomes_formatos], dtype=float)
+    maximo = np.array([limites.get(f, (0.0, 1.0))[1] for f in nomes_formatos], dtype=float)
+
+    res = otimizar_mix(vol_bloco, coef_bloco, plano, idx_mes, cfg_planta['mascara_spoilage'],
+                       volume_total=total, minimo=minimo, maximo=maximo)
+
+    # Gás na unidade exibida (Thermal); os demais KPIs como no cálculo
+    escala = np.ones(len(kpis_da_planta))
+    if cfg_planta['idx_gas'] is not None:
+        escala[cfg_planta['idx_gas']] = cfg_planta['fator_gas']
+    nomes = cfg_planta['nomes_exibicao']
+    kpis = pd.DataFrame({
+        "FY Geral (mix atual)": res['fy_geral_atual'] * escala,
+        "Projetado (mix atual)": res['geral_projetado_atual'] * escala,
+        "FY Geral (otimizado)": res['fy_geral'] * escala,
+        "Projetado (otimizado)": res['geral_projetado'] * escala,
+    }, index=nomes)
+    kpis["Situação"] = np.where(~res['ativo'], "Sem restrição", np.where(res['dentro_fy'], "Dentro do FY", "Acima do FY"))
+    return {
+        'viavel': res['viavel'],
+        'volumes': pd.DataFrame(res['volumes'][:, idx_mes + 1:], index=nomes_formatos, columns=colunas_futuro),
+        'mix': pd.DataFrame(res['mix'][:, idx_mes + 1:] * 100, index=nomes_formatos, columns=colunas_futuro),
+        'kpis': kpis,
+        'geral_mes': pd.DataFrame(res['geral_mes'][:, idx_mes + 1:] * escala[:, None], index=nomes, columns=colunas_futuro),
+    }
@@ -0,0 +1,362 @@
+import numpy as np
+
+# --- Motor vetorizado do Reforecast ---
+# Trabalha sobre blocos NumPy (formatos x KPIs x meses) em vez de Series do pandas,
+# reproduzindo as mesmas regras da calculadora (bloqueio, saldo, rateio das metas e Geral).
+
+# MESES abreviados
+MESES = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+         'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+N_MESES = len(MESES)
+EPS_BLOQUEIO = 1e-9
+
+
+def fatores_kpi(mascara_spoilage) -> np.ndarray:
+    """Fator de conversão coeficiente <-> valor líquido: 100 para Spoilage (%), 1 para os demais."""
+    return np.where(np.asarray(mascara_spoilage, dtype=bool), 100.0, 1.0)
+
+
+# Somas parciais aditivas de cada formato, a partir das quais o Geral é consolidado
+CHAVES_PARCIAIS = ('bloqueado', 'realizado_ytd', 'total_fy', 'liquido_futuro', 'volume_futuro')
+
+
+def calcular_formatos(volumes, coeficientes, idx_mes_reforecast: int, mascara_spoilage, realizado_ytd=None) -> dict:
+    """
+    Calcula o reforecast de cada formato de forma independente.
+
+    volumes: (formatos, 12) - volume mensal de produção; aceita eixos extras à esquerda
+             (ex.: (simulações, formatos, 12)), propagados para todas as saídas
+    coeficientes: (formatos, KPIs, 13) - 12 meses (YTD realizado + meta futura) e FY na última posição
+    idx_mes_reforecast: índice (0-11) do último mês YTD
+    mascara_spoilage: (KPIs,) - True para KPIs em percentual
+    realizado_ytd: (F, K) opcional - soma líquida YTD já apurada (ex.: mantida pelo fechamento do mês);
+                   se vier, os meses YTD não são somados de novo
+
+    Retorna coef_anual_necessario (F, K), metas_futuras (F, K, 12) e as somas parciais
+    de CHAVES_PARCIAIS: bloqueado (F, K), realizado_ytd (F, K), total_fy (F, K),
+    liquido_futuro (F, K, 12) e volume_futuro (F, 12).
+    """
+    vol = np.asarray(volumes, dtype=float)
+    coef = np.asarray(coeficientes, dtype=float)
+    vol = np.where(np.isnan(vol), 0.0, vol)
+    coef_mes = np.where(np.isnan(coef[..., :N_MESES]), 0.0, coef[..., :N_MESES])
+    fy = coef[..., N_MESES]
+    fator = fatores_kpi(mascara_spoilage)
+
+    meses = np.arange(N_MESES)
+    mask_ytd = meses <= idx_mes_reforecast
+    mask_fut = ~mask_ytd
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Valor líquido mensal (coef x volume) de cada formato/KPI
+        liquido = (coef_mes / fator[:, None]) * vol[..., None, :]
+        if realizado_ytd is None:
+            realizado_ytd = np.nansum(np.where(mask_ytd, liquido, 0.0), axis=-1)
+            realizado_ytd = np.where(np.isfinite(realizado_ytd), realizado_ytd, 0.0)
+        else:
+            realizado_ytd = np.asarray(realizado_ytd, dtype=float)
+        total_fy = (fy / fator) * vol.sum(axis=-1)[..., None]
+        total_fy = np.where(np.isfinite(total_fy), total_fy, 0.0)
+        vol_fut_mes = np.where(mask_fut, vol, 0.0)
+        estimado = np.where(mask_fut, liquido, 0.0)
+        total_estimado = np.nansum(estimado, axis=-1)
+
+    return _ratear_saldo(realizado_ytd, total_fy, vol, vol_fut_mes, estimado, total_estimado, mask_fut, fator)
+
+
+def _ratear_saldo(realizado_ytd, total_fy, vol, vol_fut_mes, estimado, total_estimado, mask_fut, fator) -> dict:
+    """
+    Regras comuns a calcular_formatos e calcular_varredura, a partir das somas já apuradas.
+
+    Aceita eixos extras à esquerda (ex.: escala x mês de corte): realizado_ytd, total_fy e
+    total_estimado (..., F, K); vol e vol_fut_mes (..., F, 12); estimado (..., F, K, 12);
+    mask_fut compatível com (..., F, K, 12).
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        bloqueado = (total_fy > 0) & (
+            (realizado_ytd > total_fy) | (np.abs(realizado_ytd - total_fy) <= EPS_BLOQUEIO)
+        )
+        saldo_restante = np.maximum(total_fy - realizado_ytd, 0.0)
+
+        vol_fut = vol_fut_mes.sum(axis=-1)
+        ativo = ~bloqueado & (vol_fut[..., None] > 0.0) & (saldo_restante > 0.0)
+
+        # Rateio do saldo pelos meses futuros: proporcional ao estimado (coef x volume)
+        # ou, se não houver estimado, proporcional ao volume.
+        usa_estimado = total_estimado > 0.0
+        proporcao = np.where(
+            usa_estimado[..., None],
+            estimado / np.where(usa_estimado, total_estimado, 1.0)[..., None],
+            vol_fut_mes[..., None, :] / np.where(vol_fut > 0, vol_fut, 1.0)[..., None, None],
+        )
+        proporcao = np.where(np.isnan(proporcao), 0.0, proporcao)
+        metas_valor = proporcao * saldo_restante[..., None]
+        metas_coef = metas_valor / vol[..., None, :]
+        metas_coef = np.where(np.isfinite(metas_coef), metas_coef, 0.0) * fator[:, None]
+        metas_futuras = np.where(ativo[..., None] & mask_fut, metas_coef, 0.0)
+
+        coef_anual = np.where(
+            ativo, (saldo_restante / np.where(vol_fut > 0, vol_fut, 1.0)[..., None]) * fator, 0.0
+        )
+        liquido_futuro = (metas_futuras / fator[:, None]) * vol_fut_mes[..., None, :]
+
+    return {
+        'coef_anual_necessario': coef_anual,
+        'metas_futuras': metas_futuras,
+        'bloqueado': bloqueado,
+        'realizado_ytd': realizado_ytd,
+        'total_fy': total_fy,
+        'liquido_futuro': liquido_futuro,
+        'volume_futuro': vol_fut_mes,
+    }
+
+
+def consolidar_geral(parciais: dict, mascara_spoilage) -> dict:
+    """
+    Consolida o Geral somando as parciais de CHAVES_PARCIAIS dos formatos (empilhadas no eixo F).
+
+    Aceita eixos extras à esquerda, como em _ratear_saldo. KPIs com estouro em qualquer
+    formato ficam suprimidos no Geral.
+    """
+    fator = fatores_kpi(mascara_spoilage)
+    bloqueado = np.asarray(parciais['bloqueado'], dtype=bool)
+    volume_futuro = np.asarray(parciais['volume_futuro'], dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        geral_bloqueado = bloqueado.any(axis=-2)
+        realizado_ytd_total = np.where(bloqueado, 0.0, parciais['realizado_ytd']).sum(axis=-2)
+        total_fy_total = np.where(bloqueado, 0.0, parciais['total_fy']).sum(axis=-2)
+        saldo_geral = np.maximum(total_fy_total - realizado_ytd_total, 0.0)
+        vol_fut_total = volume_futuro.sum(axis=(-2, -1))[..., None]
+        geral_coef_anual = np.where(
+            geral_bloqueado | ~(vol_fut_total > 0), 0.0,
+            (saldo_geral / np.where(vol_fut_total > 0, vol_fut_total, 1.0)) * fator,
+        )
+
+        vol_fut_mes_total = volume_futuro.sum(axis=-2)
+        liquido_mes = np.where(bloqueado[..., None], 0.0, parciais['liquido_futuro']).sum(axis=-3)
+        # Meses YTD não têm volume futuro: 0/0 -> 0
+        coef_geral_mes = liquido_mes / vol_fut_mes_total[..., None, :]
+        coef_geral_mes = np.where(np.isnan(coef_geral_mes), 0.0, coef_geral_mes) * fator[:, None]
+        geral_metas = np.where(geral_bloqueado[..., None], 0.0, coef_geral_mes)
+
+    return {
+        'geral_coef_anual': geral_coef_anual,
+        'geral_metas': geral_metas,
+        'geral_bloqueado': geral_bloqueado,
+    }
+
+
+def calcular_reforecast(volumes, coeficientes, idx_mes_reforecast: int, mascara_spoilage) -> dict:
+    """
+    Calcula o reforecast de todos os formatos e KPIs de uma planta de uma só vez.
+
+    Mesmas entradas de calcular_formatos. Retorna os arrays por formato
+    (coef_anual_necessario, metas_futuras, bloqueado e as somas parciais) e o
+    consolidado Geral (geral_coef_anual, geral_metas, geral_bloqueado).
+    """
+    res = calcular_formatos(volumes, coeficientes, idx_mes_reforecast, mascara_spoilage)
+    res.update(consolidar_geral(res, mascara_spoilage))
+    return res
+
+
+def sensibilidade_reforecast(volumes, coeficientes, idx_mes_reforecast: int, mascara_spoilage) -> dict:
+    """
+    Derivadas analíticas das saídas do reforecast em relação ao volume mensal (V) e aos coeficientes
+    realizados YTD (c) de cada formato, em uma única passada, sem recalcular.
+
+    Segue os ramos de _ratear_saldo: KPI bloqueado, sem saldo ou sem volume futuro tem a saída fixa em 0
+    (derivada 0), assim como a meta de um mês sem volume; o rateio pode ser pelo estimado (meta_j =
+    c_j x saldo / estimado) ou pelo volume (meta_j = Necessário). As entradas ficam nos últimos eixos
+    (formato de entrada, mês); cada formato só depende das próprias entradas e cada KPI só do próprio c:
+      coef_anual_dV, coef_anual_dc (F, K, 12): d coef_anual_necessario[f, k] / d V[f, m] e / d c[f, k, m]
+      metas_dV, metas_dc (F, K, 12, 12): d metas_futuras[f, k, j] / d V[f, m] e / d c[f, k, m]
+      geral_coef_anual_dV, geral_coef_anual_dc (K, F, 12): d geral_coef_anual[k] / d V[g, m] e / d c[g, k, m]
+      geral_metas_dV, geral_metas_dc (K, 12, F, 12): d geral_metas[k, j] / d V[g, m] e / d c[g, k, m]
+    Devolve também o próprio reforecast (calcular_reforecast) em 'resultado'.
+    """
+    vol = np.asarray(volumes, dtype=float)
+    coef = np.asarray(coeficientes, dtype=float)
+    vol = np.where(np.isnan(vol), 0.0, vol)
+    coef_mes = np.where(np.isnan(coef[..., :N_MESES]), 0.0, coef[..., :N_MESES])
+    fy = np.where(np.isnan(coef[..., N_MESES]), 0.0, coef[..., N_MESES])
+    fator = fatores_kpi(mascara_spoilage)
+    res = calcular_reforecast(vol, coef, idx_mes_reforecast, mascara_spoilage)
+
+    meses = np.arange(N_MESES)
+    ytd = meses <= idx_mes_reforecast
+    fut = ~ytd
+    vol_fut = np.where(fut, vol, 0.0)
+
+    def _seguro(x):
+        return np.where(x > 0, x, 1.0)
+
+    saldo = np.maximum(res['total_fy'] - res['realizado_ytd'], 0.0)
+    ativo = ~res['bloqueado'] & (vol_fut.sum(axis=-1)[:, None] > 0) & (saldo > 0)
+    vf = _seguro(vol_fut.sum(axis=-1))[:, None, None]
+    coef_anual = res['coef_anual_necessario']
+
+    # Saldo = FY/fator x volume do ano - realizado YTD: dS/dV_m = (FY - c_m [YTD]) / fator, dS/dc_m = -V_m [YTD] / fator
+    dS_dV = (fy[..., None] - np.where(ytd, coef_mes, 0.0)) / fator[:, None]
+    dS_dc = -np.where(ytd, vol, 0.0)[:, None, :] / fator[:, None]
+    # coef_anual = fator x S / volume futuro
+    coef_anual_dV = np.where(ativo[..., None], (fator[:, None] * dS_dV - fut * coef_anual[..., None]) / vf, 0.0)
+    coef_anual_dc = np.where(ativo[..., None], fator[:, None] * dS_dc / vf, 0.0)
+
+    # Metas (j = mês da meta, m = mês da entrada)
+    estimado = (np.where(fut, coef_mes, 0.0) / fator[:, None] * vol[:, None, :]).sum(axis=-1)
+    usa_estimado = estimado > 0
+    e = _seguro(estimado)[..., None, None]
+    c_j = np.where(fut, coef_mes, 0.0)[..., :, None]
+    metas_dV_est = (c_j / e) * (dS_dV[..., None, :] - fut * saldo[..., None, None] * coef_mes[..., None, :]
+                                / (fator[:, None, None] * e))
+    metas_dc_est = (c_j / e) * dS_dc[..., None, :]
+    metas_dV = np.where(usa_estimado[..., None, None], metas_dV_est, coef_anual_dV[..., None, :])
+    metas_dc = np.where(usa_estimado[..., None, None], metas_dc_est, coef_anual_dc[..., None, :])
+    com_meta = ativo[..., None] & fut & (vol[:, None, :] > 0)
+    metas_dV = np.where(com_meta[..., None], metas_dV, 0.0)
+    metas_dc = np.where(com_meta[..., None], metas_dc, 0.0)
+
+    # Geral: as mesmas contas sobre as somas dos formatos (com o Geral ativo, nenhum formato está bloqueado)
+    saldo_geral = np.maximum((res['total_fy'] - res['realizado_ytd']).sum(axis=0), 0.0)
+    vf_geral = vol_fut.sum()
+    geral_ativo = ~res['geral_bloqueado'] & (vf_geral > 0) & (saldo_geral > 0)
+    geral_coef_anual_dV = np.where(
+        geral_ativo[:, None, None],
+        (fator[:, None, None] * dS_dV.transpose(1, 0, 2) - fut * res['geral_coef_anual'][:, None, None]) / _seguro(vf_geral),
+        0.0,
+    )
+    geral_coef_anual_dc = np.where(geral_ativo[:, None, None],
+                                   fator[:, None, None] * dS_dc.transpose(1, 0, 2) / _seguro(vf_geral), 0.0)
+    # geral_metas_j = soma_f meta[f, j] x V[f, j] / W_j, W_j = volume do mês
+    w = vol_fut.sum(axis=0)
+    peso = (vol_fut / _seguro(w))[:, None, :, None]
+    metas = res['metas_futuras']
+    diagonal = np.eye(N_MESES)[None, :, None, :] * (
+        (metas.transpose(1, 2, 0) - res['geral_metas'][..., None]) / _seguro(w)[None, :, None]
+    )[..., None]
+    com_meta_geral = (geral_ativo[:, None] & fut & (w > 0))[..., None, None]
+    geral_metas_dV = np.where(com_meta_geral, (metas_dV * peso).transpose(1, 2, 0, 3) + diagonal, 0.0)
+    geral_metas_dc = np.where(com_meta_geral, (metas_dc * peso).transpose(1, 2, 0, 3), 0.0)
+
+    return {
+        'coef_anual_dV': coef_anual_dV,
+        'coef_anual_dc': coef_anual_dc,
+        'metas_dV': metas_dV,
+        'metas_dc': metas_dc,
+        'geral_coef_anual_dV': geral_coef_anual_dV,
+        'geral_coef_anual_dc': geral_coef_anual_dc,
+        'geral_metas_dV': geral_metas_dV,
+        'geral_metas_dc': geral_metas_dc,
+        'resultado': res,
+    }
+
+
+def calcular_varredura(volumes, coeficientes, mascara_spoilage, escalas_volume=(1.0,)) -> dict:
+    """
+    Reforecast para todos os meses de corte (Jan..Dez) e, opcionalmente, para uma grade de
+    fatores de escala do volume futuro, em uma única passada.
+
+    As somas YTD e futuras de cada corte saem de somas acumuladas (cumsum) ao longo dos meses,
+    em vez de refatiar as colunas para cada mês. Mesmas entradas de calcular_formatos (sem o mês).
+
+    Retorna o cubo com eixos (escala, corte, ...): coef_anual_necessario (S, 12, F, K),
+    metas_futuras (S, 12, F, K, 12), bloqueado (S, 12, F, K), geral_coef_anual (S, 12, K),
+    geral_metas (S, 12, K, 12), geral_bloqueado (S, 12, K) e as escalas usadas.
+    """
+    vol = np.asarray(volumes, dtype=float)
+    coef = np.asarray(coeficientes, dtype=float)
+    vol = np.where(np.isnan(vol), 0.0, vol)
+    coef_mes = np.where(np.isnan(coef[..., :N_MESES]), 0.0, coef[..., :N_MESES])
+    fy = coef[..., N_MESES]
+    fator = fatores_kpi(mascara_spoilage)
+    escalas = np.atleast_1d(np.asarray(escalas_volume, dtype=float))
+
+    # mask_fut[c, m]: o mês m é futuro quando o corte é c
+    meses = np.arange(N_MESES)
+    mask_fut = meses[None, :] > meses[:, None]
+    # Eixos: (S, C, F, [K,] 12)
+    escala_fut = np.where(mask_fut[None, :, None, :], escalas[:, None, None, None], 1.0)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        liquido = (coef_mes / fator[:, None]) * vol[:, None, :]
+        liquido_acum = np.cumsum(liquido, axis=-1)
+        volume_acum = np.cumsum(vol, axis=-1)
+
+        # Somas até cada corte: (C, F, K) e (C, F)
+        realizado_ytd = np.moveaxis(liquido_acum, -1, 0)
+        realizado_ytd = np.where(np.isfinite(realizado_ytd), realizado_ytd, 0.0)
+        volume_ytd = volume_acum.T
+        volume_fut_base = volume_acum[:, -1] - volume_ytd
+        total_estimado_base = liquido_acum[..., -1] - realizado_ytd
+
+        vol_cenario = vol * escala_fut
+        volume_ano = volume_ytd + escalas[:, None, None] * volume_fut_base
+        total_fy = (fy / fator) * volume_ano[..., None]
+        total_fy = np.where(np.isfinite(total_fy), total_fy, 0.0)
+        vol_fut_mes = np.where(mask_fut[None, :, None, :], vol_cenario, 0.0)
+        estimado = np.where(mask_fut[None, :, None, None, :], liquido[None, None] * escala_fut[..., None, :], 0.0)
+        total_estimado = escalas[:, None, None, None] * total_estimado_base
+
+    res = _ratear_saldo(
+        np.broadcast_to(realizado_ytd, total_fy.shape), total_fy, vol_cenario, vol_fut_mes,
+        estimado, total_estimado, mask_fut[:, None, None, :], fator,
+    )
+    geral = consolidar_geral(res, mascara_spoilage)
+    return {
+        'escalas_volume': escalas,
+        'coef_anual_necessario': res['coef_anual_necessario'],
+        'metas_futuras': res['metas_futuras'],
+        'bloqueado': res['bloqueado'],
+        **geral,
+    }
+
+
+def simular_reforecast(volumes, coeficientes, idx_mes_reforecast: int, mascara_spoilage, variacao: float = 0.1,
+                       n_simulacoes: int = 2000, percentis=(10, 50, 90), matriz_saida=None, semente=None,
+                       tamanho_lote: int = 500) -> dict:
+    """
+    Monte Carlo da incerteza do volume futuro: cada simulação multiplica o volume de cada mês futuro
+    de cada formato por um ruído uniforme em [1 - variacao, 1 + variacao] e refaz o reforecast.
+
+    As simulações são calculadas em lotes de `tamanho_lote` (um único cálculo vetorizado por lote).
+    matriz_saida (K_saída, K), opcional, converte os KPIs de cálculo nos KPIs exibidos (ex.: fator de gás,
+    soma das energias) antes dos percentis, já que o percentil de uma soma não é a soma dos percentis.
+
+    Retorna percentis, coef_anual_necessario (P, F, K_saída), metas_futuras (P, F, K_saída, 12),
+    geral_coef_anual (P, K_saída), geral_metas (P, K_saída, 12), e as probabilidades de bloqueio
+    prob_bloqueio (F, K) e geral_prob_bloqueio (K,), nos KPIs de cálculo.
+    """
+    vol = np.asarray(volumes, dtype=float)
+    coef = np.asarray(coeficientes, dtype=float)
+    n_formatos = vol.shape[0]
+    mask_fut = np.arange(N_MESES) > idx_mes_reforecast
+    rng = np.random.default_rng(semente)
+    matriz = None if matriz_saida is None else np.asarray(matriz_saida, dtype=float)
+
+    coleta = {chave: [] for chave in ('coef_anual_necessario', 'metas_futuras', 'geral_coef_anual', 'geral_metas')}
+    bloqueios = np.zeros(coef.shape[:2])
+    bloqueios_geral = np.zeros(coef.shape[1])
+    for inicio in range(0, n_simulacoes, max(1, tamanho_lote)):
+        n = min(tamanho_lote, n_simulacoes - inicio)
+        ruido = 1.0 + variacao * rng.uniform(-1.0, 1.0, size=(n, n_formatos, N_MESES))
+        vol_lote = np.where(mask_fut, np.maximum(vol * ruido, 0.0), vol)
+        res = calcular_reforecast(vol_lote, coef, idx_mes_reforecast, mascara_spoilage)
+        bloqueios += res['bloqueado'].sum(axis=0)
+        bloqueios_geral += res['geral_bloqueado'].sum(axis=0)
+        for chave in coleta:
+            valores = res[chave]
+            if matriz is not None:
+                # KPIs ficam no penúltimo eixo nas metas (..., K, 12) e no último no coeficiente anual (..., K)
+                if chave in ('metas_futuras', 'geral_metas'):
+                    valores = np.einsum('ok,...km->...om', matriz, valores)
+                else:
+                    valores = valores @ matriz.T
+            coleta[chave].append(valores)
+
+    saida = {'percentis': tuple(percentis), 'n_simulacoes': n_simulacoes}
+    for chave, partes in coleta.items():
+        saida[chave] = np.percentile(np.concatenate(partes), percentis, axis=0)
+    saida['prob_bloqueio'] = bloqueios / n_simulacoes
+    saida['geral_prob_bloqueio'] = bloqueios_geral / n_simulacoes
+    return saida
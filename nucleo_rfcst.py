@@ -0,0 +1,331 @@
+import numpy as np
+
+from cache_rfcst import CACHE_FORMATOS, chave_calculo_formato
+from config_rfcst import REGISTRO_PLANTAS, aplicar_saida
+from motor_reforecast import (
+    CHAVES_PARCIAIS, MESES, calcular_formatos, calcular_varredura, consolidar_geral, sensibilidade_reforecast,
+    simular_reforecast,
+)
+
+# --- Núcleo do cálculo, sem Streamlit ---
+# Usado pela interface, pelo lote, pela API e pelo benchmark. Importar este módulo carrega só o
+# NumPy (orçamento em bench_rfcst.ORCAMENTO_IMPORTACAO_MS); o pandas é importado dentro das funções
+# que montam tabelas, de modo que workers e scripts curtos não pagam pelo que não usam.
+
+PLANTAS_CONFIG = REGISTRO_PLANTAS
+
+
+def montar_blocos_formatos(nomes_formatos: list, volumes: dict, aops: dict, kpis: list):
+    """Empilha os DataFrames de cada formato nos blocos NumPy usados pelo motor de cálculo."""
+    vol_bloco = np.stack([
+        volumes[f].loc['Volume Total'].astype(float).reindex(MESES).to_numpy() for f in nomes_formatos
+    ])
+    coef_bloco = np.stack([
+        aops[f].reindex(index=kpis, columns=MESES + ['FY']).astype(float).to_numpy() for f in nomes_formatos
+    ])
+    return vol_bloco, coef_bloco
+
+
+def fator_gas_planta(planta: str):
+    """Retorna (tipo de gás, fator de conversão) da planta, ou (None, 1.0) se ela não tiver KPI de gás."""
+    return PLANTAS_CONFIG[planta]['tipo_gas'], PLANTAS_CONFIG[planta]['fator_gas']
+
+
+def preparar_saida_anual(coef_anual, cfg_planta: dict):
+    """Linha "Necessário (FY)" no formato exibido: gás convertido, renomeado e energia agregada."""
+    import pandas as pd
+    valores = aplicar_saida(cfg_planta, np.asarray(coef_anual, dtype=float))
+    return pd.DataFrame([valores], index=["Necessário (FY)"], columns=cfg_planta['kpis_saida'])
+
+
+def preparar_saida_metas(metas, cfg_planta: dict, colunas_futuro: list):
+    """Metas mensais futuras no formato exibido: gás convertido, renomeado e energia agregada."""
+    import pandas as pd
+    valores = aplicar_saida(cfg_planta, np.asarray(metas, dtype=float))[:, len(MESES) - len(colunas_futuro):]
+    return pd.DataFrame(valores, index=cfg_planta['kpis_saida'], columns=colunas_futuro)
+
+
+def mascara_aop_show(coef_anual, dados_formato: dict, kpis_da_planta: list, colunas_futuro: list) -> np.ndarray:
+    """KPIs (bool) em que o calculado supera o FY do AOP e há valores futuros de 'AOP ou Ciclo Anterior' para exibir."""
+    coef = np.asarray(coef_anual, dtype=float)
+    fy = dados_formato['aop']['FY'].reindex(kpis_da_planta).to_numpy(dtype=float)
+    futuro = dados_formato['aop_show'].reindex(index=kpis_da_planta, columns=colunas_futuro).to_numpy(dtype=float)
+    return (fy > 0) & (coef > fy) & (np.nansum(futuro, axis=1) > 0)
+
+
+def _aplicar_aop_show(coef_anual, metas_futuras, dados_formato: dict, kpis_da_planta: list, colunas_futuro: list):
+    """
+    Performance melhor que o AOP: exibe os valores de 'AOP ou Ciclo Anterior'.
+    Retorna (metas_a_exibir, avisos, máscara dos KPIs substituídos).
+    """
+    mascara = mascara_aop_show(coef_anual, dados_formato, kpis_da_planta, colunas_futuro)
+    metas_a_exibir = metas_futuras.copy()
+    if mascara.any():
+        substituidos = [kpi for kpi, m in zip(kpis_da_planta, mascara) if m]
+        metas_a_exibir.loc[substituidos, colunas_futuro] = dados_formato['aop_show'].loc[substituidos, colunas_futuro].to_numpy()
+    avisos_performance = [
+        f"💡 KPI **{kpi}** teve performance melhor que o AOP. Exibindo valores de 'AOP ou Ciclo Anterior'."
+        for kpi, m in zip(kpis_da_planta, mascara) if m
+    ]
+    return metas_a_exibir, avisos_performance, mascara
+
+
+def _pos_processar_formato(res_formato: dict, dados_formato: dict, cfg_planta: dict, colunas_futuro: list) -> dict:
+    """Transforma a saída do motor para um formato nas tabelas exibidas, guardando também as parciais do Geral."""
+    import pandas as pd
+    kpis_da_planta = cfg_planta['kpis']
+    bloqueados = {kpi for kpi, b in zip(kpis_da_planta, res_formato['bloqueado']) if b}
+    coef_anual = pd.Series(res_formato['coef_anual_necessario'], index=kpis_da_planta)
+    metas_futuras = pd.DataFrame(res_formato['metas_futuras'], index=kpis_da_planta, columns=MESES)
+    metas_a_exibir, avisos_performance, aop_show_aplicado = _aplicar_aop_show(
+        coef_anual, metas_futuras, dados_formato, kpis_da_planta, colunas_futuro
+    )
+
+    return {
+        'bloqueado_por_kpi': bloqueados,
+        'coef_anual_necessario': coef_anual,
+        'metas_futuras': metas_futuras,
+        'metas_exibidas': metas_a_exibir,
+        'aop_show_aplicado': aop_show_aplicado,
+        'avisos': avisos_performance,
+        'anual': preparar_saida_anual(coef_anual, cfg_planta),
+        'metas': preparar_saida_metas(metas_a_exibir, cfg_planta, colunas_futuro),
+        'parciais': {chave: res_formato[chave] for chave in CHAVES_PARCIAIS},
+    }
+
+
+def calcular_planta(planta: str, nomes_formatos: list, dados_formatos: dict, mes_reforecast: str) -> dict:
+    """
+    Executa o reforecast completo de uma planta, sem dependência da interface.
+
+    dados_formatos: {formato: {'volume': df, 'aop': df, 'aop_show': df}}, como em dados_formatos_planta(plant_state).
+    Retorna os avisos e as tabelas finais (já com gás, renomeação e energia aplicados)
+    de cada formato e do Geral.
+    """
+    import pandas as pd
+    cfg_planta = PLANTAS_CONFIG[planta]
+    kpis_da_planta = cfg_planta['kpis']
+    fator_gas = cfg_planta['fator_gas']
+    idx_mes_reforecast = MESES.index(mes_reforecast)
+    colunas_futuro = MESES[idx_mes_reforecast + 1:]
+    mascara_spoilage = cfg_planta['mascara_spoilage']
+
+    # Cada formato é calculado (e guardado no cache) de forma independente: ao editar um
+    # formato só ele é recalculado, e o Geral é apenas a soma das parciais de todos.
+    chaves = {
+        f: chave_calculo_formato(PLANTAS_CONFIG[planta]['tipo'], mes_reforecast, fator_gas, dados_formatos[f])
+        for f in nomes_formatos
+    }
+    resultados_por_formato = {f: CACHE_FORMATOS.get(chaves[f]) for f in nomes_formatos}
+    pendentes = [f for f in nomes_formatos if resultados_por_formato[f] is None]
+    if pendentes:
+        volumes = {f: dados_formatos[f]['volume'] for f in pendentes}
+        aops = {f: dados_formatos[f]['aop'] for f in pendentes}
+        vol_bloco, coef_bloco = montar_blocos_formatos(pendentes, volumes, aops, kpis_da_planta)
+        res = calcular_formatos(vol_bloco, coef_bloco, idx_mes_reforecast, mascara_spoilage)
+        for f, formato in enumerate(pendentes):
+            resultado_formato = _pos_processar_formato(
+                {chave: valores[f] for chave, valores in res.items()},
+                dados_formatos[formato], cfg_planta, colunas_futuro,
+            )
+            CACHE_FORMATOS.set(chaves[formato], resultado_formato)
+            resultados_por_formato[formato] = resultado_formato
+
+    avisos_bloqueio = [
+        f"🔔 O KPI **{kpi}** do formato **{formato}** ultrapassou seu limite de saldo líquido."
+        for formato in nomes_formatos
+        for kpi in kpis_da_planta if kpi in resultados_por_formato[formato]['bloqueado_por_kpi']
+    ]
+
+    parciais = {
+        chave: np.stack([resultados_por_formato[f]['parciais'][chave] for f in nomes_formatos])
+        for chave in CHAVES_PARCIAIS
+    }
+    res_geral = consolidar_geral(parciais, mascara_spoilage)
+    kpis_bloqueados_no_geral = {kpi for kpi, b in zip(kpis_da_planta, res_geral['geral_bloqueado']) if b}
+    if len(nomes_formatos) == 1:
+        # Com um único formato, o Geral é o espelho dele
+        geral = dict(resultados_por_formato[nomes_formatos[0]])
+    else:
+        geral_coef_anual = pd.Series(res_geral['geral_coef_anual'], index=kpis_da_planta)
+        geral_metas = pd.DataFrame(res_geral['geral_metas'], index=kpis_da_planta, columns=MESES)
+        geral = {
+            'coef_anual_necessario': geral_coef_anual,
+            'metas_futuras': geral_metas,
+            'avisos': [],
+            'anual': preparar_saida_anual(geral_coef_anual, cfg_planta),
+            'metas': preparar_saida_metas(geral_metas, cfg_planta, colunas_futuro),
+        }
+
+    return {
+        'avisos_bloqueio': avisos_bloqueio,
+        'kpis_bloqueados_no_geral': kpis_bloqueados_no_geral,
+        'formatos': resultados_por_formato,
+        'geral': geral,
+    }
+
+
+def calcular_varredura_planta(planta: str, nomes_formatos: list, dados_formatos: dict, escalas_volume=(1.0,)) -> dict:
+    """
+    Reforecast da planta para todos os meses de corte e escalas do volume futuro, em um único cálculo.
+    Guarda só o cubo do motor; as tabelas de cada cenário são montadas na consulta (tabelas_cenario).
+    """
+    kpis_da_planta = PLANTAS_CONFIG[planta]['kpis']
+    mascara_spoilage = PLANTAS_CONFIG[planta]['mascara_spoilage']
+    volumes = {f: dados_formatos[f]['volume'] for f in nomes_formatos}
+    aops = {f: dados_formatos[f]['aop'] for f in nomes_formatos}
+    vol_bloco, coef_bloco = montar_blocos_formatos(nomes_formatos, volumes, aops, kpis_da_planta)
+    cubo = calcular_varredura(vol_bloco, coef_bloco, mascara_spoilage, escalas_volume)
+    cubo['nomes_formatos'] = list(nomes_formatos)
+    return cubo
+
+
+def tabelas_cenario(planta: str, cubo: dict, dados_formatos: dict, idx_escala: int, mes_corte: str, formato: str) -> dict:
+    """Tabelas exibidas ('anual', 'metas', 'avisos') de um cenário do cubo, para um formato ou para o 'Geral'."""
+    import pandas as pd
+    cfg_planta = PLANTAS_CONFIG[planta]
+    kpis_da_planta = cfg_planta['kpis']
+    idx_corte = MESES.index(mes_corte)
+    colunas_futuro = MESES[idx_corte + 1:]
+    nomes_formatos = cubo['nomes_formatos']
+    if formato == 'Geral' and len(nomes_formatos) == 1:
+        formato = nomes_formatos[0]
+
+    if formato == 'Geral':
+        coef_anual = pd.Series(cubo['geral_coef_anual'][idx_escala, idx_corte], index=kpis_da_planta)
+        metas = pd.DataFrame(cubo['geral_metas'][idx_escala, idx_corte], index=kpis_da_planta, columns=MESES)
+        avisos = []
+    else:
+        f = nomes_formatos.index(formato)
+        coef_anual = pd.Series(cubo['coef_anual_necessario'][idx_escala, idx_corte, f], index=kpis_da_planta)
+        metas = pd.DataFrame(cubo['metas_futuras'][idx_escala, idx_corte, f], index=kpis_da_planta, columns=MESES)
+        metas, avisos, _ = _aplicar_aop_show(coef_anual, metas, dados_formatos[formato], kpis_da_planta, colunas_futuro)
+    return {
+        'avisos': avisos,
+        'anual': preparar_saida_anual(coef_anual, cfg_planta),
+        'metas': preparar_saida_metas(metas, cfg_planta, colunas_futuro),
+    }
+
+
+def sensibilidade_planta(planta: str, nomes_formatos: list, dados_formatos: dict, mes_reforecast: str) -> dict:
+    """
+    Derivadas analíticas (sensibilidade_reforecast) de todas as saídas da planta, em um único cálculo.
+    Guarda também as entradas; as tabelas de cada saída são montadas na consulta (tabela_alavancas).
+    Nos KPIs em que o formato exibe 'AOP ou Ciclo Anterior' (mascara_aop_show), as metas mensais exibidas
+    são valores fixos: as derivadas delas são zeradas ('aop_show_aplicado' (F, K) marca esses KPIs).
+    """
+    kpis_da_planta = PLANTAS_CONFIG[planta]['kpis']
+    colunas_futuro = MESES[MESES.index(mes_reforecast) + 1:]
+    volumes = {f: dados_formatos[f]['volume'] for f in nomes_formatos}
+    aops = {f: dados_formatos[f]['aop'] for f in nomes_formatos}
+    vol_bloco, coef_bloco = montar_blocos_formatos(nomes_formatos, volumes, aops, kpis_da_planta)
+    sens = sensibilidade_reforecast(vol_bloco, coef_bloco, MESES.index(mes_reforecast),
+                                    PLANTAS_CONFIG[planta]['mascara_spoilage'])
+    aop_show_aplicado = np.stack([
+        mascara_aop_show(sens['resultado']['coef_anual_necessario'][f], dados_formatos[nome], kpis_da_planta, colunas_futuro)
+        for f, nome in enumerate(nomes_formatos)
+    ])
+    sens['metas_dV'] = np.where(aop_show_aplicado[:, :, None, None], 0.0, sens['metas_dV'])
+    sens['metas_dc'] = np.where(aop_show_aplicado[:, :, None, None], 0.0, sens['metas_dc'])
+    sens.update({'nomes_formatos': list(nomes_formatos), 'mes_reforecast': mes_reforecast,
+                 'volumes': vol_bloco, 'coeficientes': coef_bloco, 'aop_show_aplicado': aop_show_aplicado})
+    return sens
+
+
+def tabela_alavancas(planta: str, sens: dict, formato: str, saida: str, n_alavancas: int = 5):
+    """
+    Maiores alavancas de cada KPI para uma saída ("Necessário (FY)" ou a meta de um mês futuro) do 'Geral'
+    ou de um formato: as entradas (volume do mês ou coeficiente realizado YTD de um formato) cujo aumento
+    de 1% mais muda a saída, com a derivada e esse impacto (gás na unidade exibida).
+    """
+    import pandas as pd
+    cfg_planta = PLANTAS_CONFIG[planta]
+    nomes_formatos = sens['nomes_formatos']
+    n_formatos, n_kpis = sens['coeficientes'].shape[:2]
+    if formato == 'Geral' and n_formatos == 1:
+        formato = nomes_formatos[0]
+
+    # Derivadas da saída (K, F de entrada, 12 meses de entrada)
+    j = None if saida == "Necessário (FY)" else MESES.index(saida)
+    if formato == 'Geral':
+        chave = 'geral_coef_anual' if j is None else 'geral_metas'
+        d_volume, d_coef = (sens[f'{chave}_{e}'] if j is None else sens[f'{chave}_{e}'][:, j] for e in ('dV', 'dc'))
+    else:
+        f = nomes_formatos.index(formato)
+        chave = 'coef_anual' if j is None else 'metas'
+        d_volume, d_coef = np.zeros((2, n_kpis, n_formatos, len(MESES)))
+        d_volume[:, f] = sens[f'{chave}_dV'][f] if j is None else sens[f'{chave}_dV'][f, :, j]
+        d_coef[:, f] = sens[f'{chave}_dc'][f] if j is None else sens[f'{chave}_dc'][f, :, j]
+
+    escala = np.ones(n_kpis)
+    if cfg_planta['idx_gas'] is not None:
+        escala[cfg_planta['idx_gas']] = cfg_planta['fator_gas']
+    entradas = np.stack([sens['volumes'][None].repeat(n_kpis, axis=0),
+                         np.nan_to_num(sens['coeficientes'][..., :len(MESES)]).transpose(1, 0, 2)], axis=1)
+    derivadas = np.stack([d_volume, d_coef], axis=1) * escala[:, None, None, None]
+    impacto = (derivadas * entradas * 0.01).reshape(n_kpis, -1)
+
+    # Posições das n maiores |impacto| de cada KPI, de uma vez (as nulas ficam de fora)
+    ordem = np.argsort(-np.abs(impacto), axis=1, kind='stable')[:, :n_alavancas]
+    k, posicao = np.nonzero(np.take_along_axis(impacto, ordem, axis=1) != 0)
+    e, f, m = np.unravel_index(ordem[k, posicao], derivadas.shape[1:])
+    return pd.DataFrame({
+        'KPI': np.asarray(cfg_planta['nomes_exibicao'], dtype=object)[k],
+        'Posição': posicao + 1,
+        'Formato': np.asarray(nomes_formatos, dtype=object)[f],
+        'Mês': np.asarray(MESES, dtype=object)[m],
+        'Entrada': np.array(["Volume", "Coeficiente YTD"], dtype=object)[e],
+        'Derivada': derivadas.reshape(n_kpis, -1)[k, ordem[k, posicao]],
+        'Impacto de +1%': impacto[k, ordem[k, posicao]],
+    })
+
+
+def matriz_saida_planta(planta: str):
+    """
+    Matriz (KPIs exibidos x KPIs de cálculo) equivalente a preparar_saida_*: fator de gás no KPI
+    de gás (exibido como Thermal) e soma de Ponta + Fora Ponta em Variable Light. Retorna (kpis_exibidos, matriz).
+    """
+    return PLANTAS_CONFIG[planta]['kpis_saida'], PLANTAS_CONFIG[planta]['matriz_saida']
+
+
+def simular_planta(planta: str, nomes_formatos: list, dados_formatos: dict, mes_reforecast: str,
+                   variacao: float, n_simulacoes: int, semente=None) -> dict:
+    """
+    Monte Carlo do volume futuro da planta. Para o Geral e cada formato devolve as faixas P10/P50/P90
+    do "Necessário (FY)" e das metas futuras (nos KPIs exibidos) e a probabilidade de bloqueio de cada KPI.
+    As metas são as do motor, sem a substituição por 'AOP ou Ciclo Anterior'.
+    """
+    import pandas as pd
+    kpis_da_planta = PLANTAS_CONFIG[planta]['kpis']
+    idx_mes_reforecast = MESES.index(mes_reforecast)
+    colunas_futuro = MESES[idx_mes_reforecast + 1:]
+    mascara_spoilage = PLANTAS_CONFIG[planta]['mascara_spoilage']
+    kpis_exibidos, matriz_saida = matriz_saida_planta(planta)
+
+    volumes = {f: dados_formatos[f]['volume'] for f in nomes_formatos}
+    aops = {f: dados_formatos[f]['aop'] for f in nomes_formatos}
+    vol_bloco, coef_bloco = montar_blocos_formatos(nomes_formatos, volumes, aops, kpis_da_planta)
+    sim = simular_reforecast(vol_bloco, coef_bloco, idx_mes_reforecast, mascara_spoilage, variacao=variacao,
+                             n_simulacoes=n_simulacoes, matriz_saida=matriz_saida, semente=semente)
+    rotulos = [f"P{p}" for p in sim['percentis']]
+    nomes_bloqueio = PLANTAS_CONFIG[planta]['nomes_exibicao']
+
+    def _tabelas(coef_anual, metas, prob_bloqueio):
+        return {
+            'anual': pd.DataFrame(coef_anual, index=rotulos, columns=kpis_exibidos),
+            'metas': {
+                rotulo: pd.DataFrame(metas[p], index=kpis_exibidos, columns=MESES)[colunas_futuro]
+                for p, rotulo in enumerate(rotulos)
+            },
+            'prob_bloqueio': pd.Series(prob_bloqueio, index=nomes_bloqueio, name="Prob. de bloqueio"),
+        }
+
+    formatos = {
+        formato: _tabelas(sim['coef_anual_necessario'][:, f], sim['metas_futuras'][:, f], sim['prob_bloqueio'][f])
+        for f, formato in enumerate(nomes_formatos)
+    }
+    if len(nomes_formatos) == 1:
+        geral = formatos[nomes_formatos[0]]
+    else:
+        geral = _tabelas(sim['geral_coef_anual'], sim['geral_metas'], sim['geral_prob_bloqueio'])
+    return {'n_simulacoes': n_simulacoes, 'variacao': variacao, 'formatos': formatos, 'geral': geral}
@@ -6,7 +6,8 @@ import sys
 required_packages = [
     "streamlit",
     "pandas",
-    "numpy"
+    "numpy",
+    "openpyxl"
 ]
 
 def is_installed(package):
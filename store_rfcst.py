@@ -0,0 +1,167 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from estado_rfcst import TABELAS_FORMATO, garantir_formatos, gravar_tabela, layout_tabela, novo_estado_planta
+
+# --- Persistência do plant_store em disco (SQLite) ---
+# Cada planta é carregada só quando é selecionada e, a cada alteração, apenas as células que
+# mudaram são gravadas. Assim os dados digitados sobrevivem a um refresh do navegador ou a um
+# reinício do servidor e ficam disponíveis para as outras sessões.
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS plantas (
+    planta TEXT PRIMARY KEY,
+    num_formatos INTEGER NOT NULL,
+    nomes_formatos TEXT NOT NULL,
+    mes_reforecast TEXT
+);
+CREATE TABLE IF NOT EXISTS celulas (
+    planta TEXT NOT NULL,
+    formato INTEGER NOT NULL,
+    tabela TEXT NOT NULL,
+    linha TEXT NOT NULL,
+    coluna TEXT NOT NULL,
+    valor REAL,
+    PRIMARY KEY (planta, formato, tabela, linha, coluna)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fechamentos (
+    planta TEXT NOT NULL,
+    mes_fechado TEXT NOT NULL,
+    gravado_em TEXT NOT NULL,
+    formato TEXT NOT NULL,
+    kpi TEXT NOT NULL,
+    campo TEXT NOT NULL,
+    antes REAL,
+    depois REAL
+);
+CREATE INDEX IF NOT EXISTS fechamentos_planta ON fechamentos (planta, gravado_em);
+"""
+
+
+class StorePlantas:
+    """plant_store persistido em SQLite, com gravação incremental por célula."""
+
+    def __init__(self, caminho):
+        self.caminho = Path(caminho)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(str(self.caminho), check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.executescript(_ESQUEMA)
+        # Última versão gravada de cada planta, base para descobrir o que mudou
+        self._gravado = {}
+        self._cabecalhos = {}
+
+    def carregar(self, planta: str, kpis: list):
+        """Lê o estado de uma planta (no formato do plant_store) ou None se ela nunca foi salva."""
+        with self._lock:
+            cabecalho = self._conexao.execute(
+                "SELECT num_formatos, nomes_formatos, mes_reforecast FROM plantas WHERE planta = ?", (planta,)
+            ).fetchone()
+            if cabecalho is None:
+                return None
+            linhas = self._conexao.execute(
+                "SELECT formato, tabela, linha, coluna, valor FROM celulas WHERE planta = ?", (planta,)
+            ).fetchall()
+
+        num_formatos, nomes_formatos, mes_reforecast = cabecalho
+        plant_state = novo_estado_planta(kpis, num_formatos)
+        plant_state['nomes_formatos'] = json.loads(nomes_formatos)
+        if mes_reforecast:
+            plant_state['mes_reforecast'] = mes_reforecast
+        if linhas:
+            celulas = pd.DataFrame(linhas, columns=['formato', 'tabela', 'linha', 'coluna', 'valor'])
+            garantir_formatos(plant_state, int(celulas['formato'].max()) + 1)
+            for (formato, tabela), grupo in celulas.groupby(['formato', 'tabela'], sort=False):
+                if tabela in TABELAS_FORMATO:
+                    gravar_tabela(plant_state, int(formato), tabela,
+                                  grupo.pivot(index='linha', columns='coluna', values='valor'))
+        with self._lock:
+            self._gravado[planta] = self._copiar_blocos(plant_state)
+            self._cabecalhos[planta] = (planta,) + tuple(cabecalho)
+        return plant_state
+
+    def salvar(self, planta: str, plant_state: dict) -> int:
+        """Grava o cabeçalho da planta e só as células alteradas desde a última gravação. Retorna quantas foram gravadas."""
+        with self._lock:
+            gravado = self._gravado.get(planta, {})
+        alteradas = []
+        for tabela in TABELAS_FORMATO:
+            indice, colunas = layout_tabela(tabela, plant_state['kpis'])
+            # volume (F, 12) vira (F, 1, 12): todas as tabelas como (formato, linha, coluna)
+            valores = plant_state[tabela].reshape(-1, len(indice), len(colunas))
+            mudou = np.ones(valores.shape, dtype=bool)
+            anterior = gravado.get(tabela)
+            if anterior is not None and anterior.shape[1:] == valores.shape[1:]:
+                n = min(len(anterior), len(valores))
+                mudou[:n] = valores[:n] != anterior[:n]
+            for formato, i, j in zip(*np.nonzero(mudou)):
+                alteradas.append((planta, int(formato), tabela, str(indice[i]), str(colunas[j]),
+                                  float(valores[formato, i, j])))
+
+        cabecalho = (planta, int(plant_state['num_formatos']), json.dumps(list(plant_state['nomes_formatos'])),
+                     plant_state.get('mes_reforecast'))
+        if not alteradas and self._cabecalhos.get(planta) == cabecalho:
+            return 0
+        with self._lock, self._conexao:
+            self._conexao.execute(
+                "INSERT INTO plantas (planta, num_formatos, nomes_formatos, mes_reforecast) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(planta) DO UPDATE SET num_formatos = excluded.num_formatos, "
+                "nomes_formatos = excluded.nomes_formatos, mes_reforecast = excluded.mes_reforecast",
+                cabecalho,
+            )
+            if alteradas:
+                self._conexao.executemany(
+                    "INSERT OR REPLACE INTO celulas (planta, formato, tabela, linha, coluna, valor) VALUES (?, ?, ?, ?, ?, ?)",
+                    alteradas,
+                )
+            self._cabecalhos[planta] = cabecalho
+            if alteradas:
+                self._gravado[planta] = self._copiar_blocos(plant_state)
+        return len(alteradas)
+
+    def apagar(self, planta: str):
+        with self._lock, self._conexao:
+            self._conexao.execute("DELETE FROM celulas WHERE planta = ?", (planta,))
+            self._conexao.execute("DELETE FROM plantas WHERE planta = ?", (planta,))
+            self._gravado.pop(planta, None)
+            self._cabecalhos.pop(planta, None)
+
+    def registrar_fechamento(self, planta: str, mes_fechado: str, gravado_em: str, auditoria: list):
+        """Trilha de auditoria de um fechamento do mês (linhas de fechamento_rfcst.fechar_mes). Nunca é apagada."""
+        with self._lock, self._conexao:
+            self._conexao.executemany(
+                "INSERT INTO fechamentos (planta, mes_fechado, gravado_em, formato, kpi, campo, antes, depois) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(planta, mes_fechado, gravado_em, r['formato'], r['kpi'], r['campo'], r['antes'], r['depois'])
+                 for r in auditoria],
+            )
+
+    def fechamentos(self, planta: str) -> list:
+        """Trilha de auditoria dos fechamentos da planta, do mais recente para o mais antigo."""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT mes_fechado, gravado_em, formato, kpi, campo, antes, depois FROM fechamentos "
+                "WHERE planta = ? ORDER BY gravado_em DESC, rowid", (planta,)
+            ).fetchall()
+        colunas = ('mes_fechado', 'gravado_em', 'formato', 'kpi', 'campo', 'antes', 'depois')
+        return [dict(zip(colunas, linha)) for linha in linhas]
+
+    @staticmethod
+    def _copiar_blocos(plant_state: dict) -> dict:
+        return {tabela: plant_state[tabela].reshape(plant_state[tabela].shape[0], -1, plant_state[tabela].shape[-1]).copy()
+                for tabela in TABELAS_FORMATO}
+
+
+def _abrir_store_padrao():
+    """Store do servidor; RFCST_STORE_PATH vazio desliga a persistência."""
+    caminho = os.environ.get('RFCST_STORE_PATH', str(Path(__file__).parent / "rfcst_store.sqlite"))
+    return StorePlantas(caminho) if caminho else None
+
+
+STORE_PLANTAS = _abrir_store_padrao()
@@ -0,0 +1,96 @@
+import numpy as np
+
+from config_rfcst import REGISTRO_PLANTAS
+from motor_reforecast import MESES, N_MESES
+
+# --- Validação das entradas antes do cálculo ---
+# Todas as regras são avaliadas de uma vez sobre os blocos empilhados (formatos x KPIs x meses) de
+# uma planta, cada uma como uma máscara booleana; as células marcadas viram linhas de uma tabela de
+# erros (planta, formato, tabela, KPI, mês, regra, valor). Com erro, a planta não é calculada: dado
+# ruim é recusado na entrada em vez de virar zero silencioso no resultado. Os vazios (NaN) precisam
+# chegar até aqui; por isso a validação recebe as tabelas antes de os vazios virarem 0.
+
+REGRAS = {
+    'valor_nao_numerico': "Célula não numérica",
+    'volume_negativo': "Volume de produção negativo",
+    'fy_ausente': "FY não informado (preencha com 0 quando não houver meta)",
+    'fy_zero_com_realizado': "FY = 0 com realizado YTD diferente de zero",
+    'spoilage_fora_da_faixa': "Spoilage fora da faixa de 0 a 100%",
+    'volume_futuro_zero': "Volume futuro zerado (não há meses para distribuir o saldo)",
+}
+COLUNAS_ERROS = ['planta', 'formato', 'tabela', 'kpi', 'mes', 'regra', 'valor']
+COLUNAS_AOP = MESES + ['FY']
+
+
+def blocos_validacao(nomes_formatos: list, dados_formatos: dict, kpis: list):
+    """(volume (F, 12), aop (F, K, 13), aop_show (F, K, 13)) com os vazios preservados; KPIs ausentes valem 0."""
+    def _bloco(tabela, linhas, colunas):
+        return np.stack([
+            dados_formatos[f][tabela].reindex(index=linhas, columns=colunas, fill_value=0.0).to_numpy(dtype=float)
+            for f in nomes_formatos
+        ])
+    return (_bloco('volume', ["Volume Total"], MESES)[:, 0], _bloco('aop', kpis, COLUNAS_AOP),
+            _bloco('aop_show', kpis, COLUNAS_AOP))
+
+
+def validar_blocos(planta: str, nomes_formatos: list, volume, aop, aop_show, mes_reforecast: str,
+                   celulas_invalidas=()) -> list:
+    """
+    Aplica as REGRAS aos blocos de uma planta. celulas_invalidas: (formato, tabela, kpi, coluna, valor)
+    dos textos que a conversão de decimais não entendeu. Retorna as linhas da tabela de erros (tuplas
+    na ordem de COLUNAS_ERROS).
+    """
+    cfg_planta = REGISTRO_PLANTAS[planta]
+    kpis = np.asarray(cfg_planta['kpis'], dtype=object)
+    formatos = np.asarray(nomes_formatos, dtype=object)
+    rotulos_aop = np.asarray(COLUNAS_AOP, dtype=object)
+    idx_mes = MESES.index(mes_reforecast)
+    volume = np.asarray(volume, dtype=float)
+    aop = np.asarray(aop, dtype=float)
+    aop_show = np.asarray(aop_show, dtype=float)
+    fy = aop[:, :, N_MESES]
+    linhas = [(planta, formato, tabela, kpi, coluna, 'valor_nao_numerico', valor)
+              for formato, tabela, kpi, coluna, valor in celulas_invalidas]
+
+    def _linhas(mascara, regra, tabela, valores, rotulo_kpi, rotulo_mes):
+        # mascara e valores: (F, K, M); os rótulos de formato, KPI e mês saem de uma indexação por eixo
+        f, k, m = np.nonzero(mascara)
+        linhas.extend(zip([planta] * len(f), formatos[f], [tabela] * len(f), rotulo_kpi[k], rotulo_mes[m],
+                          [regra] * len(f), valores[f, k, m].tolist()))
+
+    with np.errstate(invalid='ignore'):
+        _linhas((volume < 0)[:, None, :], 'volume_negativo', 'volume', volume[:, None, :],
+                np.array(["Volume Total"], dtype=object), np.asarray(MESES, dtype=object))
+        _linhas(np.isnan(fy)[:, :, None], 'fy_ausente', 'aop_show', fy[:, :, None], kpis, np.array(['FY'], dtype=object))
+        realizado = np.nansum(np.abs(aop[:, :, :idx_mes + 1]) * (volume[:, None, :idx_mes + 1] != 0), axis=-1)
+        _linhas(((fy == 0) & (realizado > 0))[:, :, None], 'fy_zero_com_realizado', 'aop_show', fy[:, :, None],
+                kpis, np.array(['FY'], dtype=object))
+        spoilage = cfg_planta['mascara_spoilage'][None, :, None]
+        for tabela, bloco in (('aop', aop), ('aop_show', aop_show)):
+            _linhas(spoilage & ((bloco < 0) | (bloco > 100)), 'spoilage_fora_da_faixa', tabela, bloco, kpis, rotulos_aop)
+        if idx_mes + 1 < N_MESES:
+            futuro = np.nansum(volume[:, idx_mes + 1:], axis=-1)
+            _linhas((futuro == 0)[:, None, None], 'volume_futuro_zero', 'volume', futuro[:, None, None],
+                    np.array(["Volume Total"], dtype=object),
+                    np.array([f"{MESES[idx_mes + 1]}..{MESES[-1]}"], dtype=object))
+    return linhas
+
+
+def validar_planta(planta: str, nomes_formatos: list, dados_formatos: dict, mes_reforecast: str,
+                   celulas_invalidas=()) -> list:
+    """validar_blocos a partir das tabelas de cada formato (como em calcular_planta, mas com os vazios)."""
+    volume, aop, aop_show = blocos_validacao(nomes_formatos, dados_formatos, REGISTRO_PLANTAS[planta]['kpis'])
+    return validar_blocos(planta, nomes_formatos, volume, aop, aop_show, mes_reforecast, celulas_invalidas)
+
+
+def preencher_vazios(dados_formatos: dict) -> dict:
+    """Depois de validadas, as tabelas seguem para o cálculo com os vazios como 0 (assim como na interface)."""
+    return {formato: {tabela: df.fillna(0.0) for tabela, df in dados.items()} for formato, dados in dados_formatos.items()}
+
+
+def tabela_erros(linhas: list):
+    """Tabela de erros (DataFrame com COLUNAS_ERROS e a descrição da regra)."""
+    import pandas as pd
+    tabela = pd.DataFrame(linhas, columns=COLUNAS_ERROS)
+    tabela['descricao'] = tabela['regra'].map(REGRAS)
+    return tabela